@@ -12,12 +12,16 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.fraud_detection_system import IntelligentFraudDetectionSystem
+from src.logging_utils import configure_logging, shutdown_logging
 
 
 def main():
     """
     主函数 - 演示RPA+LLM智能风控系统
     """
+    # 处理流程日志由后台线程写出，生产环境可使用quiet=True关闭流程日志
+    configure_logging(level="INFO")
+    
     print("="*60)
     print("RPA + LLM 智能风控系统演示")
     print("实现从'被动防御'到'主动预测'的跃迁")
@@ -132,6 +136,10 @@ def main():
     print("- 自动执行后续流程")
     print("- 反馈结果持续优化模型")
     print("="*60)
+    
+    # 发送剩余的通知摘要和反馈事件，停止后台线程
+    fraud_system.close()
+    shutdown_logging()
 
 
 if __name__ == "__main__":
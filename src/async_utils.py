@@ -0,0 +1,50 @@
+"""
+异步工具模块
+为同步API提供运行异步实现的薄封装
+"""
+
+import asyncio
+import os
+import threading
+
+_thread_state = threading.local()
+# fork出的子进程从父进程继承的事件循环，只保留引用，不关闭也不回收
+_inherited_loops = []
+
+
+def run_sync(coro):
+    """
+    在当前线程中同步运行协程并返回结果
+    每个线程复用一个事件循环，避免每次调用都创建新循环
+    :param coro: 协程对象
+    :return: 协程返回值
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("当前线程已有运行中的事件循环，请直接 await 对应的异步方法")
+
+    loop = getattr(_thread_state, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _thread_state.loop = loop
+    return loop.run_until_complete(coro)
+
+
+def _forget_loop_in_child():
+    """
+    fork出的子进程继承了父进程当前线程的事件循环，其默认线程池的线程在子进程中不存在，改为按需新建
+    继承的事件循环与父进程共用同一个epoll实例，关闭（包括被垃圾回收时关闭）会注销父进程事件循环的唤醒管道，
+    导致父进程事件循环无法被其他线程唤醒，因此子进程中保留其引用而不关闭
+    """
+    loop = getattr(_thread_state, "loop", None)
+    if loop is not None:
+        _inherited_loops.append(loop)
+    _thread_state.loop = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_loop_in_child)
@@ -0,0 +1,207 @@
+"""
+批量评分模块
+以列式方式对大量历史申请重新评分和决策，结果与逐条调用
+LLMAnalyzer._calculate_overall_risk_score和RiskDecisionEngine.make_decision完全一致，
+决策使用与逐条决策相同的已编译决策阶梯
+"""
+
+import operator
+
+import numpy as np
+import pandas as pd
+
+from .rule_engine import DecisionLadder, DEFAULT_DECISION_RULES, matches
+
+# 评分所需的分析结果字段（列名 -> 分析结果中的路径）
+ANALYSIS_COLUMNS = {
+    "id_valid": ("id_analysis", "valid"),
+    "id_name_match": ("id_analysis", "name_match"),
+    "income_source_reliability": ("income_analysis", "source_reliability"),
+    "income_verification_status": ("income_analysis", "verification_status"),
+    "form_coverage_reasonable": ("form_analysis", "coverage_reasonable")
+}
+
+
+def results_to_frame(analysis_results, fraud_results=None, customer_data_list=None):
+    """
+    将逐条的分析结果、欺诈检测结果和客户数据转换为列式DataFrame
+    :param analysis_results: 分析结果列表
+    :param fraud_results: 欺诈检测结果列表，与分析结果一一对应
+    :param customer_data_list: 客户数据列表，用于读取degraded_sources和速率特征
+    :return: pandas.DataFrame
+    """
+    columns = {
+        name: [result[section][field] for result in analysis_results]
+        for name, (section, field) in ANALYSIS_COLUMNS.items()
+    }
+    columns["risk_score"] = _number_column([result["overall_risk_score"] for result in analysis_results])
+    if fraud_results is not None:
+        columns["is_fraud"] = [result["is_fraud"] for result in fraud_results]
+        columns["fraud_indicators"] = [result.get("indicators", []) for result in fraud_results]
+        columns["confidence"] = _number_column([result.get("confidence", 0) for result in fraud_results])
+    if customer_data_list is not None:
+        columns["degraded_sources"] = [(data or {}).get("degraded_sources") or [] for data in customer_data_list]
+        features = [((data or {}).get("velocity") or {}).get("features") or {} for data in customer_data_list]
+        for name in sorted(set().union(*features)):
+            columns[name] = _number_column([row.get(name) for row in features])
+    return pd.DataFrame(columns)
+
+
+def _number_column(values):
+    """
+    构造评分、置信度等数值列，整数与浮点数混合时保留原始对象，保证原因文本与逐条决策一致
+    :param values: 数值列表
+    :return: pandas.Series
+    """
+    column = pd.Series(values)
+    if column.dtype.kind == "f" and any(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        column = pd.Series(values, dtype=object)
+    return column
+
+
+def calculate_risk_scores(frame):
+    """
+    批量计算综合风险评分
+    :param frame: 包含ANALYSIS_COLUMNS各列的DataFrame或列名到数组的字典
+    :return: numpy整数数组
+    """
+    frame = pd.DataFrame(frame)
+    valid = frame["id_valid"].to_numpy(dtype=bool)
+    name_match = frame["id_name_match"].to_numpy(dtype=bool)
+    low_reliability = (frame["income_source_reliability"] == "低").to_numpy()
+    unverified = (frame["income_verification_status"] != "已验证").to_numpy()
+    coverage_reasonable = frame["form_coverage_reasonable"].to_numpy(dtype=bool)
+
+    base_score = (
+        30 * ~valid
+        + 20 * ~name_match
+        + 25 * low_reliability
+        + 15 * unverified
+        + 20 * ~coverage_reasonable
+    ).astype(np.int64)
+    return np.minimum(100, base_score)
+
+
+def make_decisions(frame, ladder):
+    """
+    批量做出风控决策
+    按决策阶梯的规则顺序在数组上逐条匹配；原因文本只取决于少量不同的(命中规则, 模板字段取值, 降级数据源)组合，
+    对每种组合格式化一次后按编码取回
+    :param frame: 包含is_fraud列以及risk_score列（或ANALYSIS_COLUMNS各列，此时先批量计算评分）的DataFrame，
+                  可选fraud_indicators、confidence、degraded_sources列及决策规则引用的速率特征列
+    :param ladder: 决策阶梯（rule_engine.DecisionLadder），传入风险阈值配置时使用默认决策规则
+    :return: 与decision_result字段一致的DataFrame
+    """
+    if not isinstance(ladder, DecisionLadder):
+        ladder = DecisionLadder(DEFAULT_DECISION_RULES, ladder)
+    frame = pd.DataFrame(frame)
+    if "risk_score" not in frame:
+        frame = frame.assign(risk_score=calculate_risk_scores(frame))
+    count = len(frame)
+    risk_score = frame["risk_score"]
+    is_fraud = frame["is_fraud"].to_numpy(dtype=bool)
+    indicators = frame["fraud_indicators"] if "fraud_indicators" in frame else pd.Series([[]] * count)
+    confidence = frame["confidence"] if "confidence" in frame else pd.Series(np.zeros(count))
+    degraded = frame["degraded_sources"] if "degraded_sources" in frame else pd.Series([[]] * count)
+
+    # 决策上下文的各字段，与RiskDecisionEngine.make_decision传给决策阶梯的上下文一致
+    context = {
+        "risk_score": risk_score.to_numpy(),
+        "is_fraud": is_fraud,
+        "indicators": _joined(indicators),
+        "confidence": confidence.to_numpy()
+    }
+    # 决策规则引用的其他字段（速率特征）取同名列，缺少该列时视为缺失值
+    for field, _, _, _, _ in ladder.steps:
+        if field not in context:
+            context[field] = frame[field].to_numpy() if field in frame else np.full(count, None, dtype=object)
+
+    # 每行取第一条命中的规则，都不命中时取默认决策（编号为规则数）
+    branch = np.full(count, len(ladder.steps), dtype=np.int64)
+    pending = np.ones(count, dtype=bool)
+    for index, (field, predicate, expected, _, _) in enumerate(ladder.steps):
+        hit = pending & _vector_match(predicate, context[field], expected)
+        branch[hit] = index
+        pending &= ~hit
+    outcomes = [(decision, reason) for _, _, _, decision, reason in ladder.steps] + [ladder.default]
+    decision = np.array([outcome for outcome, _ in outcomes], dtype=object)[branch]
+
+    # 数据源降级时信息不完整，不自动批准
+    degraded_text = _joined(degraded)
+    degraded_codes = pd.factorize(degraded_text)[0]
+    has_degraded = np.fromiter((len(text) > 0 for text in degraded_text.tolist()), dtype=bool, count=count)
+    downgrade = (decision == "APPROVE") & has_degraded
+    decision[downgrade] = "REVIEW"
+
+    # 按命中规则的原因模板实际引用的字段组合编码，相同组合的原因文本相同
+    template_fields = [DecisionLadder.template_fields(reason) & context.keys() for _, reason in outcomes]
+    key = branch
+    for field in sorted(set().union(*template_fields)):
+        codes = _factorize(context[field]) + 1
+        in_use = np.array([field in names for names in template_fields], dtype=bool)[branch]
+        key = pd.factorize(key * (codes.max(initial=0) + 1) + np.where(in_use, codes, 0))[0]
+    key = pd.factorize(key * (degraded_codes.max(initial=0) + 2) + np.where(downgrade, degraded_codes + 1, 0))[0]
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+
+    reasons = []
+    for row in first.tolist():
+        _, template = outcomes[branch[row]]
+        reason = template.format_map({**ladder.thresholds, **{field: values[row] for field, values in context.items()}})
+        if downgrade[row]:
+            reason = f"数据源降级({degraded_text[row]})，{reason}，需要人工复核"
+        reasons.append(reason)
+    reason = np.array(reasons, dtype=object)[inverse.reshape(-1)]
+
+    return pd.DataFrame({
+        "decision": decision,
+        "reason": reason,
+        "risk_score": risk_score.to_numpy(),
+        "fraud_detected": is_fraud,
+        "fraud_indicators": indicators.to_numpy(),
+        "confidence": confidence.to_numpy(),
+        "degraded_sources": degraded.to_numpy()
+    }, index=frame.index)
+
+
+# 可直接作用于数组的比较操作符
+_VECTOR_OPERATORS = {operator.gt, operator.ge, operator.lt, operator.le, operator.eq, operator.ne}
+
+
+def _vector_match(predicate, values, expected):
+    """
+    对一列取值执行规则判断，数值列上的比较直接在数组上完成，其余逐个判断
+    :param predicate: 规则判断函数
+    :param values: 取值数组
+    :param expected: 规则比较值
+    :return: 布尔数组
+    """
+    if predicate in _VECTOR_OPERATORS and values.dtype.kind in "biuf":
+        try:
+            return np.asarray(predicate(values, expected), dtype=bool)
+        except TypeError:
+            pass
+    return np.fromiter((matches(predicate, value, expected) for value in values.tolist()),
+                       dtype=bool, count=len(values))
+
+
+def _factorize(values):
+    """
+    对一列取值编码，对象列按(类型, 值)编码，30与30.0、None与NaN格式化结果不同，不能合并为同一编码
+    :param values: 取值数组
+    :return: 从0开始的编码数组
+    """
+    if values.dtype != object:
+        return pd.factorize(values)[0]
+    seen = {}
+    return np.fromiter((seen.setdefault((type(value), value), len(seen)) for value in values.tolist()),
+                       dtype=np.int64, count=len(values))
+
+
+def _joined(column):
+    """
+    将列表列拼接为以逗号分隔的文本，已是文本的值保持不变
+    :param column: pandas.Series
+    :return: 文本数组
+    """
+    return np.array([value if isinstance(value, str) else ", ".join(value) for value in column.tolist()],
+                    dtype=object)
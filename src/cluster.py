@@ -0,0 +1,335 @@
+"""
+分片工作进程集群模块
+按客户ID哈希把申请分配到N个常驻工作进程，每个进程持有一个风控系统实例并用线程池处理I/O等待，
+规则打分、建议生成和序列化等CPU工作分散到多个核心；
+黑名单、团伙关联和速率特征通过SQLite共享事件表在进程间同步，结果缓存共用SQLite磁盘层，
+系统指标由各进程的指标收集器合并得到
+"""
+
+import hashlib
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .fraud_detection_system import IntelligentFraudDetectionSystem, summarize_metrics
+from .feature_store import DEFAULT_VELOCITY_FEATURES
+from .metrics import MetricsCollector
+from .result_cache import ResultCache
+from .shared_state import SharedStateStore, SharedIdentityIndex, SharedFeatureStore, CHANNEL_VELOCITY
+from .logging_utils import get_logger, shutdown_logging
+
+logger = get_logger("cluster")
+
+SHARED_STATE_FILE = "shared_state.sqlite"
+RESULT_CACHE_FILE = "result_cache.sqlite"
+# 每个工作进程的默认处理线程数
+DEFAULT_THREADS_PER_WORKER = 4
+# 等待工作进程消息时检查进程存活的间隔（秒）
+_POLL_INTERVAL = 1.0
+# 由集群创建并在进程间共享的组件，不能通过system_kwargs传入
+_CLUSTER_OWNED = ("cache", "identity_index", "feature_store")
+# 各分片单独报告的组件统计
+_COMPONENT_METRICS = ("cache", "feedback", "identity_index", "velocity", "notifications", "ocr", "llm_client")
+# 各工作进程的模型客户端独立限流，按进程数平分的配额
+_SPLIT_QUOTAS = ("requests_per_minute", "tokens_per_minute")
+
+
+def shard_for(customer_id, num_shards):
+    """
+    计算客户所在的分片，与进程和Python哈希种子无关
+    :param customer_id: 客户ID
+    :param num_shards: 分片数
+    :return: 分片序号
+    """
+    digest = hashlib.blake2b(str(customer_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+def split_quotas(system_kwargs, num_workers):
+    """
+    按工作进程数平分模型客户端的每分钟请求数和token数配额，集群整体不超过模型服务的配额
+    :param system_kwargs: 风控系统构造参数
+    :param num_workers: 工作进程数
+    :return: 各工作进程使用的构造参数，未配置配额时原样返回
+    """
+    client = (system_kwargs.get("model_configs") or {}).get("client") or {}
+    quotas = {key: client[key] / num_workers for key in _SPLIT_QUOTAS if client.get(key)}
+    if not quotas:
+        return system_kwargs
+    model_configs = {**system_kwargs["model_configs"], "client": {**client, **quotas}}
+    return {**system_kwargs, "model_configs": model_configs}
+
+
+def _worker_main(shard, system_kwargs, state_dir, cache_config, identity_config, feature_config, threads,
+                 tasks, results):
+    """
+    工作进程主循环：构建系统实例，按任务队列处理申请，结果和指标写入结果队列
+    :param shard: 分片序号
+    :param system_kwargs: 风控系统构造参数
+    :param state_dir: 共享状态目录
+    :param cache_config: 结果缓存参数，为None时不缓存
+    :param identity_config: 共享身份标识索引参数
+    :param feature_config: 共享速率特征存储参数
+    :param threads: 处理线程数
+    :param tasks: 任务队列
+    :param results: 结果队列
+    """
+    try:
+        store = SharedStateStore(os.path.join(state_dir, SHARED_STATE_FILE))
+        cache = None
+        if cache_config is not None:
+            cache = ResultCache(**{"sqlite_path": os.path.join(state_dir, RESULT_CACHE_FILE), **cache_config})
+        system = IntelligentFraudDetectionSystem(
+            **system_kwargs, cache=cache,
+            identity_index=SharedIdentityIndex(store, **(identity_config or {})),
+            feature_store=SharedFeatureStore(store, **(feature_config or {}))
+        )
+    except Exception as exc:
+        results.put(("failed", shard, f"{type(exc).__name__}: {exc}"))
+        return
+
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"shard{shard}-worker")
+    # 处理线程全部繁忙时不再从任务队列取任务，任务在父进程侧排队
+    slots = threading.BoundedSemaphore(threads)
+
+    def _done(future, index, customer_id):
+        try:
+            record = future.result()
+        except Exception as exc:
+            record = system._error_record(customer_id, exc)
+        results.put(("record", shard, index, record))
+        slots.release()
+
+    while True:
+        message = tasks.get()
+        if message[0] == "process":
+            _, index, customer_id = message
+            slots.acquire()
+            future = pool.submit(system._process_isolated, customer_id)
+            future.add_done_callback(lambda future, index=index, customer_id=customer_id:
+                                     _done(future, index, customer_id))
+        elif message[0] == "metrics":
+            system_metrics = system.get_system_metrics()
+            components = {key: system_metrics[key] for key in _COMPONENT_METRICS if key in system_metrics}
+            components["total_processed"] = system_metrics["total_processed"]
+            results.put(("metrics", shard, system.metrics, components))
+        elif message[0] == "stop":
+            break
+
+    pool.shutdown(wait=True)
+    system.close()
+    store.close()
+    shutdown_logging()
+
+
+def _stop_workers(processes, task_queues):
+    """通知工作进程退出（集群未显式关闭时在解释器退出前调用）"""
+    for process, tasks in zip(processes, task_queues):
+        if process.is_alive():
+            tasks.put(("stop",))
+
+
+class WorkerCluster:
+    """
+    分片工作进程集群
+    同一客户ID总是由同一进程处理；每个进程的在途申请数有上限，输入按处理进度读取
+    """
+
+    def __init__(self, system_kwargs, num_workers=None, state_dir=None, threads_per_worker=DEFAULT_THREADS_PER_WORKER,
+                 max_in_flight=None, cache_config=None, identity_config=None, feature_config=None):
+        """
+        初始化集群，工作进程在首次处理时启动
+        :param system_kwargs: 风控系统构造参数（system_configs、model_configs、rules等），需可序列化，
+                              不能包含cache、identity_index和feature_store；
+                              模型客户端的每分钟请求数和token数配额按工作进程数平分
+        :param num_workers: 工作进程数，默认为CPU核心数
+        :param state_dir: 共享状态目录（SQLite事件表和结果缓存），默认为新建的临时目录
+        :param threads_per_worker: 每个工作进程的处理线程数
+        :param max_in_flight: 每个工作进程的在途申请数上限，默认为处理线程数的2倍
+        :param cache_config: 结果缓存参数（ResultCache参数），为None时不缓存；磁盘层默认位于共享状态目录
+        :param identity_config: 共享身份标识索引参数（SharedIdentityIndex参数）
+        :param feature_config: 共享速率特征存储参数（SharedFeatureStore参数）
+        """
+        owned = [key for key in _CLUSTER_OWNED if key in system_kwargs]
+        if owned:
+            raise ValueError(f"集群模式下由集群创建的组件不能通过system_kwargs传入: {', '.join(owned)}")
+        self.system_kwargs = system_kwargs
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.state_dir = state_dir
+        self.threads_per_worker = threads_per_worker
+        self.max_in_flight = max_in_flight or threads_per_worker * 2
+        self.cache_config = cache_config
+        self.identity_config = identity_config
+        self.feature_config = feature_config
+        self._processes = []
+        self._tasks = []
+        self._results = None
+        self._store = None
+        self._finalizer = None
+        self._active = False
+
+    def start(self):
+        """启动工作进程，已启动时直接返回"""
+        if self._processes:
+            return
+        if self.state_dir is None:
+            self.state_dir = tempfile.mkdtemp(prefix="fraud-cluster-")
+        os.makedirs(self.state_dir, exist_ok=True)
+        # 在启动工作进程前建表，并清理已超出所有速率窗口的事件
+        self._store = SharedStateStore(os.path.join(self.state_dir, SHARED_STATE_FILE))
+        self._purge_expired()
+
+        context = multiprocessing.get_context()
+        self._results = context.Queue()
+        worker_kwargs = split_quotas(self.system_kwargs, self.num_workers)
+        for shard in range(self.num_workers):
+            tasks = context.Queue()
+            process = context.Process(
+                target=_worker_main, name=f"fraud-shard-{shard}",
+                args=(shard, worker_kwargs, self.state_dir, self.cache_config, self.identity_config,
+                      self.feature_config, self.threads_per_worker, tasks, self._results)
+            )
+            process.start()
+            self._processes.append(process)
+            self._tasks.append(tasks)
+        self._finalizer = weakref.finalize(self, _stop_workers, self._processes, self._tasks)
+        logger.info("分片集群已启动: %d 个工作进程, 共享状态目录 %s", self.num_workers, self.state_dir)
+
+    def _purge_expired(self):
+        """删除早于最长速率窗口的速率事件"""
+        features = (self.feature_config or {}).get("features") or DEFAULT_VELOCITY_FEATURES
+        max_window = max(feature["window"] for feature in features)
+        purged = self._store.purge(CHANNEL_VELOCITY, time.time() - max_window)
+        if purged:
+            logger.info("清理过期速率事件 %d 条", purged)
+
+    def _receive(self, kind):
+        """
+        等待指定类型的工作进程消息
+        :param kind: 消息类型
+        :return: 消息
+        """
+        while True:
+            try:
+                message = self._results.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                dead = [process.name for process in self._processes if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"分片工作进程异常退出: {', '.join(dead)}")
+                continue
+            if message[0] == "failed":
+                raise RuntimeError(f"分片工作进程 {message[1]} 初始化失败: {message[2]}")
+            if message[0] == kind:
+                return message
+
+    def iter_process_applications(self, customer_ids, ordered=False):
+        """
+        分片处理客户申请，并以流式方式逐个产出结果
+        目标分片的在途申请数达到上限时先接收结果再提交；按序产出时等待前序结果的记录也计入在途
+        :param customer_ids: 客户ID可迭代对象
+        :param ordered: True时按输入顺序产出，False时按完成顺序产出
+        :return: (输入序号, 处理记录) 的生成器
+        """
+        self.start()
+        if self._active:
+            raise RuntimeError("集群同时只能处理一个批次")
+        self._active = True
+        in_flight = [0] * self.num_workers
+        total_limit = self.max_in_flight * self.num_workers
+        buffered = {}
+        next_index = 0
+
+        def _receive_ready():
+            nonlocal next_index
+            _, shard, index, record = self._receive("record")
+            in_flight[shard] -= 1
+            if not ordered:
+                return [(index, record)]
+            buffered[index] = record
+            ready = []
+            while next_index in buffered:
+                ready.append((next_index, buffered.pop(next_index)))
+                next_index += 1
+            return ready
+
+        try:
+            for index, customer_id in enumerate(customer_ids):
+                shard = shard_for(customer_id, self.num_workers)
+                while in_flight[shard] >= self.max_in_flight or sum(in_flight) + len(buffered) >= total_limit:
+                    yield from _receive_ready()
+                self._tasks[shard].put(("process", index, customer_id))
+                in_flight[shard] += 1
+            while any(in_flight):
+                yield from _receive_ready()
+        finally:
+            try:
+                # 调用方提前停止时等待已提交的申请处理完，避免结果混入下一个批次
+                while any(in_flight):
+                    _, shard, _, _ = self._receive("record")
+                    in_flight[shard] -= 1
+            finally:
+                # 工作进程异常退出时不再等待，集群可以关闭或处理下一个批次
+                self._active = False
+
+    def batch_process_applications(self, customer_ids, ordered=True):
+        """
+        分片批量处理客户申请
+        :param customer_ids: 客户ID列表
+        :param ordered: True时按输入顺序返回结果，False时按完成顺序返回
+        :return: 批量处理结果
+        """
+        logger.info("开始分片批量处理 %d 个客户申请", len(customer_ids))
+        return [record for _, record in self.iter_process_applications(customer_ids, ordered)]
+
+    def get_system_metrics(self):
+        """
+        合并各工作进程的系统指标，需在批次之间调用
+        :return: 与IntelligentFraudDetectionSystem.get_system_metrics相同的汇总指标，
+                 以及工作进程数、各分片的组件统计和共享事件表统计
+        """
+        self.start()
+        if self._active:
+            raise RuntimeError("批次处理过程中不能获取集群指标")
+        for tasks in self._tasks:
+            tasks.put(("metrics",))
+        merged = MetricsCollector()
+        shards = [None] * self.num_workers
+        for _ in range(self.num_workers):
+            _, shard, collector, components = self._receive("metrics")
+            merged.merge(collector)
+            shards[shard] = components
+
+        metrics = summarize_metrics(merged.snapshot())
+        metrics["workers"] = self.num_workers
+        metrics["shards"] = shards
+        metrics["shared_state"] = self._store.get_stats()
+        return metrics
+
+    def close(self):
+        """停止工作进程（各进程关闭自身的系统实例），清理过期事件并关闭共享事件表"""
+        if not self._processes:
+            return
+        self._finalizer.detach()
+        _stop_workers(self._processes, self._tasks)
+        for process in self._processes:
+            process.join()
+        self._processes = []
+        self._tasks = []
+        self._results.close()
+        self._results = None
+        self._purge_expired()
+        self._store.close()
+        self._store = None
+        logger.info("分片集群已关闭")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
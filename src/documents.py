@@ -0,0 +1,158 @@
+"""
+文档引用模块
+身份证照片、收入证明等大体积文档以文件路径的形式在系统中传递，
+内容只在需要时读取或以只读内存映射的方式访问，不常驻内存
+"""
+
+import atexit
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+_document_dir = None
+_document_dir_lock = threading.Lock()
+
+
+class DocumentRef(str):
+    """
+    文档引用
+    本身是文件路径字符串，可直接作为路径使用、序列化和计算缓存键；
+    读取内容时按需打开文件
+    """
+
+    __slots__ = ()
+
+    @property
+    def path(self):
+        """文件路径"""
+        return str(self)
+
+    def exists(self):
+        """
+        文件是否存在
+        :return: 是否存在
+        """
+        return os.path.isfile(self)
+
+    def size(self):
+        """
+        文件大小
+        :return: 字节数
+        """
+        return os.path.getsize(self)
+
+    def open(self):
+        """
+        以二进制只读方式打开文件
+        :return: 文件对象
+        """
+        return open(self, "rb")
+
+    def read_bytes(self):
+        """
+        读取全部内容，只用于小文件或必须整体交给第三方库的场景
+        :return: 文件内容
+        """
+        with self.open() as f:
+            return f.read()
+
+    @contextmanager
+    def mapped(self):
+        """
+        以只读内存映射方式访问文件内容，退出上下文后释放映射
+        :return: 文件内容的memoryview，空文件为空的memoryview
+        """
+        with self.open() as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield memoryview(b"")
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                view = memoryview(mapping)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+
+def document_dir():
+    """
+    获取下载文档的落盘目录，首次调用时在临时目录下创建，进程退出时删除
+    :return: 目录路径
+    """
+    global _document_dir
+    with _document_dir_lock:
+        if _document_dir is None:
+            _document_dir = tempfile.mkdtemp(prefix="rpa_documents_")
+        return _document_dir
+
+
+def remove_document_dir():
+    """删除下载文档的落盘目录及其中的全部文件，之后再落盘时重新创建"""
+    global _document_dir
+    with _document_dir_lock:
+        if _document_dir is not None:
+            shutil.rmtree(_document_dir, ignore_errors=True)
+            _document_dir = None
+
+
+def store_document(data, name, directory=None):
+    """
+    将下载得到的文档内容写入文件，返回文档引用
+    :param data: 文档内容（bytes、bytearray或memoryview）
+    :param name: 文件名
+    :param directory: 落盘目录，默认为document_dir()
+    :return: DocumentRef
+    """
+    directory = directory or document_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return DocumentRef(path)
+
+
+def spill_documents(value, name, directory=None, stored=None):
+    """
+    将采集结果中的二进制内容写入文件并替换为文档引用，其余内容保持不变
+    :param value: 采集结果，可以是二进制内容，或包含二进制内容的字典/列表
+    :param name: 文件名前缀
+    :param directory: 落盘目录，默认为document_dir()
+    :param stored: 列表，新写入的文档引用追加到其中，供处理结束后删除
+    :return: 替换后的采集结果
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        document = store_document(value, name, directory)
+        if stored is not None:
+            stored.append(document)
+        return document
+    if isinstance(value, dict):
+        return {key: spill_documents(item, f"{name}_{key}", directory, stored) for key, item in value.items()}
+    if isinstance(value, list):
+        return [spill_documents(item, f"{name}_{index}", directory, stored) for index, item in enumerate(value)]
+    return value
+
+
+def remove_documents(documents):
+    """
+    删除文档文件，已不存在的文件直接跳过
+    :param documents: 文档引用或路径列表
+    """
+    for document in documents:
+        try:
+            os.remove(document)
+        except FileNotFoundError:
+            pass
+
+
+def _forget_document_dir_in_child():
+    """fork出的子进程不沿用父进程的落盘目录，避免子进程退出时删除父进程仍在使用的文件"""
+    global _document_dir
+    _document_dir = None
+
+
+atexit.register(remove_document_dir)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_document_dir_in_child)
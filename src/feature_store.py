@@ -0,0 +1,273 @@
+"""
+速率特征存储模块
+按实体（手机号、身份证号、地区、产品类型）维护按时间分桶的滑动窗口计数，
+得到"同一手机号1小时内申请次数"等速率特征，供欺诈规则和决策阶梯使用；
+更新和查询均摊O(1)，窗口内没有新事件的实体随过期淘汰，内存由窗口长度约束
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .identity_index import extract_identifiers, KIND_PHONE, KIND_ID_NUMBER
+
+# 默认桶宽（秒）
+DEFAULT_RESOLUTION = 60
+# 默认速率特征：name为特征名，entity为实体维度，window为窗口长度（秒），amount为计数量（默认按申请计数）
+DEFAULT_VELOCITY_FEATURES = [
+    {"name": "phone_applications_1h", "entity": "phone", "window": 3600},
+    {"name": "id_number_applications_24h", "entity": "id_number", "window": 86400},
+    {"name": "region_applications_1h", "entity": "region", "window": 3600},
+    {"name": "product_applications_1h", "entity": "product_type", "window": 3600},
+    {"name": "region_claims_24h", "entity": "region", "window": 86400, "amount": "claims"}
+]
+
+
+def velocity_entities(customer_data):
+    """
+    从客户数据中提取速率特征的实体，不会触发尚未采集的数据源
+    :param customer_data: 客户数据
+    :return: {实体维度: 实体值}，无法确定的维度不包含在内
+    """
+    identity_graph = dict.get(customer_data, "identity_graph") or {}
+    identifiers = identity_graph.get("identifiers")
+    if identifiers is None:
+        identifiers = extract_identifiers(customer_data)
+    identifiers = dict(identifiers)
+    application_form = dict.get(customer_data, "application_form") or {}
+
+    entities = {}
+    if identifiers.get(KIND_PHONE):
+        entities["phone"] = identifiers[KIND_PHONE]
+    id_number = identifiers.get(KIND_ID_NUMBER)
+    if id_number:
+        entities["id_number"] = id_number
+    # 地区优先取申请表填写的地区，否则取身份证号前6位行政区划代码
+    region = application_form.get("region") or (id_number[:6] if id_number else None)
+    if region:
+        entities["region"] = region
+    if application_form.get("product_type"):
+        entities["product_type"] = application_form["product_type"]
+    return entities
+
+
+def velocity_amounts(customer_data, claims_window=None, now=None):
+    """
+    计算一次申请贡献的计数量
+    :param customer_data: 客户数据
+    :param claims_window: 理赔计数的窗口（秒），只计理赔日期在窗口内的理赔；None表示不计理赔
+    :param now: 当前时间戳，默认取系统时间
+    :return: {"applications": 1, "claims": 历史保单中理赔日期在窗口内的理赔次数}
+    """
+    history_records = dict.get(customer_data, "history_records")
+    claims = 0
+    if claims_window is not None and isinstance(history_records, list):
+        now = time.time() if now is None else now
+        claims = sum(1 for record in history_records if isinstance(record, dict)
+                     for claim in record.get("claim_history") or []
+                     if _in_window(claim, now - claims_window, now))
+    return {"applications": 1, "claims": claims}
+
+
+def _in_window(claim, start, end):
+    """
+    判断理赔日期是否在时间范围内，日期缺失或无法解析时视为不在范围内
+    :param claim: 理赔记录，date为ISO格式日期或时间
+    :param start: 起始时间戳
+    :param end: 结束时间戳
+    :return: 是否在范围内
+    """
+    if not isinstance(claim, dict):
+        return False
+    try:
+        timestamp = __import__('datetime').datetime.fromisoformat(str(claim.get("date"))).timestamp()
+    except ValueError:
+        return False
+    return start <= timestamp <= end
+
+
+class WindowCounter:
+    """
+    单个实体的滑动窗口计数器
+    只保存有事件的桶，维护窗口内的累计值，过期的桶从队首移除
+    """
+
+    __slots__ = ("slots", "_buckets", "total")
+
+    def __init__(self, slots):
+        """
+        初始化计数器
+        :param slots: 窗口包含的桶数
+        """
+        self.slots = slots
+        self._buckets = deque()
+        self.total = 0
+
+    def expire(self, epoch):
+        """
+        移除窗口外的桶
+        :param epoch: 当前桶序号
+        """
+        oldest = epoch - self.slots + 1
+        buckets = self._buckets
+        while buckets and buckets[0][0] < oldest:
+            self.total -= buckets.popleft()[1]
+
+    def add(self, amount, epoch):
+        """
+        计数，乱序到达的事件按桶序号计入对应的桶
+        :param amount: 增量
+        :param epoch: 事件所在的桶序号
+        :return: 是否计入，早于窗口的迟到事件不计入
+        """
+        self.expire(epoch)
+        buckets = self._buckets
+        if not buckets or buckets[-1][0] < epoch:
+            buckets.append([epoch, amount])
+            self.total += amount
+            return True
+        if epoch < buckets[-1][0] - self.slots + 1:
+            return False
+        # 迟到的事件通常只比最新的桶早几个桶，从队尾向前查找
+        index = len(buckets) - 1
+        while index > 0 and buckets[index - 1][0] >= epoch:
+            index -= 1
+        if buckets[index][0] == epoch:
+            buckets[index][1] += amount
+        else:
+            buckets.insert(index, [epoch, amount])
+        self.total += amount
+        return True
+
+    @property
+    def last_epoch(self):
+        """最新桶的序号，没有桶时为None"""
+        return self._buckets[-1][0] if self._buckets else None
+
+
+class FeatureStore:
+    """
+    进程内速率特征存储
+    """
+
+    def __init__(self, features=None, resolution=DEFAULT_RESOLUTION, max_entities=None):
+        """
+        初始化特征存储
+        :param features: 速率特征配置列表，为None时使用DEFAULT_VELOCITY_FEATURES
+        :param resolution: 桶宽（秒）
+        :param max_entities: 每个特征最多保留的实体数，超出时淘汰最久未更新的实体；None表示只按窗口过期淘汰
+        """
+        self.features = [dict(feature) for feature in (features or DEFAULT_VELOCITY_FEATURES)]
+        self.resolution = resolution
+        self.max_entities = max_entities
+        self._init_state()
+
+    def _init_state(self):
+        """初始化计数器"""
+        self._lock = threading.Lock()
+        # 特征名 -> 按最近更新时间排序的 {实体值: WindowCounter}
+        self._counters = {feature["name"]: OrderedDict() for feature in self.features}
+        self._plan = [
+            (feature["name"], feature["entity"], max(1, -(-feature["window"] // self.resolution)),
+             feature.get("amount", "applications"))
+            for feature in self.features
+        ]
+
+    def observe(self, entities, amounts=None, previous=None, now=None):
+        """
+        记录一次申请并返回各速率特征的当前值（包含本次申请）
+        :param entities: {实体维度: 实体值}
+        :param amounts: {计数量名称: 数量}，默认只按申请计1次
+        :param previous: 同一申请之前的observe结果，其中已记录的实体只查询不重复计数
+        :param now: 当前时间戳，默认取系统时间
+        :return: {"entities": 本次记录的实体, "features": {特征名: 值，实体未知时为None}}
+        """
+        amounts = amounts or {"applications": 1}
+        recorded = (previous or {}).get("entities") or {}
+        epoch = int((time.time() if now is None else now) // self.resolution)
+        features = {}
+        with self._lock:
+            for name, dimension, slots, amount_name in self._plan:
+                entity = entities.get(dimension)
+                if entity is None:
+                    features[name] = None
+                    continue
+                counters = self._counters[name]
+                counter = counters.get(entity)
+                if recorded.get(dimension) == entity:
+                    if counter is None:
+                        features[name] = 0
+                        continue
+                    counter.expire(epoch)
+                    features[name] = counter.total
+                    continue
+                if counter is None:
+                    counter = counters[entity] = WindowCounter(slots)
+                else:
+                    counters.move_to_end(entity)
+                counter.add(amounts.get(amount_name, 0), epoch)
+                features[name] = counter.total
+                self._evict(counters, epoch - slots + 1)
+        return {"entities": dict(entities), "features": features}
+
+    def amount_window(self, amount_name):
+        """
+        获取使用指定计数量的特征中最长的窗口
+        :param amount_name: 计数量名称，如"claims"
+        :return: 窗口长度（秒），没有特征使用该计数量时为None
+        """
+        windows = [feature["window"] for feature in self.features
+                   if feature.get("amount", "applications") == amount_name]
+        return max(windows) if windows else None
+
+    def _evict(self, counters, oldest):
+        """
+        淘汰窗口内已没有事件的实体（按最近更新时间从旧到新检查），以及超出数量上限的实体
+        :param counters: 单个特征的计数器
+        :param oldest: 窗口内最早的桶序号
+        """
+        while counters:
+            entity, counter = next(iter(counters.items()))
+            last_epoch = counter.last_epoch
+            if last_epoch is not None and last_epoch >= oldest and \
+                    (self.max_entities is None or len(counters) <= self.max_entities):
+                break
+            counters.popitem(last=False)
+
+    def query(self, entities, now=None):
+        """
+        查询速率特征，不计数
+        :param entities: {实体维度: 实体值}
+        :param now: 当前时间戳，默认取系统时间
+        :return: {特征名: 值，实体未知时为None}
+        """
+        epoch = int((time.time() if now is None else now) // self.resolution)
+        features = {}
+        with self._lock:
+            for name, dimension, _, _ in self._plan:
+                entity = entities.get(dimension)
+                counter = self._counters[name].get(entity) if entity is not None else None
+                if entity is None:
+                    features[name] = None
+                elif counter is None:
+                    features[name] = 0
+                else:
+                    counter.expire(epoch)
+                    features[name] = counter.total
+        return features
+
+    def get_stats(self):
+        """
+        获取存储统计
+        :return: 各特征当前保留的实体数
+        """
+        with self._lock:
+            return {"entities": {name: len(counters) for name, counters in self._counters.items()}}
+
+    def __getstate__(self):
+        """序列化到子进程时只携带配置，子进程中的计数从空开始"""
+        return {"features": self.features, "resolution": self.resolution, "max_entities": self.max_entities}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
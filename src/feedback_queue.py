@@ -0,0 +1,473 @@
+"""
+模型反馈队列模块
+执行结果的反馈事件先进入进程内的有界队列，由后台线程按批大小或等待时间批量发送到反馈接收端
+（本地JSONL数据湖或HTTP接口），申请处理流程不再等待反馈发送；
+接收端不可用时按退避重试，仍失败的批次落盘，接收端恢复后自动补发（至少一次送达）
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from .log_store import JsonlSegmentWriter, DEFAULT_SEGMENT_MAX_BYTES
+from .records import json_default
+from .logging_utils import get_logger
+
+logger = get_logger("feedback_queue")
+
+# 默认单批最大事件数
+DEFAULT_MAX_BATCH_SIZE = 100
+# 第一个事件入批后最长等待时间（秒），也是空闲时检查落盘批次的间隔
+DEFAULT_FLUSH_INTERVAL = 1.0
+# 队列默认容量
+DEFAULT_MAX_QUEUE_SIZE = 10000
+# 队列满时入队最长阻塞时间（秒）
+DEFAULT_PUT_TIMEOUT = 0.1
+# 单批发送失败后的默认重试次数
+DEFAULT_MAX_RETRIES = 3
+# 重试退避基数（秒），每次重试翻倍并加随机抖动
+DEFAULT_RETRY_BACKOFF = 0.2
+# 接收端连续失败后暂停发送、直接落盘的时间（秒）
+DEFAULT_RECOVERY_INTERVAL = 30.0
+# 内存接收端默认保留的事件数
+DEFAULT_MEMORY_EVENTS = 10000
+# 落盘批次文件名前缀
+SPILL_PREFIX = "feedback-spill"
+# 补发时被进程认领的落盘文件: <原文件名>.<进程ID>.replaying
+_CLAIMED_PATTERN = re.compile(rf"({SPILL_PREFIX}-.+\.jsonl)\.(\d+)\.replaying")
+
+# 空闲超时标记
+_IDLE = object()
+
+
+class _FlushRequest:
+    """flush请求，后台线程发送完当前批次后通知调用方"""
+
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class FeedbackSink:
+    """
+    反馈接收端接口，后台线程以批为单位调用send
+    """
+
+    def send(self, events):
+        """
+        发送一批反馈事件，失败时抛出异常
+        :param events: 反馈事件列表
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """释放接收端资源"""
+
+
+class InMemoryFeedbackSink(FeedbackSink):
+    """
+    内存接收端，保留最近的反馈事件，便于调试和测试
+    """
+
+    def __init__(self, max_events=DEFAULT_MEMORY_EVENTS):
+        """
+        初始化内存接收端
+        :param max_events: 最多保留的事件数
+        """
+        self.max_events = max_events
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def send(self, events):
+        with self._lock:
+            self._events.extend(events)
+
+    def get_events(self):
+        """
+        获取已接收的反馈事件
+        :return: 事件列表
+        """
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        """清空已接收的事件"""
+        with self._lock:
+            self._events.clear()
+
+    def __getstate__(self):
+        return {"max_events": self.max_events}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class JsonlFeedbackSink(FeedbackSink):
+    """
+    本地数据湖接收端，反馈事件追加写入按大小轮转的JSONL分段，每批写入后刷新
+    """
+
+    def __init__(self, directory, prefix="feedback", max_segment_bytes=DEFAULT_SEGMENT_MAX_BYTES,
+                 max_segments=None):
+        """
+        初始化JSONL接收端
+        :param directory: 分段文件目录
+        :param prefix: 分段文件名前缀
+        :param max_segment_bytes: 单个分段最大字节数
+        :param max_segments: 最多保留的分段数，None表示不删除旧分段
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._writer = JsonlSegmentWriter(directory, prefix, max_segment_bytes, max_segments)
+
+    def send(self, events):
+        with self._lock:
+            for event in events:
+                self._writer.write(event)
+            self._writer.flush()
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+
+    def __getstate__(self):
+        return {"directory": self.directory, "prefix": self.prefix,
+                "max_segment_bytes": self.max_segment_bytes, "max_segments": self.max_segments}
+
+    def __setstate__(self, state):
+        """子进程写入带进程号的独立分段，避免多个进程追加写入同一文件"""
+        self.__init__(**state)
+        self._writer = JsonlSegmentWriter(self.directory, f"{self.prefix}.{os.getpid()}",
+                                          self.max_segment_bytes, self.max_segments)
+
+
+class HttpFeedbackSink(FeedbackSink):
+    """
+    HTTP接收端，每批以一个JSON请求POST到机器学习平台的反馈接口
+    """
+
+    def __init__(self, endpoint, api_key=None, timeout=10):
+        """
+        初始化HTTP接收端
+        :param endpoint: 反馈接口地址
+        :param api_key: 接口密钥，为None时不携带认证头
+        :param timeout: 请求超时（秒）
+        """
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def send(self, events):
+        body = json.dumps({"events": events}, ensure_ascii=False, separators=(",", ":"),
+                          default=json_default).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.endpoint, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class FeedbackQueue:
+    """
+    异步批量反馈队列
+    调用方入队后立即返回，后台线程凑批发送；队列满时入队方短暂阻塞（背压），
+    仍无空位时事件直接落盘（未配置落盘目录时丢弃并计数）
+    """
+
+    def __init__(self, sink, max_batch_size=DEFAULT_MAX_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_queue_size=DEFAULT_MAX_QUEUE_SIZE, put_timeout=DEFAULT_PUT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_backoff=DEFAULT_RETRY_BACKOFF, spill_dir=None,
+                 recovery_interval=DEFAULT_RECOVERY_INTERVAL):
+        """
+        初始化反馈队列
+        :param sink: 反馈接收端（FeedbackSink）
+        :param max_batch_size: 单批最大事件数
+        :param flush_interval: 第一个事件入批后最长等待时间（秒）
+        :param max_queue_size: 队列容量
+        :param put_timeout: 队列满时入队最长阻塞时间（秒）
+        :param max_retries: 单批发送失败后的重试次数
+        :param retry_backoff: 重试退避基数（秒）
+        :param spill_dir: 落盘目录，发送失败的批次写入该目录并在接收端恢复后补发；为None时不落盘
+        :param recovery_interval: 批次重试仍失败后暂停发送的时间（秒），期间的批次直接落盘
+        """
+        self.sink = sink
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spill_dir = spill_dir
+        self.recovery_interval = recovery_interval
+        self.stats = {"enqueued": 0, "sent": 0, "batches": 0, "retries": 0, "failed_batches": 0,
+                      "spilled": 0, "replayed": 0, "dropped": 0}
+        self._init_worker_state()
+
+    def _init_worker_state(self):
+        """初始化队列和后台线程状态"""
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._spill_seq = itertools.count()
+        self._down_until = 0.0
+        # 启动时检查之前运行遗留的落盘批次
+        self._has_spilled = bool(self.spill_dir)
+
+    def put(self, event, timeout=None):
+        """
+        反馈事件入队
+        :param event: 反馈事件
+        :param timeout: 队列满时最长阻塞时间（秒），默认为put_timeout
+        :return: 是否入队，未入队的事件已落盘或丢弃
+        """
+        self._ensure_worker()
+        try:
+            self._queue.put(event, timeout=self.put_timeout if timeout is None else timeout)
+        except queue.Full:
+            self._overflow([event])
+            return False
+        self._count("enqueued")
+        return True
+
+    async def aput(self, event):
+        """
+        在事件循环中入队，队列未满时不阻塞事件循环，队列满时在线程池中等待空位
+        :param event: 反馈事件
+        :return: 是否入队
+        """
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            return await asyncio.get_running_loop().run_in_executor(None, self.put, event)
+        self._count("enqueued")
+        return True
+
+    def _ensure_worker(self):
+        """按需启动后台线程"""
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="feedback-flusher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        """后台凑批循环"""
+        batch = []
+        deadline = None
+        while True:
+            if deadline is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                entry = _IDLE
+            if entry is None or entry is _IDLE or isinstance(entry, _FlushRequest):
+                if batch:
+                    self._deliver(batch)
+                    batch = []
+                    deadline = None
+                elif self._has_spilled and time.monotonic() >= self._down_until:
+                    # 空闲时补发落盘的批次
+                    self._replay_spilled()
+                if entry is None:
+                    return
+                if isinstance(entry, _FlushRequest):
+                    entry.done.set()
+                continue
+            batch.append(entry)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(batch) >= self.max_batch_size:
+                self._deliver(batch)
+                batch = []
+                deadline = None
+
+    def _deliver(self, batch):
+        """
+        发送一批事件，接收端不可用时落盘
+        :param batch: 反馈事件列表
+        """
+        if self.spill_dir and time.monotonic() < self._down_until:
+            self._spill(batch)
+            return
+        if self._send_with_retry(batch):
+            self._count("sent", len(batch))
+            self._count("batches")
+            if self._has_spilled:
+                self._replay_spilled()
+            return
+        self._count("failed_batches")
+        if self.spill_dir:
+            self._down_until = time.monotonic() + self.recovery_interval
+        self._overflow(batch)
+
+    def _send_with_retry(self, batch):
+        """
+        发送一批事件，失败时按指数退避加随机抖动重试
+        :param batch: 反馈事件列表
+        :return: 是否发送成功
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.send(batch)
+                return True
+            except Exception as exc:
+                if attempt == self.max_retries:
+                    logger.warning("反馈批次发送失败（已重试%d次）: %s", self.max_retries, exc)
+                    return False
+                self._count("retries")
+                time.sleep(self.retry_backoff * (2 ** attempt) * (0.5 + random.random()))
+        return False
+
+    def _overflow(self, events):
+        """无法发送或入队的事件落盘，未配置落盘目录时丢弃"""
+        if self.spill_dir:
+            self._spill(events)
+            return
+        self._count("dropped", len(events))
+        logger.warning("反馈接收端不可用且未配置落盘目录，丢弃 %d 个反馈事件", len(events))
+
+    def _spill(self, events):
+        """
+        将事件写入一个新的落盘文件，先写临时文件再改名，补发时不会读到不完整的文件
+        :param events: 反馈事件列表
+        """
+        os.makedirs(self.spill_dir, exist_ok=True)
+        name = f"{SPILL_PREFIX}-{time.time_ns()}-{os.getpid()}-{next(self._spill_seq)}.jsonl"
+        path = os.path.join(self.spill_dir, name)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self._has_spilled = True
+        self._count("spilled", len(events))
+
+    def _replay_spilled(self):
+        """
+        按落盘顺序补发落盘的批次，成功后删除文件；
+        补发前先将文件改名认领，多个进程共用落盘目录时同一文件只会被一个进程补发
+        """
+        self._has_spilled = False
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return
+        self._recover_stale_claims()
+        names = sorted(name for name in os.listdir(self.spill_dir)
+                       if name.startswith(SPILL_PREFIX + "-") and name.endswith(".jsonl"))
+        for name in names:
+            path = os.path.join(self.spill_dir, name)
+            claimed = f"{path}.{os.getpid()}.replaying"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f if line.strip()]
+            try:
+                for start in range(0, len(events), self.max_batch_size):
+                    self.sink.send(events[start:start + self.max_batch_size])
+            except Exception as exc:
+                os.rename(claimed, path)
+                self._has_spilled = True
+                self._down_until = time.monotonic() + self.recovery_interval
+                logger.warning("补发落盘的反馈批次失败，%.0f秒后重试: %s", self.recovery_interval, exc)
+                return
+            os.remove(claimed)
+            self._count("replayed", len(events))
+        if names:
+            logger.info("已补发 %d 个落盘的反馈批次", len(names))
+
+    def _recover_stale_claims(self):
+        """认领文件的进程已退出（补发中途崩溃）时，将文件改回原名重新参与补发"""
+        for name in os.listdir(self.spill_dir):
+            match = _CLAIMED_PATTERN.fullmatch(name)
+            if match is None or _pid_alive(int(match.group(2))):
+                continue
+            original, pid = match.groups()
+            try:
+                os.rename(os.path.join(self.spill_dir, name), os.path.join(self.spill_dir, original))
+            except FileNotFoundError:
+                continue
+            logger.info("回收已退出进程 %s 认领的落盘批次 %s", pid, original)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def flush(self, timeout=None):
+        """
+        等待已入队的事件发送完成（或落盘）
+        :param timeout: 最长等待时间（秒），None表示一直等待
+        :return: 是否在超时前完成
+        """
+        if self._worker is None:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def get_stats(self):
+        """
+        获取队列统计
+        :return: 入队、发送、重试、落盘、补发、丢弃的事件数，队列长度和接收端是否可用
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["queue_size"] = self._queue.qsize()
+        stats["sink_available"] = time.monotonic() >= self._down_until
+        return stats
+
+    def close(self):
+        """发送完已入队的事件后停止后台线程并关闭接收端"""
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+        self.sink.close()
+
+    def __getstate__(self):
+        """序列化时不携带队列和线程"""
+        state = self.__dict__.copy()
+        for key in ("_queue", "_worker", "_start_lock", "_stats_lock", "_spill_seq"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建队列"""
+        self.__dict__.update(state)
+        self._init_worker_state()
+
+
+def _pid_alive(pid):
+    """
+    判断进程是否仍在运行
+    :param pid: 进程ID
+    :return: 是否在运行
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -3,10 +3,37 @@
 整合RPA、LLM分析、风控决策和流程执行模块
 """
 
-from .rpa_collector import RPADataCollector
+import asyncio
+import multiprocessing.util
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .rpa_collector import RPADataCollector, PRESCREEN_SOURCES
 from .llm_analyzer import LLMAnalyzer
 from .risk_decision_engine import RiskDecisionEngine
+from .rule_engine import RuleEngine, DEFAULT_RISK_THRESHOLDS
+from .prescreen import PreScreener, TIER_PRESCREEN, TIER_MODEL
+from .records import ProcessRecord, DecisionResult
+from .image_preprocess import ImagePreprocessor
+from .documents import remove_document_dir
 from .process_executor import ProcessExecutor
+from .feedback_queue import FeedbackQueue, InMemoryFeedbackSink
+from .notifications import NotificationDispatcher
+from .identity_index import IdentityIndex, extract_identifiers
+from .feature_store import FeatureStore, velocity_entities, velocity_amounts
+from .shared_state import SharedIdentityIndex, SharedFeatureStore
+from .streaming import as_source, as_checkpoint, DEFAULT_CHECKPOINT_EVERY
+from .async_utils import run_sync
+from .log_store import LogStore
+from .metrics import MetricsCollector
+from .tracing import span
+from .logging_utils import get_logger
+
+logger = get_logger("fraud_detection_system")
 
 
 class IntelligentFraudDetectionSystem:
@@ -15,112 +42,580 @@ class IntelligentFraudDetectionSystem:
     整合RPA数据采集、LLM分析、风控决策和流程执行功能
     """
     
-    def __init__(self, system_configs, model_configs, risk_thresholds=None):
+    def __init__(self, system_configs, model_configs, risk_thresholds=None, cache=None, log_config=None,
+                 tracer=None, rules=None, prescreen=None, feedback_queue=None, notifier=None, identity_index=None,
+                 feature_store=None):
         """
         初始化智能风控系统
         :param system_configs: 系统配置
         :param model_configs: 模型配置
         :param risk_thresholds: 风险阈值配置
+        :param cache: OCR与LLM分析共用的结果缓存（ResultCache），为None时不缓存
+        :param log_config: 日志存储配置（LogStore参数，如capacity、spill_dir），
+                           系统日志、采集记录和执行记录共用
+        :param tracer: 链路追踪器（Tracer），为None时不记录链路
+        :param rules: 欺诈规则和决策规则配置（字典）或规则JSON文件路径，为None时使用默认规则
+        :param prescreen: 规则预筛配置（见PreScreener），为None时所有申请都经过大模型分析
+        :param feedback_queue: 模型反馈队列（FeedbackQueue），默认为发送到内存接收端的队列
+        :param notifier: 通知分发器（NotificationDispatcher），默认按类型合并摘要后写入日志
+        :param identity_index: 身份标识索引（IdentityIndex），用于黑名单查询和团伙关联，默认为仅内存的索引
+        :param feature_store: 速率特征存储（FeatureStore），默认使用DEFAULT_VELOCITY_FEATURES
         """
-        self.rpa_collector = RPADataCollector(system_configs)
-        self.llm_analyzer = LLMAnalyzer(model_configs)
-        self.risk_engine = RiskDecisionEngine(risk_thresholds)
-        self.process_executor = ProcessExecutor()
+        log_config = log_config or {}
+        self.cache = cache
+        # OCR和多模态模型共用图像预处理器（解码和裁剪结果在进程内共享）
+        self.image_preprocessor = ImagePreprocessor(**model_configs.get("image_preprocessing", {}))
+        self.rpa_collector = RPADataCollector(system_configs, cache=cache,
+                                              log_store=LogStore("collected_data", **log_config),
+                                              image_preprocessor=self.image_preprocessor)
+        # 欺诈规则和决策规则共用一个规则引擎，规则文件变更时一起热更新
+        risk_thresholds = risk_thresholds or dict(DEFAULT_RISK_THRESHOLDS)
+        self.rule_engine = RuleEngine.load(rules, risk_thresholds)
+        self.risk_engine = RiskDecisionEngine(risk_thresholds, rule_engine=self.rule_engine)
+        self.llm_analyzer = LLMAnalyzer(model_configs, cache=cache, rule_engine=self.rule_engine,
+                                        image_preprocessor=self.image_preprocessor)
+        # 分层处理：结论明确的申请在预筛阶段决策，不调用大模型
+        self.prescreener = PreScreener(self.rule_engine, prescreen) if prescreen is not None else None
+        # 模型反馈由后台线程批量发送，不计入申请处理延迟
+        if feedback_queue is None:
+            feedback_queue = FeedbackQueue(InMemoryFeedbackSink())
+        # 复核、拒绝和欺诈预警通知合并为摘要异步发送
+        if notifier is None:
+            notifier = NotificationDispatcher()
+        # 黑名单与团伙关联：检测阶段查询，拒绝欺诈申请时写入黑名单
+        self.identity_index = identity_index if identity_index is not None else IdentityIndex()
+        # 按手机号、身份证号、地区和产品类型统计的滑动窗口速率特征
+        self.feature_store = feature_store if feature_store is not None else FeatureStore()
+        self.process_executor = ProcessExecutor(log_store=LogStore("execution_log", **log_config),
+                                                feedback_queue=feedback_queue, notifier=notifier,
+                                                identity_index=self.identity_index)
         
         # 存储系统运行日志
-        self.system_log = []
-        
+        self.system_log = LogStore("system_log", **log_config)
+        # 并发批处理时保护系统日志的锁
+        self._log_lock = threading.Lock()
+        # 增量维护的系统指标
+        self.metrics = MetricsCollector()
+        self.tracer = tracer
+
+    def __getstate__(self):
+        """进程池序列化时不携带锁，日志存储在子进程中为仅内存的空存储"""
+        state = self.__dict__.copy()
+        del state["_log_lock"]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建锁"""
+        self.__dict__.update(state)
+        self._log_lock = threading.Lock()
+
     def process_customer_application(self, customer_id):
         """
-        处理客户申请全流程
+        处理客户申请全流程（同步接口，内部运行异步实现）
+        :param customer_id: 客户ID
+        :return: 处理结果
+        """
+        return run_sync(self.aprocess_customer_application(customer_id))
+    
+    async def aprocess_customer_application(self, customer_id):
+        """
+        异步处理客户申请全流程，可在事件循环中并发处理大量申请；处理结束（包括失败）后删除该客户落盘的文档
+        :param customer_id: 客户ID
+        :return: 处理结果
+        """
+        try:
+            if self.tracer is None:
+                return await self._aprocess_application(customer_id)
+            with self.tracer.trace("process_application", customer_id=customer_id) as root:
+                process_record = await self._aprocess_application(customer_id)
+                if root is not None:
+                    root.set_attribute("decision", process_record["decision_result"]["decision"])
+                return process_record
+        finally:
+            self.rpa_collector.release_documents(customer_id)
+    
+    async def _aprocess_application(self, customer_id):
+        """
+        依次执行七个处理步骤，每个步骤记录耗时并作为子span
         :param customer_id: 客户ID
         :return: 处理结果
         """
-        print(f"开始处理客户 {customer_id} 的申请...")
+        logger.info("开始处理客户 %s 的申请", customer_id)
+        started = time.perf_counter()
+        timings = {}
         
         # 1. RPA数据采集
-        print("\\n=== 步骤1: RPA数据采集 ===")
-        customer_data = self.rpa_collector.collect_customer_data(customer_id)
-        
-        # 2. LLM智能分析
-        print("\\n=== 步骤2: LLM智能分析 ===")
-        analysis_result = self.llm_analyzer.analyze_multimodal_data(customer_data)
-        
-        # 3. 欺诈检测
-        print("\\n=== 步骤3: 欺诈检测 ===")
-        fraud_result = self.llm_analyzer.detect_fraud_patterns(customer_data)
+        logger.debug("客户 %s 步骤1: RPA数据采集", customer_id)
+        # 开启预筛时只预先采集结构化数据源和身份证（身份证号在关联身份标识时查询黑名单），
+        # 收入证明在升级到大模型分析时才采集
+        prefetch = PRESCREEN_SOURCES if self.prescreener is not None else None
+        with self._stage(timings, "rpa_collect"):
+            customer_data = await self.rpa_collector.acollect_customer_data(customer_id, prefetch)
+        with self._stage(timings, "identity_graph"):
+            # 身份标识提取可能触发OCR识别，放到线程中执行，不阻塞事件循环
+            await asyncio.to_thread(self._link_identities, customer_data)
+        with self._stage(timings, "velocity_features"):
+            self._update_velocity(customer_data)
         
-        # 4. 风控决策
-        print("\\n=== 步骤4: 风控决策 ===")
-        decision_result = self.risk_engine.make_decision(analysis_result, fraud_result, customer_data)
+        # 规则预筛：结论明确时跳过步骤2-5的大模型调用
+        screen = None
+        if self.prescreener is not None:
+            with self._stage(timings, "prescreen"):
+                screen = self.prescreener.screen(customer_data)
         
-        # 5. 生成审批建议
-        print("\\n=== 步骤5: 生成审批建议 ===")
-        approval_advice = self.llm_analyzer.generate_approval_advice(analysis_result, customer_data)
-        print(f"审批建议: {approval_advice}")
+        if screen is not None:
+            tier = TIER_PRESCREEN
+            analysis_result = None
+            fraud_result = screen["fraud_result"]
+            decision_result = screen["decision_result"]
+            approval_advice = screen["approval_advice"]
+        else:
+            tier = TIER_MODEL
+            analysis_result, fraud_result, decision_result, approval_advice = \
+                await self._amodel_decision(customer_data, timings)
         
         # 6. 执行后续流程
-        print("\\n=== 步骤6: 执行后续流程 ===")
-        execution_result = self.process_executor.execute_process(decision_result, customer_data, approval_advice)
+        logger.debug("客户 %s 步骤6: 执行后续流程", customer_id)
+        with self._stage(timings, "process_execution"):
+            execution_result = await self.process_executor.aexecute_process(decision_result, customer_data,
+                                                                            approval_advice)
         
         # 7. 反馈结果到平台
-        print("\\n=== 步骤7: 反馈结果 ===")
-        feedback_result = self.process_executor.feedback_to_model(execution_result, customer_data)
+        logger.debug("客户 %s 步骤7: 反馈结果", customer_id)
+        with self._stage(timings, "feedback"):
+            feedback_result = await self.process_executor.afeedback_to_model(execution_result, customer_data)
         
         # 记录到系统日志
-        process_record = {
-            "customer_id": customer_id,
-            "customer_data": customer_data,
-            "analysis_result": analysis_result,
-            "fraud_result": fraud_result,
-            "decision_result": decision_result,
-            "approval_advice": approval_advice,
-            "execution_result": execution_result,
-            "feedback_result": feedback_result,
-            "completed_at": __import__('datetime').datetime.now().isoformat()
-        }
-        self.system_log.append(process_record)
-        
-        print(f"\\n客户 {customer_id} 的申请处理完成。")
-        print(f"最终决策: {decision_result['decision']}")
+        process_record = ProcessRecord(
+            customer_id=customer_id,
+            customer_data=customer_data,
+            analysis_result=analysis_result,
+            fraud_result=fraud_result,
+            decision_result=decision_result,
+            approval_advice=approval_advice,
+            execution_result=execution_result,
+            feedback_result=feedback_result,
+            tier=tier,
+            processing_time=time.perf_counter() - started,
+            stage_timings=timings,
+            completed_at=__import__('datetime').datetime.now().isoformat()
+        )
+        self._log_record(process_record)
+        
+        logger.info("客户 %s 的申请处理完成，最终决策: %s", customer_id, decision_result["decision"])
         
         return process_record
     
-    def batch_process_applications(self, customer_ids):
+    async def _amodel_decision(self, customer_data, timings):
+        """
+        大模型分析层：执行LLM分析、欺诈检测、风控决策和审批建议四个步骤
+        :param customer_data: 客户数据
+        :param timings: 当前申请的阶段耗时字典
+        :return: (分析结果, 欺诈检测结果, 决策结果, 审批建议)
+        """
+        customer_id = customer_data["customer_id"]
+        if customer_data.unloaded_sources:
+            with self._stage(timings, "rpa_documents"):
+                await customer_data.aload()
+                # 身份证OCR得到的身份证号和住址补充关联，并补充按身份证号和地区统计的速率特征
+                await asyncio.to_thread(self._link_identities, customer_data)
+                self._update_velocity(customer_data)
+        
+        if self.llm_analyzer.combined_mode:
+            # 2-3. 合并模式：一次模型调用完成分析、欺诈检测和审批建议
+            logger.debug("客户 %s 步骤2-3: LLM合并分析与欺诈检测", customer_id)
+            with self._stage(timings, "llm_combined_analysis"):
+                analysis_result, fraud_result, approval_advice = \
+                    await self.llm_analyzer.aanalyze_combined(customer_data)
+        else:
+            # 2. LLM智能分析
+            logger.debug("客户 %s 步骤2: LLM智能分析", customer_id)
+            with self._stage(timings, "llm_analysis"):
+                analysis_result = await self.llm_analyzer.aanalyze_multimodal_data(customer_data)
+            
+            # 3. 欺诈检测
+            logger.debug("客户 %s 步骤3: 欺诈检测", customer_id)
+            with self._stage(timings, "fraud_detection"):
+                fraud_result = await self.llm_analyzer.adetect_fraud_patterns(customer_data)
+            approval_advice = None
+        
+        # 4. 风控决策
+        logger.debug("客户 %s 步骤4: 风控决策", customer_id)
+        with self._stage(timings, "risk_decision"):
+            decision_result = self.risk_engine.make_decision(analysis_result, fraud_result, customer_data)
+        
+        # 5. 生成审批建议
+        logger.debug("客户 %s 步骤5: 生成审批建议", customer_id)
+        if approval_advice is None:
+            with self._stage(timings, "approval_advice"):
+                approval_advice = await self.llm_analyzer.agenerate_approval_advice(analysis_result, customer_data)
+        logger.debug("客户 %s 审批建议: %s", customer_id, approval_advice)
+        
+        return analysis_result, fraud_result, decision_result, approval_advice
+    
+    def batch_process_applications(self, customer_ids, max_workers=None, executor_type="thread",
+                                   max_in_flight=None, ordered=True):
         """
         批量处理客户申请
         :param customer_ids: 客户ID列表
+        :param max_workers: 并发工作线程/进程数，为None或1时顺序处理
+        :param executor_type: 执行器类型，"thread"（适合RPA/LLM等I/O密集阶段）或"process"
+        :param max_in_flight: 同时在途的申请数上限，默认为max_workers的2倍
+        :param ordered: True时按输入顺序返回结果，False时按完成顺序返回
         :return: 批量处理结果
         """
-        print(f"开始批量处理 {len(customer_ids)} 个客户申请...")
-        results = []
+        logger.info("开始批量处理 %d 个客户申请", len(customer_ids))
+        results = list(self.iter_process_applications(customer_ids, max_workers, executor_type,
+                                                      max_in_flight, ordered))
+        return [record for _, record in results]
+    
+    def iter_process_applications(self, customer_ids, max_workers=None, executor_type="thread",
+                                  max_in_flight=None, ordered=False):
+        """
+        并发处理客户申请，并以流式方式逐个产出结果
+        单个客户处理失败不会中断整个批次，失败记录中包含错误信息
+        :param customer_ids: 客户ID可迭代对象
+        :param max_workers: 并发工作线程/进程数，为None或1时顺序处理
+        :param executor_type: 执行器类型，"thread"或"process"
+        :param max_in_flight: 同时在途的申请数上限，默认为max_workers的2倍
+        :param ordered: True时按输入顺序产出，False时按完成顺序产出
+        :return: (输入序号, 处理记录) 的生成器
+        """
+        if not max_workers or max_workers <= 1:
+            for index, customer_id in enumerate(customer_ids):
+                yield index, self._process_isolated(customer_id)
+            return
         
-        for customer_id in customer_ids:
-            result = self.process_customer_application(customer_id)
-            results.append(result)
-            
-            # 打印分隔符
-            print("\\n" + "="*60 + "\\n")
+        if executor_type == "thread":
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fraud-worker")
+            task = self._process_isolated
+        elif executor_type == "process":
+            # 子进程中的本地索引和速率计数是父进程的副本，写入无法回到父进程，也看不到其他子进程的写入
+            if not isinstance(self.identity_index, SharedIdentityIndex):
+                raise ValueError("进程执行器需要使用SharedIdentityIndex共享身份标识索引，或改用WorkerCluster")
+            if not isinstance(self.feature_store, SharedFeatureStore):
+                raise ValueError("进程执行器需要使用SharedFeatureStore共享速率特征存储，或改用WorkerCluster")
+            # 系统实例只在每个子进程启动时反序列化一次，之后每个任务只传客户ID；
+            # 预先序列化使fork启动的子进程同样重建连接、锁和输出文件，而不是沿用父进程的副本
+            pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_subprocess,
+                                       initargs=(pickle.dumps(self),))
+            task = _process_in_subprocess
+        else:
+            raise ValueError(f"未知执行器类型: {executor_type}")
+        
+        max_in_flight = max_in_flight or max_workers * 2
+        pending = {}
+        buffered = {}
+        next_index = 0
+        customer_iter = enumerate(customer_ids)
+        exhausted = False
         
-        return results
+        with pool:
+            while True:
+                # 在途数量未达上限时继续提交，实现有界背压；按序产出时等待前序结果的记录也计入在途
+                while not exhausted and len(pending) + len(buffered) < max_in_flight:
+                    try:
+                        index, customer_id = next(customer_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    future = pool.submit(task, customer_id)
+                    pending[future] = (index, customer_id)
+                
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, customer_id = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as exc:
+                        # 子进程崩溃或结果无法序列化时同样只影响当前客户
+                        record = self._error_record(customer_id, exc)
+                    if executor_type == "process":
+                        # 子进程中写入的是其自身的日志副本，这里同步到主进程
+                        self._log_record(record)
+                    if ordered:
+                        buffered[index] = record
+                    else:
+                        yield index, record
+                
+                # 按输入顺序产出已就绪的连续结果
+                while next_index in buffered:
+                    yield next_index, buffered.pop(next_index)
+                    next_index += 1
     
-    def get_system_metrics(self):
+    def stream_process_applications(self, source, sink=None, checkpoint=None, max_workers=None,
+                                    executor_type="thread", max_in_flight=None,
+                                    checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
         """
-        获取系统运行指标
-        :return: 系统指标
+        流式处理客户申请：边读取边处理，按输入顺序逐条产出结果
+        在途申请数不超过max_in_flight，输入读取随处理进度推进，内存占用与输入规模无关；
+        每产出checkpoint_every条记录先刷新输出端再保存输入位置，中断后从最后保存的位置继续，
+        检查点之后已输出的记录在继续时会重复输出一次
+        :param source: 输入源，可为ApplicationSource、JSONL文件路径、queue.Queue或客户ID可迭代对象
+        :param sink: 输出端（JsonlSink等，需实现write和flush），为None时只产出记录
+        :param checkpoint: 检查点（FileCheckpoint）或检查点文件路径，为None时不保存进度
+        :param max_workers: 并发工作线程/进程数，为None或1时顺序处理
+        :param executor_type: 执行器类型，"thread"或"process"
+        :param max_in_flight: 同时在途的申请数上限，默认为max_workers的2倍
+        :param checkpoint_every: 每处理多少条申请保存一次检查点
+        :return: 处理记录的生成器
         """
-        total_processed = len(self.system_log)
-        approved_count = sum(1 for record in self.system_log if record['decision_result']['decision'] == 'APPROVE')
-        rejected_count = sum(1 for record in self.system_log if record['decision_result']['decision'] == 'REJECT')
-        review_count = sum(1 for record in self.system_log if record['decision_result']['decision'] == 'REVIEW')
+        source = as_source(source)
+        checkpoint = as_checkpoint(checkpoint)
+        start_offset = checkpoint.load() if checkpoint is not None else 0
+        if start_offset:
+            logger.info("从检查点位置 %s 继续流式处理", start_offset)
+        
+        # 已读取但尚未产出的申请对应的输入位置，长度不超过在途上限
+        offsets = deque()
+        
+        def _customer_ids():
+            for offset, customer_id in source.iter_from(start_offset):
+                offsets.append(offset)
+                yield customer_id
         
-        metrics = {
-            "total_processed": total_processed,
-            "approved": approved_count,
-            "rejected": rejected_count,
-            "under_review": review_count,
-            "approval_rate": approved_count / total_processed if total_processed > 0 else 0,
-            "rejection_rate": rejected_count / total_processed if total_processed > 0 else 0
-        }
+        committed = last_offset = start_offset
+        processed = 0
+        
+        def _commit(offset):
+            # 先刷新输出端再保存位置，保证检查点之前的记录都已落盘
+            if sink is not None:
+                sink.flush()
+            if checkpoint is not None:
+                checkpoint.save(offset, processed)
+        
+        try:
+            for _, record in self.iter_process_applications(_customer_ids(), max_workers, executor_type,
+                                                            max_in_flight, ordered=True):
+                offset = offsets.popleft()
+                if sink is not None:
+                    sink.write(record)
+                # 写入输出端之后才计入可提交的位置，写入失败的记录在继续时重新处理
+                last_offset = offset
+                processed += 1
+                yield record
+                if processed % checkpoint_every == 0:
+                    _commit(last_offset)
+                    committed = last_offset
+        finally:
+            # 正常结束或调用方提前停止时提交已产出的记录
+            if last_offset != committed:
+                _commit(last_offset)
+            logger.info("流式处理结束: 本次处理 %d 个客户申请", processed)
+    
+    def run_stream(self, source, sink=None, checkpoint=None, max_workers=None, executor_type="thread",
+                   max_in_flight=None, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        """
+        执行流式处理直到输入结束，结果只写入输出端
+        :return: 本次处理的申请数
+        """
+        processed = 0
+        for _ in self.stream_process_applications(source, sink, checkpoint, max_workers, executor_type,
+                                                  max_in_flight, checkpoint_every):
+            processed += 1
+        return processed
+    
+    async def abatch_process_applications(self, customer_ids, max_concurrency=100):
+        """
+        在事件循环中并发批量处理客户申请
+        :param customer_ids: 客户ID列表
+        :param max_concurrency: 同时在途的申请数上限
+        :return: 按输入顺序排列的处理结果
+        """
+        logger.info("开始异步批量处理 %d 个客户申请", len(customer_ids))
+        semaphore = asyncio.Semaphore(max_concurrency)
         
-        return metrics
\ No newline at end of file
+        async def _run(customer_id):
+            async with semaphore:
+                return await self._aprocess_isolated(customer_id)
+        
+        return await asyncio.gather(*(_run(customer_id) for customer_id in customer_ids))
+    
+    async def _aprocess_isolated(self, customer_id):
+        """
+        异步处理单个客户申请并隔离异常
+        :param customer_id: 客户ID
+        :return: 处理记录，失败时为错误记录
+        """
+        try:
+            return await self.aprocess_customer_application(customer_id)
+        except Exception as exc:
+            return self._record_failure(customer_id, exc)
+    
+    def _process_isolated(self, customer_id):
+        """
+        处理单个客户申请并隔离异常
+        :param customer_id: 客户ID
+        :return: 处理记录，失败时为错误记录
+        """
+        try:
+            return self.process_customer_application(customer_id)
+        except Exception as exc:
+            return self._record_failure(customer_id, exc)
+    
+    def _record_failure(self, customer_id, exc):
+        """
+        记录处理失败的客户申请
+        :param customer_id: 客户ID
+        :param exc: 异常对象
+        :return: 错误记录
+        """
+        logger.error("客户 %s 的申请处理失败: %s", customer_id, exc, exc_info=exc)
+        record = self._error_record(customer_id, exc)
+        self._log_record(record)
+        return record
+    
+    def _log_record(self, record):
+        """
+        写入系统日志并更新指标
+        :param record: 处理记录或错误记录
+        """
+        with self._log_lock:
+            self.system_log.append(record)
+        self.metrics.record_application(record["decision_result"]["decision"],
+                                        record.get("processing_time"),
+                                        record.get("stage_timings"),
+                                        tier=record.get("tier"))
+    
+    @staticmethod
+    @contextmanager
+    def _stage(timings, stage):
+        """
+        记录单个处理阶段的耗时，处于链路中时同时记录为子span
+        :param timings: 当前申请的阶段耗时字典
+        :param stage: 阶段名称
+        """
+        started = time.perf_counter()
+        try:
+            with span(stage):
+                yield
+        finally:
+            timings[stage] = time.perf_counter() - started
+    
+    def _link_identities(self, customer_data):
+        """
+        将申请的身份标识关联到团伙图，并把黑名单和团伙查询结果写入客户数据供欺诈规则使用
+        :param customer_data: 客户数据
+        """
+        identifiers = extract_identifiers(customer_data, self.rpa_collector.ocr_recognize)
+        customer_data["identity_graph"] = self.identity_index.observe(customer_data["customer_id"], identifiers)
+    
+    def _update_velocity(self, customer_data):
+        """
+        在特征存储中记录本次申请，并把速率特征写入客户数据供欺诈规则和决策规则使用；
+        同一申请再次调用时只补充新增的实体
+        :param customer_data: 客户数据
+        """
+        customer_data["velocity"] = self.feature_store.observe(
+            velocity_entities(customer_data),
+            velocity_amounts(customer_data, self.feature_store.amount_window("claims")),
+            previous=dict.get(customer_data, "velocity")
+        )
+    
+    @staticmethod
+    def _error_record(customer_id, exc):
+        """构造处理失败的记录"""
+        return ProcessRecord(
+            customer_id=customer_id,
+            status="ERROR",
+            error=f"{type(exc).__name__}: {exc}",
+            decision_result=DecisionResult(decision="ERROR"),
+            completed_at=__import__('datetime').datetime.now().isoformat()
+        )
+    
+    def get_system_metrics(self):
+        """
+        获取系统运行指标快照，开销与已处理的记录数无关
+        :return: 累计计数与比率、预筛跳过大模型的比例、最近1分钟/5分钟/1小时的速率、各决策延迟直方图和各阶段耗时
+        """
+        metrics = summarize_metrics(self.metrics.snapshot())
+        if self.cache is not None:
+            metrics["cache"] = self.cache.get_stats()
+        if self.process_executor.feedback_queue is not None:
+            metrics["feedback"] = self.process_executor.feedback_queue.get_stats()
+        metrics["identity_index"] = self.identity_index.get_stats()
+        metrics["velocity"] = self.feature_store.get_stats()
+        if self.process_executor.notifier is not None:
+            metrics["notifications"] = self.process_executor.notifier.get_stats()
+        if self.rpa_collector.ocr_engine is not None:
+            metrics["ocr"] = self.rpa_collector.ocr_engine.get_stats()
+        if self.llm_analyzer.client is not None:
+            metrics["llm_client"] = self.llm_analyzer.client.get_stats()
+        
+        return metrics
+    
+    def close(self):
+        """停止后台线程，删除下载文档的落盘目录，并关闭日志存储、追踪导出器和缓存"""
+        self.llm_analyzer.close()
+        self.rpa_collector.session_pool.close()
+        if self.rpa_collector.ocr_engine is not None:
+            self.rpa_collector.ocr_engine.close()
+        self.rpa_collector.collected_data.close()
+        remove_document_dir()
+        self.process_executor.close()
+        self.system_log.close()
+        if self.tracer is not None:
+            self.tracer.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+        self.identity_index.close()
+
+
+def summarize_metrics(snapshot):
+    """
+    由指标快照计算系统指标
+    :param snapshot: MetricsCollector.snapshot()的结果
+    :return: 累计计数与比率、预筛跳过大模型的比例、窗口速率、各决策延迟直方图和各阶段耗时
+    """
+    counts = snapshot["decision_counts"]
+    total_processed = snapshot["total_processed"]
+    approved_count = counts.get("APPROVE", 0)
+    rejected_count = counts.get("REJECT", 0)
+    skipped_model = snapshot["tier_counts"].get(TIER_PRESCREEN, 0)
+    model_decided = snapshot["tier_counts"].get(TIER_MODEL, 0)
+    
+    return {
+        "total_processed": total_processed,
+        "approved": approved_count,
+        "rejected": rejected_count,
+        "under_review": counts.get("REVIEW", 0),
+        "errors": counts.get("ERROR", 0),
+        "approval_rate": approved_count / total_processed if total_processed > 0 else 0,
+        "rejection_rate": rejected_count / total_processed if total_processed > 0 else 0,
+        "prescreen": {
+            "skipped_model": skipped_model,
+            "escalated_to_model": model_decided,
+            "skip_rate": skipped_model / (skipped_model + model_decided) if skipped_model + model_decided else 0
+        },
+        "rates": snapshot["rates"],
+        "latency": snapshot["latency"],
+        "stages": snapshot["stages"]
+    }
+
+
+# 子进程持有的系统实例副本，由_init_subprocess在子进程启动时设置
+_subprocess_system = None
+
+
+def _init_subprocess(payload):
+    """
+    进程池子进程的初始化函数：重建系统实例副本供该进程的所有任务复用，
+    并在子进程退出时发送完反馈队列中的事件和待发送的通知
+    :param payload: 序列化的风控系统实例
+    """
+    global _subprocess_system
+    system = pickle.loads(payload)
+    _subprocess_system = system
+    multiprocessing.util.Finalize(None, system.process_executor.close, exitpriority=10)
+
+
+def _process_in_subprocess(customer_id):
+    """
+    在子进程中处理单个客户申请，只返回处理记录
+    :param customer_id: 客户ID
+    :return: 处理记录
+    """
+    return _subprocess_system._process_isolated(customer_id)
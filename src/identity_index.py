@@ -0,0 +1,479 @@
+"""
+身份标识索引模块
+以规范化后的手机号、身份证号、姓名和住址为键建立索引：黑名单查询为O(1)哈希查找，
+各申请共用的身份标识通过并查集增量关联，新申请到达时即可发现团伙欺诈；
+索引以紧凑的numpy数组保存（每个标识约33字节，不为单个标识创建Python对象），
+持久化为快照加操作日志，启动时从快照向量化重建哈希表后重放日志
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from .logging_utils import get_logger
+
+logger = get_logger("identity_index")
+
+# 身份标识类型
+KIND_PHONE = "phone"
+KIND_ID_NUMBER = "id_number"
+KIND_NAME = "name"
+KIND_ADDRESS = "address"
+# 内部使用的客户节点类型，用于统计团伙中的客户数
+KIND_CUSTOMER = "customer"
+
+# 默认参与关联的标识类型；姓名重名普遍，只用于黑名单查询
+DEFAULT_LINK_KINDS = (KIND_PHONE, KIND_ID_NUMBER, KIND_ADDRESS)
+# 命中即视为黑名单客户的强标识类型，其余类型的命中单独报告
+DEFAULT_STRONG_KINDS = (KIND_PHONE, KIND_ID_NUMBER)
+# 初始节点容量
+DEFAULT_INITIAL_CAPACITY = 1 << 16
+# 操作日志累计多少条后自动写快照
+DEFAULT_SNAPSHOT_EVERY = 100000
+
+# 节点标记位
+_FLAG_BLACKLISTED = 1
+_FLAG_CUSTOMER = 2
+
+SNAPSHOT_FILE = "snapshot.npz"
+JOURNAL_FILE = "journal.jsonl"
+# 快照中保存的索引数组
+_SNAPSHOT_ARRAYS = ("node_keys", "parent", "size", "customers", "blacklisted", "flags")
+
+
+def normalize_phone(value):
+    """
+    手机号只保留数字，去掉国际区号；脱敏号码（如138****1234）大量客户共用同一取值，
+    既不能用于关联也不能作为黑名单键，返回None
+    """
+    phone = re.sub(r"[^\d*]", "", str(value))
+    if "*" in phone:
+        return None
+    if phone.startswith("0086"):
+        phone = phone[4:]
+    elif phone.startswith("86") and len(phone) == 13:
+        phone = phone[2:]
+    return phone or None
+
+
+def normalize_id_number(value):
+    """身份证号去掉空白，校验位统一为大写"""
+    return re.sub(r"\s", "", str(value)).upper() or None
+
+
+def normalize_name(value):
+    """姓名统一全角半角并去掉空白和间隔号"""
+    return re.sub(r"[\s·•.]", "", unicodedata.normalize("NFKC", str(value))) or None
+
+
+def normalize_address(value):
+    """住址统一全角半角并去掉空白和标点"""
+    return re.sub(r"[\W_]", "", unicodedata.normalize("NFKC", str(value))) or None
+
+
+NORMALIZERS = {
+    KIND_PHONE: normalize_phone,
+    KIND_ID_NUMBER: normalize_id_number,
+    KIND_NAME: normalize_name,
+    KIND_ADDRESS: normalize_address
+}
+
+
+def identity_key(kind, value):
+    """
+    计算身份标识的64位哈希键
+    :param kind: 标识类型
+    :param value: 规范化后的标识值
+    :return: 非零整数
+    """
+    digest = hashlib.blake2b(f"{kind}:{value}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+def extract_identifiers(customer_data, ocr=None):
+    """
+    从已采集的数据源中提取规范化的身份标识，不会触发尚未采集的数据源
+    :param customer_data: 客户数据
+    :param ocr: OCR识别函数（如RPADataCollector.ocr_recognize），用于从身份证正面提取身份证号、姓名和住址
+    :return: 去重排序后的 [标识类型, 标识值] 列表
+    """
+    raw = []
+    phone_info = dict.get(customer_data, "phone_info")
+    if isinstance(phone_info, dict):
+        raw.append((KIND_PHONE, phone_info.get("phone_number")))
+        raw.append((KIND_NAME, phone_info.get("real_name")))
+    id_card = dict.get(customer_data, "id_card")
+    if ocr is not None and isinstance(id_card, dict) and id_card.get("front"):
+        recognized = ocr(id_card["front"])
+        raw.append((KIND_ID_NUMBER, recognized.get("id_number")))
+        raw.append((KIND_NAME, recognized.get("name")))
+        raw.append((KIND_ADDRESS, recognized.get("address")))
+
+    identifiers = set()
+    for kind, value in raw:
+        if value:
+            normalized = NORMALIZERS[kind](value)
+            if normalized:
+                identifiers.add((kind, normalized))
+    return [list(identifier) for identifier in sorted(identifiers)]
+
+
+def _build_table(node_keys, capacity):
+    """
+    向量化构建线性探测哈希表，表中保存节点编号+1，0表示空位
+    按起始位置排序后依次放入，每个键的位置为 max(起始位置, 前一个键的位置+1)，用累积最大值一次算出；
+    探测越过表尾的少量键回绕到表头逐个放入
+    :param node_keys: 各节点的哈希键
+    :param capacity: 表容量（2的幂）
+    :return: int32数组
+    """
+    table = np.zeros(capacity, dtype=np.int32)
+    homes = (node_keys & np.uint64(capacity - 1)).astype(np.int64)
+    order = np.argsort(homes, kind="stable")
+    homes = homes[order]
+    steps = np.arange(len(homes))
+    positions = np.maximum.accumulate(homes - steps) + steps if len(homes) else homes
+    inside = positions < capacity
+    table[positions[inside]] = order[inside].astype(np.int32) + 1
+    position = 0
+    for node in order[~inside]:
+        while table[position]:
+            position += 1
+        table[position] = node + 1
+    return table
+
+
+class IdentityIndex:
+    """
+    身份标识索引与团伙关联图
+    节点为身份标识和客户，同一申请中的客户节点与其关联类标识合并到同一连通分量；
+    连通分量的根节点上维护客户数和黑名单标识数，查询时O(1)得到团伙规模和是否关联黑名单
+    """
+
+    def __init__(self, path=None, link_kinds=DEFAULT_LINK_KINDS, strong_kinds=DEFAULT_STRONG_KINDS,
+                 initial_capacity=DEFAULT_INITIAL_CAPACITY, snapshot_every=DEFAULT_SNAPSHOT_EVERY,
+                 read_only=False):
+        """
+        初始化身份标识索引
+        :param path: 持久化目录（快照和操作日志），为None时只在内存中维护
+        :param link_kinds: 参与团伙关联的标识类型
+        :param strong_kinds: 命中即计为黑名单命中的标识类型
+        :param initial_capacity: 初始节点容量，预计规模较大时可预先设置以减少扩容
+        :param snapshot_every: 操作日志累计多少条后自动写快照
+        :param read_only: 只读模式，变更只作用于内存不写入磁盘（进程池子进程使用）
+        """
+        self.path = path
+        self.link_kinds = tuple(link_kinds)
+        self.strong_kinds = tuple(strong_kinds)
+        self.initial_capacity = initial_capacity
+        self.snapshot_every = snapshot_every
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._journal = None
+        self._journal_entries = 0
+        self._reset(initial_capacity)
+        if path:
+            self._load()
+
+    def _reset(self, capacity):
+        """初始化空索引"""
+        capacity = 1 << max(4, int(capacity - 1).bit_length())
+        self._count = 0
+        self._node_keys = np.zeros(capacity, dtype=np.uint64)
+        self._parent = np.zeros(capacity, dtype=np.int32)
+        self._size = np.zeros(capacity, dtype=np.int32)
+        self._customers = np.zeros(capacity, dtype=np.int32)
+        self._blacklisted = np.zeros(capacity, dtype=np.int32)
+        self._flags = np.zeros(capacity, dtype=np.uint8)
+        self._table = np.zeros(capacity * 2, dtype=np.int32)
+
+    # ---- 持久化 ----
+
+    def _load(self):
+        """从快照重建索引并重放操作日志"""
+        os.makedirs(self.path, exist_ok=True)
+        snapshot_path = os.path.join(self.path, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with np.load(snapshot_path) as snapshot:
+                self._restore_arrays(snapshot)
+
+        journal_path = os.path.join(self.path, JOURNAL_FILE)
+        replayed = 0
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写入中断的最后一行
+                        break
+                    self._apply(entry)
+                    replayed += 1
+        self._journal_entries = replayed
+        if not self.read_only:
+            self._journal = open(journal_path, "a", encoding="utf-8")
+        logger.info("身份标识索引加载完成: %d 个节点，重放 %d 条操作日志", self._count, replayed)
+
+    def _log(self, entry):
+        """追加写入操作日志，累计到阈值时写快照"""
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._journal.flush()
+        self._journal_entries += 1
+        if self._journal_entries >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        写入快照并清空操作日志；快照先写临时文件再改名，
+        改名后、清空日志前中断时重放的操作是幂等的
+        """
+        if not self.path or self.read_only:
+            return
+        with self._lock:
+            count = self._write_arrays(os.path.join(self.path, SNAPSHOT_FILE))
+            self._journal.truncate(0)
+            self._journal.seek(0)
+            self._journal_entries = 0
+        logger.info("身份标识索引快照已写入: %d 个节点", count)
+
+    def _restore_arrays(self, snapshot):
+        """
+        用快照中的数组重建索引
+        :param snapshot: np.load打开的快照
+        """
+        count = int(snapshot["node_keys"].shape[0])
+        self._reset(max(self.initial_capacity, count * 2))
+        for name in _SNAPSHOT_ARRAYS:
+            getattr(self, f"_{name}")[:count] = snapshot[name]
+        self._count = count
+        self._table = _build_table(self._node_keys[:count], len(self._table))
+
+    def _write_arrays(self, snapshot_path, **extra):
+        """
+        把索引数组写入快照文件，先写临时文件再改名
+        :param snapshot_path: 快照文件路径
+        :param extra: 随快照保存的其他数组
+        :return: 快照中的节点数
+        """
+        count = self._count
+        temp_path = snapshot_path + ".tmp.npz"
+        np.savez(temp_path, **{name: getattr(self, f"_{name}")[:count] for name in _SNAPSHOT_ARRAYS}, **extra)
+        os.replace(temp_path, snapshot_path)
+        return count
+
+    # ---- 哈希表与并查集 ----
+
+    def _find_slot(self, key):
+        """
+        查找键所在的节点
+        :param key: 哈希键
+        :return: (节点编号，不存在时为-1, 探测结束的位置)
+        """
+        table = self._table
+        mask = len(table) - 1
+        position = key & mask
+        while True:
+            entry = int(table[position])
+            if entry == 0:
+                return -1, position
+            if int(self._node_keys[entry - 1]) == key:
+                return entry - 1, position
+            position = (position + 1) & mask
+
+    def _node(self, key, create=False, flags=0):
+        """
+        获取键对应的节点
+        :param key: 哈希键
+        :param create: 不存在时是否创建
+        :param flags: 新节点的标记位
+        :return: 节点编号，不存在且不创建时为-1
+        """
+        node, position = self._find_slot(key)
+        if node >= 0 or not create:
+            return node
+        if self._count >= len(self._node_keys):
+            self._grow()
+            _, position = self._find_slot(key)
+        node = self._count
+        self._count += 1
+        self._node_keys[node] = key
+        self._parent[node] = node
+        self._size[node] = 1
+        self._customers[node] = 1 if flags & _FLAG_CUSTOMER else 0
+        self._blacklisted[node] = 0
+        self._flags[node] = flags
+        self._table[position] = node + 1
+        return node
+
+    def _grow(self):
+        """节点容量翻倍并重建哈希表，装载因子保持在0.5以下"""
+        capacity = len(self._node_keys) * 2
+        for name in ("node_keys", "parent", "size", "customers", "blacklisted", "flags"):
+            old = getattr(self, f"_{name}")
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, f"_{name}", grown)
+        self._table = _build_table(self._node_keys[:self._count], capacity * 2)
+
+    def _find(self, node):
+        """查找根节点，路径减半压缩"""
+        parent = self._parent
+        while True:
+            up = int(parent[node])
+            if up == node:
+                return node
+            grand = int(parent[up])
+            parent[node] = grand
+            node = grand
+
+    def _union(self, a, b):
+        """按规模合并两个连通分量，合并根节点上的计数"""
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return root_a
+        if self._size[root_a] < self._size[root_b]:
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._size[root_a] += self._size[root_b]
+        self._customers[root_a] += self._customers[root_b]
+        self._blacklisted[root_a] += self._blacklisted[root_b]
+        return root_a
+
+    def _apply(self, entry):
+        """执行一条操作（写入操作日志或重放），操作均为幂等"""
+        op = entry[0]
+        if op == "link":
+            customer = self._node(entry[1], create=True, flags=_FLAG_CUSTOMER)
+            for key in entry[2]:
+                self._union(customer, self._node(key, create=True))
+        elif op == "blacklist":
+            for key in entry[1]:
+                node = self._node(key, create=True)
+                if not self._flags[node] & _FLAG_BLACKLISTED:
+                    self._flags[node] |= _FLAG_BLACKLISTED
+                    self._blacklisted[self._find(node)] += 1
+
+    # ---- 公共接口 ----
+
+    def check(self, identifiers, customer_id=None):
+        """
+        查询身份标识的黑名单命中情况和所在团伙，不修改索引
+        :param identifiers: [标识类型, 标识值] 列表（extract_identifiers的结果）
+        :param customer_id: 客户ID，已关联过的客户同时按客户节点查询团伙
+        :return: identifiers、blacklist_hits（强标识命中的类型）、weak_blacklist_hits（其他类型命中）、
+                 ring_customers（所在团伙的客户数）、ring_size（团伙中的节点数）、ring_blacklisted（团伙是否关联黑名单）
+        """
+        strong_hits, weak_hits = set(), set()
+        roots = set()
+        with self._lock:
+            nodes = [(kind, self._node(identity_key(kind, value))) for kind, value in identifiers]
+            if customer_id is not None:
+                nodes.append((KIND_CUSTOMER, self._node(identity_key(KIND_CUSTOMER, customer_id))))
+            for kind, node in nodes:
+                if node < 0:
+                    continue
+                if self._flags[node] & _FLAG_BLACKLISTED:
+                    (strong_hits if kind in self.strong_kinds else weak_hits).add(kind)
+                if kind == KIND_CUSTOMER or kind in self.link_kinds:
+                    roots.add(self._find(node))
+            ring_customers = sum(int(self._customers[root]) for root in roots)
+            ring_size = sum(int(self._size[root]) for root in roots)
+            ring_blacklisted = any(self._blacklisted[root] > 0 for root in roots)
+        return {
+            "identifiers": identifiers,
+            "blacklist_hits": sorted(strong_hits),
+            "weak_blacklist_hits": sorted(weak_hits),
+            "ring_customers": ring_customers,
+            "ring_size": ring_size,
+            "ring_blacklisted": ring_blacklisted
+        }
+
+    def link(self, customer_id, identifiers):
+        """
+        将客户与其关联类身份标识合并到同一团伙
+        :param customer_id: 客户ID
+        :param identifiers: [标识类型, 标识值] 列表
+        """
+        keys = [identity_key(kind, value) for kind, value in identifiers if kind in self.link_kinds]
+        entry = ["link", identity_key(KIND_CUSTOMER, customer_id), keys]
+        with self._lock:
+            self._apply(entry)
+            self._log(entry)
+
+    def observe(self, customer_id, identifiers):
+        """
+        关联新申请并返回查询结果，新申请与已有申请共用标识时立即体现在团伙规模中
+        :param customer_id: 客户ID
+        :param identifiers: [标识类型, 标识值] 列表
+        :return: 查询结果，见check
+        """
+        with self._lock:
+            self.link(customer_id, identifiers)
+            return self.check(identifiers, customer_id)
+
+    def blacklist(self, identifiers):
+        """
+        将身份标识加入黑名单
+        :param identifiers: [标识类型, 标识值] 列表
+        """
+        entry = ["blacklist", [identity_key(kind, value) for kind, value in identifiers]]
+        with self._lock:
+            self._apply(entry)
+            self._log(entry)
+
+    def is_blacklisted(self, kind, value):
+        """
+        查询单个身份标识是否在黑名单中
+        :param kind: 标识类型
+        :param value: 标识值（未规范化的原始值也可）
+        :return: 是否在黑名单中
+        """
+        normalized = NORMALIZERS[kind](value) if kind in NORMALIZERS else value
+        with self._lock:
+            node = self._node(identity_key(kind, normalized))
+            return node >= 0 and bool(self._flags[node] & _FLAG_BLACKLISTED)
+
+    def get_stats(self):
+        """
+        获取索引统计
+        :return: 节点数、客户数、黑名单标识数、节点容量和数组占用字节数
+        """
+        with self._lock:
+            count = self._count
+            flags = self._flags[:count]
+            arrays = (self._node_keys, self._parent, self._size, self._customers, self._blacklisted,
+                      self._flags, self._table)
+            return {
+                "nodes": count,
+                "customers": int(np.count_nonzero(flags & _FLAG_CUSTOMER)),
+                "blacklisted": int(np.count_nonzero(flags & _FLAG_BLACKLISTED)),
+                "capacity": len(self._node_keys),
+                "memory_bytes": sum(array.nbytes for array in arrays)
+            }
+
+    def close(self):
+        """写入快照并关闭操作日志"""
+        with self._lock:
+            if self._journal is not None:
+                if self._journal_entries:
+                    self.snapshot()
+                self._journal.close()
+                self._journal = None
+
+    def __getstate__(self):
+        """序列化到子进程时只携带配置，子进程从磁盘以只读模式加载"""
+        return {"path": self.path, "link_kinds": self.link_kinds, "strong_kinds": self.strong_kinds,
+                "initial_capacity": self.initial_capacity, "snapshot_every": self.snapshot_every,
+                "read_only": True}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
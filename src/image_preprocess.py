@@ -0,0 +1,329 @@
+"""
+图像预处理模块
+证件照片和收入证明在送入OCR和多模态模型前统一预处理：解码一次（按EXIF方向摆正），
+裁剪到文档区域，按OCR目标分辨率或模型图像token预算缩小，送模型的图像重新压缩编码后落盘
+"""
+
+import base64
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from .documents import DocumentRef, document_dir, remove_documents
+
+# PDF页面默认渲染分辨率，也是OCR的目标分辨率
+DEFAULT_OCR_DPI = 300
+# 每张图像的默认token预算（高细节模式下约为2x2个512像素切片）
+DEFAULT_VISION_MAX_TOKENS = 765
+# 模型图像的最大边长与短边上限，超出部分模型侧也会缩小，上传前缩小可减少上传字节
+VISION_MAX_SIDE = 2048
+VISION_SHORT_SIDE = 768
+# 送模型图像的JPEG质量
+DEFAULT_JPEG_QUALITY = 80
+# 每个进程缓存的已解码页面图像的总字节数上限（300dpi的A4彩色页面约25MB）
+DECODED_CACHE_MAX_BYTES = 128 * 1024 * 1024
+# 裁剪检测时使用的缩略图边长
+CROP_PROBE_SIDE = 512
+
+_decoded_cache = OrderedDict()
+_decoded_bytes = 0
+_decoded_lock = threading.Lock()
+
+
+def _require(module_name, package):
+    """按需导入图像处理依赖，缺失时给出安装提示"""
+    try:
+        return __import__(module_name, fromlist=["_"])
+    except ImportError as exc:
+        raise ImportError(f"图像处理功能需要安装 {package}（pip install {package}）") from exc
+
+
+def is_pdf(path):
+    """
+    判断文件是否为PDF
+    :param path: 文件路径
+    :return: 是否为PDF
+    """
+    with open(path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def page_count(path):
+    """
+    获取文档页数，图片为1页，多帧TIFF按帧计数
+    :param path: 文件路径
+    :return: 页数
+    """
+    if is_pdf(path):
+        fitz = _require("fitz", "PyMuPDF")
+        with fitz.open(path) as document:
+            return document.page_count
+    image_module = _require("PIL.Image", "Pillow")
+    with image_module.open(path) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def _source_prefix(path):
+    """按原始文件路径生成送模型图像的文件名前缀，同一文件各页和各参数的结果前缀相同"""
+    return hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+
+
+def _file_key(path, *params):
+    """按文件路径、修改时间和大小构造缓存键"""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size) + params
+
+
+def _image_bytes(image):
+    """估算已解码图像占用的内存字节数"""
+    return image.width * image.height * len(image.getbands())
+
+
+def _cached(key, build):
+    """
+    在进程内的LRU缓存中查找图像，未命中时构建并缓存；
+    缓存按图像占用的字节数计量，超出DECODED_CACHE_MAX_BYTES时淘汰最久未使用的图像，单张超出上限的图像不缓存
+    """
+    global _decoded_bytes
+    with _decoded_lock:
+        image = _decoded_cache.get(key)
+        if image is not None:
+            _decoded_cache.move_to_end(key)
+            return image
+    image = build()
+    size = _image_bytes(image)
+    if size > DECODED_CACHE_MAX_BYTES:
+        return image
+    with _decoded_lock:
+        previous = _decoded_cache.pop(key, None)
+        if previous is not None:
+            _decoded_bytes -= _image_bytes(previous)
+        _decoded_cache[key] = image
+        _decoded_bytes += size
+        while _decoded_bytes > DECODED_CACHE_MAX_BYTES:
+            _, evicted = _decoded_cache.popitem(last=False)
+            _decoded_bytes -= _image_bytes(evicted)
+    return image
+
+
+def load_page(path, page=0, dpi=DEFAULT_OCR_DPI):
+    """
+    解码文档的单页为按EXIF方向摆正的RGB图像，同一文件内容的页面在当前进程内只解码一次
+    :param path: 文件路径
+    :param page: 页码，从0开始
+    :param dpi: PDF渲染分辨率
+    :return: PIL.Image，缓存中的图像会被复用，调用方不应原地修改
+    """
+    def decode():
+        image_module = _require("PIL.Image", "Pillow")
+        if is_pdf(path):
+            fitz = _require("fitz", "PyMuPDF")
+            with fitz.open(path) as document:
+                pixmap = document.load_page(page).get_pixmap(dpi=dpi)
+                image = image_module.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+            image.info["dpi"] = (dpi, dpi)
+            return image
+        image_ops = _require("PIL.ImageOps", "Pillow")
+        with image_module.open(path) as source:
+            source.seek(page)
+            source_dpi = source.info.get("dpi")
+            image = image_ops.exif_transpose(source).convert("RGB")
+        if source_dpi:
+            image.info["dpi"] = source_dpi
+        return image
+
+    return _cached(_file_key(path, "page", page, dpi), decode)
+
+
+def crop_to_document(image, threshold=24, margin=0.01):
+    """
+    裁剪掉与边角背景色相近的边缘，保留文档区域；在缩略图上检测边界以降低开销
+    :param image: PIL.Image
+    :param threshold: 与背景色的灰度差阈值
+    :param margin: 保留的边距（占边长的比例）
+    :return: 裁剪后的图像，未检测到明显背景时返回原图
+    """
+    image_module = _require("PIL.Image", "Pillow")
+    image_chops = _require("PIL.ImageChops", "Pillow")
+    probe = image.convert("L")
+    probe.thumbnail((CROP_PROBE_SIDE, CROP_PROBE_SIDE))
+    background = image_module.new("L", probe.size, probe.getpixel((0, 0)))
+    mask = image_chops.difference(probe, background).point(lambda value: 255 if value > threshold else 0)
+    box = mask.getbbox()
+    if box is None:
+        return image
+
+    scale_x = image.width / probe.width
+    scale_y = image.height / probe.height
+    pad_x = image.width * margin
+    pad_y = image.height * margin
+    left = max(0, int(box[0] * scale_x - pad_x))
+    top = max(0, int(box[1] * scale_y - pad_y))
+    right = min(image.width, int(math.ceil(box[2] * scale_x + pad_x)))
+    bottom = min(image.height, int(math.ceil(box[3] * scale_y + pad_y)))
+    if (right - left) * (bottom - top) >= 0.95 * image.width * image.height:
+        return image
+    return image.crop((left, top, right, bottom))
+
+
+def vision_tokens(width, height, detail="high"):
+    """
+    估算多模态模型对一张图像计费的token数：
+    先缩放到最大边2048以内、短边不超过768，再按512像素切片计数
+    :param width: 图像宽度
+    :param height: 图像高度
+    :param detail: 细节模式，"low"时固定为85
+    :return: token数
+    """
+    if detail == "low":
+        return 85
+    scale = min(1.0, VISION_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, VISION_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+class PreparedImage:
+    """
+    预处理后待上传的图像
+    """
+
+    __slots__ = ("document", "width", "height", "size", "tokens", "media_type")
+
+    def __init__(self, document, width, height, media_type="image/jpeg"):
+        """
+        初始化预处理结果
+        :param document: 重新编码后的图像文件（DocumentRef）
+        :param width: 宽度
+        :param height: 高度
+        :param media_type: 图像MIME类型
+        """
+        self.document = document
+        self.width = width
+        self.height = height
+        self.size = document.size()
+        self.tokens = vision_tokens(width, height)
+        self.media_type = media_type
+
+    def data_uri(self):
+        """
+        生成上传用的data URI
+        :return: data URI文本
+        """
+        with self.document.mapped() as data:
+            encoded = base64.b64encode(data).decode("ascii")
+        return f"data:{self.media_type};base64,{encoded}"
+
+
+class ImagePreprocessor:
+    """
+    图像预处理器，OCR和多模态模型共用
+    """
+
+    def __init__(self, ocr_dpi=DEFAULT_OCR_DPI, vision_max_tokens=DEFAULT_VISION_MAX_TOKENS,
+                 jpeg_quality=DEFAULT_JPEG_QUALITY, crop=True, output_dir=None):
+        """
+        初始化图像预处理器
+        :param ocr_dpi: OCR目标分辨率，高于该分辨率的图像缩小后再识别
+        :param vision_max_tokens: 送模型的单张图像token预算
+        :param jpeg_quality: 送模型图像的JPEG质量
+        :param crop: 是否裁剪到文档区域
+        :param output_dir: 重新编码图像的落盘目录，默认为下载文档目录下的prepared子目录
+        """
+        self.ocr_dpi = ocr_dpi
+        self.vision_max_tokens = vision_max_tokens
+        self.jpeg_quality = jpeg_quality
+        self.crop = crop
+        self.output_dir = output_dir
+
+    def document_image(self, path, page=0):
+        """
+        解码、摆正并裁剪文档单页，结果在当前进程内缓存，OCR和模型预处理共用
+        :param path: 文件路径
+        :param page: 页码，从0开始
+        :return: PIL.Image，调用方不应原地修改
+        """
+        if not self.crop:
+            return load_page(path, page, self.ocr_dpi)
+        return _cached(_file_key(path, "document", page, self.ocr_dpi),
+                       lambda: crop_to_document(load_page(path, page, self.ocr_dpi)))
+
+    def for_ocr(self, path, page=0):
+        """
+        生成OCR输入：灰度图像，分辨率高于OCR目标分辨率时按比例缩小
+        :param path: 文件路径
+        :param page: 页码，从0开始
+        :return: PIL.Image
+        """
+        image = self.document_image(path, page)
+        source_dpi = (image.info.get("dpi") or (0, 0))[0]
+        gray = image.convert("L")
+        if source_dpi and source_dpi > self.ocr_dpi:
+            scale = self.ocr_dpi / source_dpi
+            image_module = _require("PIL.Image", "Pillow")
+            gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                               image_module.LANCZOS)
+        return gray
+
+    def for_vision(self, path):
+        """
+        生成模型输入：文档每页缩小到token预算以内并重新编码为JPEG，
+        相同文件内容和参数的结果直接复用已落盘的文件
+        :param path: 文件路径
+        :return: PreparedImage列表，每页一个
+        """
+        return [self._prepare_page(path, page) for page in range(page_count(path))]
+
+    def _prepare_page(self, path, page):
+        """预处理单页并落盘"""
+        image_module = _require("PIL.Image", "Pillow")
+        key = _file_key(path, page, self.ocr_dpi, self.vision_max_tokens, self.jpeg_quality, self.crop)
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+        directory = self._prepared_dir()
+        output = DocumentRef(os.path.join(directory, f"{_source_prefix(path)}-{digest}.jpg"))
+        if output.exists():
+            with image_module.open(output) as existing:
+                return PreparedImage(output, existing.width, existing.height)
+
+        image = self.document_image(path, page)
+        width, height = self._vision_size(image.width, image.height)
+        if (width, height) != image.size:
+            image = image.resize((width, height), image_module.LANCZOS)
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再改名，并发预处理同一文件时不会读到不完整的图像
+        temp_path = f"{output}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(temp_path, "JPEG", quality=self.jpeg_quality, optimize=True)
+        os.replace(temp_path, output)
+        return PreparedImage(output, width, height)
+
+    def _prepared_dir(self):
+        """重新编码图像的落盘目录"""
+        return self.output_dir or os.path.join(document_dir(), "prepared")
+
+    def discard(self, path):
+        """
+        删除由指定文件生成的全部送模型图像，在该文件处理结束后调用
+        :param path: 原始文件路径
+        """
+        directory = self._prepared_dir()
+        prefix = _source_prefix(path) + "-"
+        try:
+            names = [name for name in os.listdir(directory) if name.startswith(prefix)]
+        except FileNotFoundError:
+            return
+        remove_documents(os.path.join(directory, name) for name in names)
+
+    def _vision_size(self, width, height):
+        """
+        计算送模型的图像尺寸：先缩小到模型侧会采用的尺寸，超出token预算时继续缩小
+        :param width: 原始宽度
+        :param height: 原始高度
+        :return: (宽度, 高度)
+        """
+        scale = min(1.0, VISION_MAX_SIDE / max(width, height), VISION_SHORT_SIDE / min(width, height))
+        while vision_tokens(width * scale, height * scale) > self.vision_max_tokens and min(width, height) * scale > 64:
+            scale *= 0.9
+        return max(1, round(width * scale)), max(1, round(height * scale))
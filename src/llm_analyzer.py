@@ -3,35 +3,126 @@ LLM智能分析模块
 负责多模态理解、风险评分、审批建议等功能
 """
 
+import asyncio
+import json
+import os
+
+from .async_utils import run_sync
+from .result_cache import content_key
+from .tracing import span
+from .logging_utils import get_logger
+from .rule_engine import RuleEngine
+from .records import AnalysisResult, FraudResult
+from .image_preprocess import ImagePreprocessor
+from .llm_batcher import (MicroBatcher, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS,
+                          DEFAULT_MAX_CONCURRENT_BATCHES)
+from .llm_client import ModelClient
+
+logger = get_logger("llm_analyzer")
+
+# 可跨客户合并为批量请求的模型任务
+BATCHABLE_TASKS = ("multimodal_analysis", "fraud_detection")
+# 需要附带身份证和收入证明图像的模型任务
+VISION_TASKS = ("multimodal_analysis", "combined_analysis")
+# 模型服务不可用、改用本地评分时记入degraded_sources的来源名称
+DEGRADED_SOURCE_MODEL = "llm"
+
+# 合并分析模式下模型结构化响应的字段约束
+COMBINED_RESPONSE_SCHEMA = {
+    "analysis_result": {
+        "id_analysis": {"valid": bool, "name_match": bool, "notes": str},
+        "income_analysis": {"source_reliability": str, "verification_status": str, "notes": str},
+        "form_analysis": {"coverage_reasonable": bool, "notes": str},
+        "overall_risk_score": (int, float)
+    },
+    "fraud_result": {
+        "is_fraud": bool,
+        "indicators": list,
+        "confidence": (int, float)
+    },
+    "approval_advice": str
+}
+
+
 class LLMAnalyzer:
     """
     大语言模型分析器
     模拟LLM对多模态数据的理解与分析功能
     """
     
-    def __init__(self, model_config):
+    def __init__(self, model_config, cache=None, rule_engine=None, image_preprocessor=None):
         """
         初始化LLM分析器
         :param model_config: 模型配置
+        :param cache: 结果缓存（ResultCache），为None时不缓存
+        :param rule_engine: 规则引擎（RuleEngine），为None时使用默认欺诈规则
+        :param image_preprocessor: 图像预处理器（ImagePreprocessor），为None时按模型配置的
+                                   "image_preprocessing"创建
         """
         self.model_config = model_config
+        self.cache = cache
+        self.rule_engine = rule_engine if rule_engine is not None else RuleEngine()
+        self.image_preprocessor = image_preprocessor if image_preprocessor is not None else \
+            ImagePreprocessor(**model_config.get("image_preprocessing", {}))
+        # 合并模式下一次模型调用同时产出分析结果、欺诈检测结果和审批建议
+        self.combined_mode = model_config.get("combined_analysis", False)
+        
+        # 配置"batching"后，多个客户的分析请求合并为一次批量模型调用
+        batching = model_config.get("batching")
+        
+        # 配置了模型服务地址时，远程调用经过限流、重试、对冲和熔断（"client"为ModelClient参数）；
+        # 服务不可用时改用本地确定性评分，降级的申请默认不自动批准
+        endpoint = model_config.get("endpoint") or (batching or {}).get("endpoint")
+        client_config = dict(model_config.get("client", {}))
+        self.review_on_fallback = client_config.pop("review_on_fallback", True)
+        self.client = None
+        if endpoint:
+            self.client = ModelClient(endpoint, api_key=model_config.get("api_key"),
+                                      model_name=model_config.get("model_name"),
+                                      timeout=model_config.get("timeout", 30),
+                                      max_tokens=model_config.get("max_tokens"),
+                                      vision_max_tokens=self.image_preprocessor.vision_max_tokens, **client_config)
+        self.batcher = None
+        if batching:
+            self.batcher = MicroBatcher(
+                self._handle_batch,
+                max_batch_size=batching.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE),
+                max_wait_ms=batching.get("max_wait_ms", DEFAULT_MAX_WAIT_MS),
+                max_concurrent_batches=batching.get("max_concurrent_batches", DEFAULT_MAX_CONCURRENT_BATCHES)
+            )
         
     def analyze_multimodal_data(self, data):
         """
-        多模态数据分析
+        多模态数据分析（同步接口，内部运行异步实现）
+        :param data: 输入的多模态数据
+        :return: 分析结果
+        """
+        return run_sync(self.aanalyze_multimodal_data(data))
+    
+    async def aanalyze_multimodal_data(self, data):
+        """
+        异步多模态数据分析
+        :param data: 输入的多模态数据
+        :return: 分析结果
+        """
+        logger.debug("LLM正在对多模态数据进行分析")
+        return AnalysisResult.from_dict(await self._acall_model("multimodal_analysis", data))
+    
+    def _run_multimodal_analysis(self, data):
+        """
+        模拟模型的多模态分析
         :param data: 输入的多模态数据
         :return: 分析结果
         """
-        print("LLM正在对多模态数据进行分析...")
-        
         # 分析身份证信息
-        id_analysis = self._analyze_id_card(data.get("id_card"))
+        id_analysis = self._analyze_cached("id_card", self._analyze_id_card, data.get("id_card"))
         
         # 分析收入证明
-        income_analysis = self._analyze_income_proof(data.get("income_proof"))
+        income_analysis = self._analyze_cached("income_proof", self._analyze_income_proof, data.get("income_proof"))
         
         # 分析申请表单
-        form_analysis = self._analyze_application_form(data.get("application_form"))
+        form_analysis = self._analyze_cached("application_form", self._analyze_application_form,
+                                             data.get("application_form"))
         
         # 综合分析
         analysis_result = {
@@ -43,9 +134,57 @@ class LLMAnalyzer:
         
         return analysis_result
     
+    def _analyze_cached(self, name, analyze, payload):
+        """
+        按输入内容哈希缓存单项分析结果，缓存键包含模型名称和温度
+        :param name: 分析项名称
+        :param analyze: 分析函数
+        :param payload: 分析输入
+        :return: 分析结果
+        """
+        with span(f"llm.analyze.{name}"):
+            if self.cache is None:
+                return analyze(payload)
+            key = content_key(f"llm:{name}", payload,
+                              model=self.model_config.get("model_name"),
+                              temperature=self.model_config.get("temperature"))
+            return self.cache.get_or_compute(key, lambda: analyze(payload))
+    
+    def _vision_content(self, prompt, documents):
+        """
+        构造多模态模型的消息内容，文档图像经预处理缩小并重新编码后以data URI附带
+        :param prompt: 文本提示
+        :param documents: 文档路径列表，不存在的文件（模拟采集的路径）不附带
+        :return: 消息内容列表
+        """
+        content = [{"type": "text", "text": prompt}]
+        for path in documents:
+            if not isinstance(path, str) or not os.path.isfile(path):
+                continue
+            for image in self.image_preprocessor.for_vision(path):
+                content.append({"type": "image_url", "image_url": {"url": image.data_uri(), "detail": "high"}})
+                logger.debug("附带图像 %s: %dx%d, %d 字节, 约 %d tokens",
+                             path, image.width, image.height, image.size, image.tokens)
+        return content
+    
+    def _model_request(self, task, data):
+        """
+        构造远程模型请求，文档分析任务附带身份证和收入证明图像
+        :param task: 任务名称
+        :param data: 客户数据
+        :return: (任务名称, 客户数据, 多模态消息内容)，没有可附带的图像时消息内容为None
+        """
+        if task not in VISION_TASKS:
+            return task, data, None
+        content = self._vision_content("核验身份证正反面信息", list((dict.get(data, "id_card") or {}).values()))
+        content += self._vision_content("核验收入证明材料", list(dict.get(data, "income_proof") or []))
+        if not any(part["type"] == "image_url" for part in content):
+            return task, data, None
+        return task, data, content
+    
     def _analyze_id_card(self, id_card_data):
         """分析身份证信息"""
-        print("  - 分析身份证信息")
+        logger.debug("分析身份证信息")
         # 这里可以添加更复杂的身份证分析逻辑
         return {
             "valid": True,
@@ -57,7 +196,7 @@ class LLMAnalyzer:
     
     def _analyze_income_proof(self, income_proof_data):
         """分析收入证明"""
-        print("  - 分析收入证明")
+        logger.debug("分析收入证明")
         # 这里可以添加OCR后的收入证明分析逻辑
         return {
             "monthly_income": 15000,
@@ -68,7 +207,7 @@ class LLMAnalyzer:
     
     def _analyze_application_form(self, form_data):
         """分析申请表单"""
-        print("  - 分析申请表单")
+        logger.debug("分析申请表单")
         # 分析申请表单中的信息
         return {
             "product_fit": "良好",
@@ -101,13 +240,40 @@ class LLMAnalyzer:
         # 风险评分范围：0-100，越低越好
         return min(100, base_score)
     
+    def calculate_risk_scores_batch(self, frame):
+        """
+        批量计算综合风险评分，结果与逐条调用_calculate_overall_risk_score一致
+        :param frame: 列式输入（pandas.DataFrame或列名到NumPy数组的字典），
+                      字段见batch_scoring.ANALYSIS_COLUMNS
+        :return: NumPy整数数组
+        """
+        from .batch_scoring import calculate_risk_scores
+        return calculate_risk_scores(frame)
+    
     def generate_approval_advice(self, analysis_result, customer_data):
         """
-        生成审批建议
+        生成审批建议（同步接口，内部运行异步实现）
+        :param analysis_result: 分析结果
+        :param customer_data: 客户数据
+        :return: 审批建议
+        """
+        return run_sync(self.agenerate_approval_advice(analysis_result, customer_data))
+    
+    async def agenerate_approval_advice(self, analysis_result, customer_data):
+        """
+        异步生成审批建议
         :param analysis_result: 分析结果
         :param customer_data: 客户数据
         :return: 审批建议
         """
+        return self._build_approval_advice(analysis_result)
+    
+    def _build_approval_advice(self, analysis_result):
+        """
+        根据分析结果生成审批建议文本
+        :param analysis_result: 分析结果
+        :return: 审批建议
+        """
         risk_score = analysis_result["overall_risk_score"]
         
         if risk_score < 20:
@@ -133,26 +299,179 @@ class LLMAnalyzer:
     
     def detect_fraud_patterns(self, data):
         """
-        检测欺诈模式
+        检测欺诈模式（同步接口，内部运行异步实现）
         :param data: 客户数据
         :return: 欺诈检测结果
         """
-        print("LLM正在检测欺诈模式...")
-        
-        # 模拟欺诈检测逻辑
-        fraud_indicators = []
-        
-        # 检查一些常见的欺诈指标
-        if data.get("application_form", {}).get("insurance_amount", 0) > 1000000:
-            fraud_indicators.append("保险金额异常高")
-        
-        # 检查历史记录
-        history = data.get("history_records", [])
-        if len(history) == 0:
-            fraud_indicators.append("无历史保单记录")
-        
-        return {
-            "is_fraud": len(fraud_indicators) > 0,
-            "indicators": fraud_indicators,
-            "confidence": len(fraud_indicators) / 10.0 if fraud_indicators else 0
-        }
\ No newline at end of file
+        return run_sync(self.adetect_fraud_patterns(data))
+    
+    async def adetect_fraud_patterns(self, data):
+        """
+        异步检测欺诈模式
+        :param data: 客户数据
+        :return: 欺诈检测结果
+        """
+        logger.debug("LLM正在检测欺诈模式")
+        return FraudResult.from_dict(await self._acall_model("fraud_detection", data))
+    
+    def _run_fraud_detection(self, data):
+        """
+        模拟模型的欺诈模式检测
+        :param data: 客户数据
+        :return: 欺诈检测结果
+        """
+        # 欺诈指标由规则引擎按配置的规则检查（数据源降级时对应字段为None，不命中）
+        return self.rule_engine.evaluate_fraud(data)
+    
+    def analyze_combined(self, data):
+        """
+        合并分析（同步接口，内部运行异步实现）
+        :param data: 客户数据
+        :return: (分析结果, 欺诈检测结果, 审批建议)
+        """
+        return run_sync(self.aanalyze_combined(data))
+    
+    async def aanalyze_combined(self, data):
+        """
+        异步合并分析：一次模型调用同时完成多模态分析、欺诈检测和审批建议，
+        客户数据只发送一次；响应解析或校验失败时回退到逐项调用
+        :param data: 客户数据
+        :return: (分析结果, 欺诈检测结果, 审批建议)
+        """
+        logger.debug("LLM正在进行合并分析（多模态分析 + 欺诈检测 + 审批建议）")
+        response_text = await self._acall_model("combined_analysis", data)
+        try:
+            response = self._parse_combined_response(response_text)
+        except ValueError as exc:
+            logger.warning("合并分析响应无效（%s），回退到逐项分析", exc)
+            analysis_result = await self.aanalyze_multimodal_data(data)
+            fraud_result = await self.adetect_fraud_patterns(data)
+            approval_advice = await self.agenerate_approval_advice(analysis_result, data)
+            return analysis_result, fraud_result, approval_advice
+        return (AnalysisResult.from_dict(response["analysis_result"]), FraudResult.from_dict(response["fraud_result"]),
+                response["approval_advice"])
+    
+    def _run_combined_analysis(self, data):
+        """
+        模拟模型的合并分析，返回JSON格式的结构化响应文本
+        :param data: 客户数据
+        :return: 响应文本
+        """
+        analysis_result = self._run_multimodal_analysis(data)
+        return json.dumps({
+            "analysis_result": analysis_result,
+            "fraud_result": self._run_fraud_detection(data),
+            "approval_advice": self._build_approval_advice(analysis_result)
+        }, ensure_ascii=False)
+    
+    def _parse_combined_response(self, response_text):
+        """
+        解析并校验合并分析的模型响应
+        :param response_text: 模型响应文本
+        :return: 响应字典
+        """
+        try:
+            response = json.loads(response_text)
+        except (TypeError, json.JSONDecodeError) as exc:
+            raise ValueError(f"响应不是合法JSON: {exc}") from exc
+        _validate_schema(response, COMBINED_RESPONSE_SCHEMA, "response")
+        return response
+    
+    async def _acall_model(self, task, data):
+        """
+        调用模型执行指定任务，所有模型请求都经过此入口
+        启用批处理时，可批处理的任务进入微批队列与其他客户的请求合并发送；
+        配置了模型服务地址时经模型客户端远程调用，服务不可用时改用本地评分
+        :param task: 任务名称
+        :param data: 客户数据
+        :return: 模型输出
+        """
+        with span(f"llm.{task}", model=self.model_config.get("model_name")) as model_span:
+            if self.batcher is not None and task in BATCHABLE_TASKS:
+                if model_span is not None:
+                    model_span.set_attribute("batched", True)
+                call = self.batcher.asubmit((task, data))
+            elif self.client is not None:
+                call = asyncio.get_running_loop().run_in_executor(
+                    None, lambda: self.client.call_batch([self._model_request(task, data)])[0])
+            else:
+                return self._run_task(task, data)
+            
+            if self.client is None:
+                return await call
+            try:
+                return await call
+            except Exception as exc:
+                return self._fallback(task, data, exc, model_span)
+    
+    def _fallback(self, task, data, exc, model_span):
+        """
+        模型服务不可用（重试耗尽或熔断）时改用本地确定性评分
+        :param task: 任务名称
+        :param data: 客户数据
+        :param exc: 模型调用的异常
+        :param model_span: 当前模型调用的span
+        :return: 本地评分结果
+        """
+        logger.warning("模型服务不可用，任务 %s 改用本地规则评分: %s", task, exc)
+        self.client.record_fallback()
+        if model_span is not None:
+            model_span.set_attribute("fallback", True)
+        if self.review_on_fallback:
+            # 降级记录进入degraded_sources，决策阶段不会自动批准
+            degraded_sources = dict.get(data, "degraded_sources")
+            if isinstance(degraded_sources, list) and DEGRADED_SOURCE_MODEL not in degraded_sources:
+                degraded_sources.append(DEGRADED_SOURCE_MODEL)
+        return self._run_task(task, data)
+    
+    def _run_task(self, task, data):
+        """
+        本地模拟模型执行单个任务
+        :param task: 任务名称
+        :param data: 客户数据
+        :return: 模型输出
+        """
+        handlers = {
+            "multimodal_analysis": self._run_multimodal_analysis,
+            "fraud_detection": self._run_fraud_detection,
+            "combined_analysis": self._run_combined_analysis
+        }
+        return handlers[task](data)
+    
+    def _handle_batch(self, items):
+        """
+        执行一批模型请求
+        配置了模型服务地址时通过模型客户端发送一次批量请求，否则在本地逐个模拟
+        :param items: (任务名称, 客户数据) 列表
+        :return: 与请求顺序一致的模型输出列表
+        """
+        if self.client is None:
+            return [self._run_task(task, data) for task, data in items]
+        return self.client.call_batch([self._model_request(task, data) for task, data in items])
+    
+    def close(self):
+        """停止批处理后台线程并关闭模型客户端"""
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.client is not None:
+            self.client.close()
+
+
+def _validate_schema(value, schema, path):
+    """
+    按字段约束递归校验模型响应
+    :param value: 待校验的值
+    :param schema: 字段约束，字典表示嵌套结构，类型或类型元组表示叶子类型
+    :param path: 当前字段路径，用于错误信息
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise ValueError(f"{path} 应为对象")
+        for key, sub_schema in schema.items():
+            if key not in value:
+                raise ValueError(f"缺少字段 {path}.{key}")
+            _validate_schema(value[key], sub_schema, f"{path}.{key}")
+    elif isinstance(value, bool) and schema in ((int, float), int, float):
+        raise ValueError(f"{path} 应为数值")
+    elif not isinstance(value, schema):
+        raise ValueError(f"{path} 类型错误")
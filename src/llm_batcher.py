@@ -0,0 +1,146 @@
+"""
+LLM请求微批处理模块
+将多个客户的模型请求合并为一个批量请求，再把结果分发回各调用方
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# 默认单批最大请求数
+DEFAULT_MAX_BATCH_SIZE = 16
+# 默认凑批最长等待时间（毫秒）
+DEFAULT_MAX_WAIT_MS = 10
+# 默认同时在途的批次数
+DEFAULT_MAX_CONCURRENT_BATCHES = 4
+
+
+class MicroBatcher:
+    """
+    动态批处理队列
+    后台线程收集请求，达到批大小或等待超时后调用批处理函数；
+    线程池中的同步调用和事件循环中的异步调用可以共用同一个批处理器
+    """
+
+    def __init__(self, handler, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_concurrent_batches=DEFAULT_MAX_CONCURRENT_BATCHES):
+        """
+        初始化批处理器
+        :param handler: 批处理函数，接收请求列表，返回等长的结果列表
+        :param max_batch_size: 单批最大请求数
+        :param max_wait_ms: 第一个请求到达后最长等待凑批的时间（毫秒）
+        :param max_concurrent_batches: 同时在途的批次数，上一批未返回时可继续发送下一批
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_concurrent_batches = max_concurrent_batches
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0}
+        self._init_worker_state()
+
+    def _init_worker_state(self):
+        """初始化队列和后台线程状态"""
+        self._queue = queue.Queue()
+        self._worker = None
+        self._dispatch_pool = None
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def submit(self, item):
+        """
+        提交单个请求
+        :param item: 请求内容
+        :return: concurrent.futures.Future，完成后包含该请求的结果
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    async def asubmit(self, item):
+        """
+        异步提交单个请求并等待结果
+        :param item: 请求内容
+        :return: 该请求的结果
+        """
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _ensure_worker(self):
+        """按需启动后台线程"""
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._dispatch_pool = ThreadPoolExecutor(max_workers=self.max_concurrent_batches,
+                                                         thread_name_prefix="llm-batch-dispatch")
+                self._worker = threading.Thread(target=self._run, name="llm-micro-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        """后台凑批循环"""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            self._dispatch_pool.submit(self._dispatch, batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        """
+        执行一批请求并把结果分发给各调用方
+        :param batch: (请求, Future) 列表
+        """
+        items = [item for item, _ in batch]
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["items"] += len(items)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(items))
+        try:
+            results = self.handler(items)
+            if len(results) != len(items):
+                raise ValueError(f"批处理结果数量({len(results)})与请求数量({len(items)})不一致")
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        """处理完已提交的请求后停止后台线程"""
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._dispatch_pool.shutdown(wait=True)
+            self._worker = None
+            self._dispatch_pool = None
+
+    def __getstate__(self):
+        """序列化时不携带队列和线程"""
+        state = self.__dict__.copy()
+        for key in ("_queue", "_worker", "_dispatch_pool", "_start_lock", "_stats_lock"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建队列"""
+        self.__dict__.update(state)
+        self._init_worker_state()
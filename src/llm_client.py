@@ -0,0 +1,389 @@
+"""
+模型服务客户端模块
+所有远程模型请求共用一个客户端：按每分钟请求数和每分钟token数限流，
+可重试的错误（429、5xx、超时、连接失败）按指数退避加随机抖动重试并遵守Retry-After，
+请求超过对冲阈值仍未返回时发送一个相同的对冲请求取先返回的结果，
+连续失败达到阈值后熔断，熔断期间直接失败，由调用方改用本地确定性评分
+"""
+
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .rate_limit import TokenBucket
+from .image_preprocess import DEFAULT_VISION_MAX_TOKENS
+from .logging_utils import get_logger
+
+logger = get_logger("llm_client")
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+# 默认重试次数和退避参数（秒）
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 8.0
+# 限流器允许的突发量（秒数 x 每秒配额）
+DEFAULT_BURST_SECONDS = 5.0
+# 熔断器默认参数：连续失败次数阈值、熔断后进入半开状态的等待时间（秒）
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIMEOUT = 30.0
+# 对冲请求线程池大小
+DEFAULT_HEDGE_POOL_SIZE = 16
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+def estimate_tokens(body, requests=(), vision_max_tokens=DEFAULT_VISION_MAX_TOKENS):
+    """
+    粗略估算请求的输入token数：文本按UTF-8字节数的1/4，附带的图像按单张图像的token预算计
+    :param body: 请求体字节串
+    :param requests: 请求体中的请求列表，用于扣除图像data URI的长度
+    :param vision_max_tokens: 单张图像的token预算
+    :return: token数
+    """
+    images = [part["image_url"]["url"] for request in requests for part in request.get("content") or ()
+              if part["type"] == "image_url"]
+    text_size = len(body) - sum(len(url) for url in images)
+    return max(1, text_size // 4) + len(images) * vision_max_tokens
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败达到阈值后打开，等待恢复时间后进入半开状态只放行一个探测请求，探测成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, recovery_timeout=DEFAULT_RECOVERY_TIMEOUT,
+                 clock=time.monotonic):
+        """
+        初始化熔断器
+        :param failure_threshold: 连续失败次数阈值
+        :param recovery_timeout: 打开后进入半开状态的等待时间（秒）
+        :param clock: 单调时钟函数，便于测试时替换
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+
+    @property
+    def state(self):
+        """当前状态（closed/open/half_open）"""
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def _advance(self):
+        """在持有锁的情况下，打开状态超过恢复时间后转为半开"""
+        if self._state == CIRCUIT_OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = CIRCUIT_HALF_OPEN
+            self._probing = False
+
+    def allow(self):
+        """
+        判断是否放行一次请求
+        :return: 关闭状态放行；半开状态只放行一个探测请求；打开状态拒绝
+        """
+        with self._lock:
+            self._advance()
+            if self._state == CIRCUIT_CLOSED:
+                return True
+            if self._state == CIRCUIT_HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        """记录一次成功，关闭熔断器"""
+        with self._lock:
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """记录一次失败，达到阈值或探测失败时打开熔断器"""
+        with self._lock:
+            self._failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or \
+                    (self._state == CIRCUIT_CLOSED and self._failures >= self.failure_threshold):
+                if self._state == CIRCUIT_CLOSED:
+                    logger.warning("模型服务连续失败 %d 次，熔断 %.0f 秒", self._failures, self.recovery_timeout)
+                self._state = CIRCUIT_OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+                self.opens += 1
+
+
+class ModelClient:
+    """
+    批量模型接口客户端
+    POST {endpoint}/v1/batch，请求体与响应体格式见MockModelServer；线程安全，多个调用方共用
+    """
+
+    def __init__(self, endpoint, api_key=None, model_name=None, timeout=30, max_tokens=0,
+                 requests_per_minute=None, tokens_per_minute=None, burst_seconds=DEFAULT_BURST_SECONDS,
+                 max_retries=DEFAULT_MAX_RETRIES, retry_backoff=DEFAULT_RETRY_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 hedge_after=None, hedge_pool_size=DEFAULT_HEDGE_POOL_SIZE,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, recovery_timeout=DEFAULT_RECOVERY_TIMEOUT,
+                 vision_max_tokens=DEFAULT_VISION_MAX_TOKENS):
+        """
+        初始化模型客户端
+        :param endpoint: 模型服务根地址
+        :param api_key: 接口密钥
+        :param model_name: 模型名称
+        :param timeout: 单次HTTP请求超时（秒）
+        :param max_tokens: 每个模型请求的输出token上限，计入每分钟token配额
+        :param requests_per_minute: 每分钟HTTP请求数上限，None表示不限
+        :param tokens_per_minute: 每分钟token数上限（输入估算 + 输出上限），None表示不限
+        :param burst_seconds: 限流器允许的突发量，按几秒的配额计算
+        :param max_retries: 最大重试次数
+        :param retry_backoff: 重试退避基数（秒）
+        :param max_backoff: 单次退避的最长时间（秒）
+        :param hedge_after: 请求超过此时间（秒）未返回时发送对冲请求，None表示不对冲
+        :param hedge_pool_size: 启用对冲时发送请求的线程数
+        :param failure_threshold: 熔断的连续失败次数阈值
+        :param recovery_timeout: 熔断后进入半开状态的等待时间（秒）
+        :param vision_max_tokens: 单张图像的token预算，用于估算请求的输入token数
+        """
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_tokens = max_tokens or 0
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.hedge_pool_size = hedge_pool_size
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.vision_max_tokens = vision_max_tokens
+        self._init_state()
+
+    def _init_state(self):
+        """初始化限流器、熔断器、统计和对冲线程池"""
+        self._request_bucket = self._bucket(self.requests_per_minute)
+        self._token_bucket = self._bucket(self.tokens_per_minute)
+        self.breaker = CircuitBreaker(self.failure_threshold, self.recovery_timeout)
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "rate_limited": 0, "hedged": 0,
+                      "hedge_wins": 0, "failures": 0, "short_circuited": 0, "fallbacks": 0}
+        self._stats_lock = threading.Lock()
+        # 收到429的Retry-After后所有调用方暂停到此时刻
+        self._paused_until = 0.0
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _bucket(self, per_minute):
+        """按每分钟配额创建令牌桶，未配置时返回None"""
+        if not per_minute:
+            return None
+        rate = per_minute / 60.0
+        return TokenBucket(rate, capacity=max(1.0, rate * self.burst_seconds))
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def record_fallback(self):
+        """记录一次调用方改用本地评分"""
+        self._count("fallbacks")
+
+    def call_batch(self, items):
+        """
+        发送一批模型请求
+        :param items: (任务名称, 客户数据) 或 (任务名称, 客户数据, 多模态消息内容) 列表，
+                      消息内容为None时不附带
+        :return: 与请求顺序一致的模型输出列表
+        """
+        requests = []
+        for task, data, *content in items:
+            request = {"task": task, "data": data}
+            if content and content[0] is not None:
+                request["content"] = content[0]
+            requests.append(request)
+        body = json.dumps({"model": self.model_name, "requests": requests},
+                          ensure_ascii=False, default=str).encode("utf-8")
+        tokens = estimate_tokens(body, requests, self.vision_max_tokens) + self.max_tokens * len(items)
+
+        last_exc = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                raise RuntimeError("模型服务熔断中，暂停调用") from last_exc
+            self._acquire(tokens)
+            try:
+                payload = self._send(body, tokens)
+                outputs = [entry["output"] for entry in payload["responses"]]
+            except Exception as exc:
+                retry_after = self._retry_after(exc)
+                if retry_after is None:
+                    if isinstance(exc, urllib.error.HTTPError):
+                        # 服务端明确拒绝请求（如400/401），服务本身可用，不计入熔断且不重试
+                        self.breaker.record_success()
+                    else:
+                        # 响应格式错误等其他异常不重试，但计入熔断
+                        self.breaker.record_failure()
+                        self._count("failures")
+                    raise
+                self.breaker.record_failure()
+                self._count("failures")
+                last_exc = exc
+                if attempt == self.max_retries:
+                    break
+                self._count("retries")
+                delay = min(self.max_backoff, self.retry_backoff * (2 ** attempt) * (0.5 + random.random()))
+                time.sleep(max(delay, retry_after))
+                continue
+            self.breaker.record_success()
+            return outputs
+        logger.warning("模型请求失败（已重试%d次）: %s", self.max_retries, last_exc)
+        raise last_exc
+
+    def _retry_after(self, exc):
+        """
+        判断错误是否可重试，只有可重试的HTTP状态码和网络错误（连接失败、超时）可重试
+        :param exc: 异常
+        :return: 不可重试时为None，否则为服务端要求的最短等待时间（秒）
+        """
+        if isinstance(exc, urllib.error.HTTPError):
+            if exc.code not in RETRYABLE_STATUS:
+                return None
+            try:
+                retry_after = float(exc.headers.get("Retry-After") or 0)
+            except ValueError:
+                retry_after = 0.0
+            if exc.code == 429:
+                self._count("rate_limited")
+                # 服务端限流时所有调用方一起暂停，避免继续触发429
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            return retry_after
+        if isinstance(exc, (urllib.error.URLError, TimeoutError, ConnectionError)):
+            # 连接失败、超时等网络错误可重试
+            return 0.0
+        return None
+
+    def _acquire(self, tokens):
+        """
+        等待请求数和token数配额
+        :param tokens: 本次请求占用的token数
+        """
+        throttled = False
+        paused = self._paused_until - time.monotonic()
+        if paused > 0:
+            throttled = True
+            time.sleep(paused)
+        for bucket, amount in ((self._request_bucket, 1), (self._token_bucket, tokens)):
+            if bucket is None:
+                continue
+            # 超过桶容量的大请求按桶容量计，避免永远等不到
+            amount = min(amount, bucket.capacity)
+            while not bucket.try_acquire(amount):
+                throttled = True
+                time.sleep(max(0.001, bucket.wait_time(amount)))
+        if throttled:
+            self._count("throttled")
+
+    def _try_acquire_now(self, tokens):
+        """不等待地取得一次请求的配额，对冲请求只在配额充足时发送"""
+        if self._request_bucket is not None and not self._request_bucket.try_acquire(1):
+            return False
+        if self._token_bucket is not None and \
+                not self._token_bucket.try_acquire(min(tokens, self._token_bucket.capacity)):
+            return False
+        return True
+
+    def _send(self, body, tokens):
+        """
+        发送请求，启用对冲时在超过对冲阈值后补发一个相同请求，取先成功的结果
+        :param body: 请求体
+        :param tokens: 本次请求占用的token数
+        :return: 响应体
+        """
+        if self.hedge_after is None:
+            return self._post(body)
+
+        pool = self._get_pool()
+        primary = pool.submit(self._post, body)
+        futures = [primary]
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done and self.breaker.state == CIRCUIT_CLOSED and self._try_acquire_now(tokens):
+            futures.append(pool.submit(self._post, body))
+            self._count("hedged")
+
+        errors = []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+
+    def _post(self, body):
+        """
+        发送一次HTTP请求
+        :param body: 请求体
+        :return: 响应体
+        """
+        self._count("requests")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.endpoint.rstrip("/") + "/v1/batch", data=body, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def _get_pool(self):
+        """首次对冲时创建线程池"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.hedge_pool_size, thread_name_prefix="llm-hedge")
+            return self._pool
+
+    def get_stats(self):
+        """
+        获取客户端统计
+        :return: HTTP请求数、重试数、被本地限流次数、收到429次数、对冲次数、对冲胜出次数、
+                 失败次数、熔断拒绝次数、回退本地评分次数、熔断器状态和打开次数
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["circuit_state"] = self.breaker.state
+        stats["circuit_opens"] = self.breaker.opens
+        return stats
+
+    def close(self):
+        """关闭对冲线程池"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+    def __getstate__(self):
+        """序列化到子进程时只携带配置，限流器和熔断器在子进程中重建（配额按进程计算）"""
+        state = self.__dict__.copy()
+        for key in ("_request_bucket", "_token_bucket", "breaker", "stats", "_stats_lock", "_paused_until",
+                    "_pool", "_pool_lock"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
@@ -0,0 +1,197 @@
+"""
+日志存储模块
+内存中保留有界的最近记录，可选地追加写入磁盘上按大小轮转的JSONL分段文件，
+历史记录以流式方式逐条读取，不会一次性加载到内存
+"""
+
+import json
+import os
+import threading
+from collections import deque
+
+from .records import json_default
+
+# 内存中默认保留的最近记录数
+DEFAULT_CAPACITY = 10000
+# 单个分段文件默认最大字节数
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class JsonlSegmentWriter:
+    """
+    JSONL分段写入器
+    每条记录一行，当前分段超过大小上限时轮转到新分段，可限制保留的分段数
+    """
+
+    def __init__(self, directory, prefix, max_segment_bytes=DEFAULT_SEGMENT_MAX_BYTES, max_segments=None):
+        """
+        初始化分段写入器
+        :param directory: 分段文件目录
+        :param prefix: 分段文件名前缀
+        :param max_segment_bytes: 单个分段最大字节数
+        :param max_segments: 最多保留的分段数，None表示不删除旧分段
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        os.makedirs(directory, exist_ok=True)
+        existing = self.segment_paths()
+        self._seq = self._segment_seq(existing[-1]) if existing else 0
+        self._file = None
+        self._size = 0
+
+    def _segment_seq(self, path):
+        """从分段文件名解析序号"""
+        name = os.path.basename(path)
+        return int(name[len(self.prefix) + 1:-len(".jsonl")])
+
+    def segment_paths(self):
+        """
+        按写入顺序列出所有分段文件
+        :return: 分段文件路径列表
+        """
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(self.prefix + "-") and name.endswith(".jsonl")]
+        paths = [os.path.join(self.directory, name) for name in names]
+        return sorted(paths, key=self._segment_seq)
+
+    def _open_next_segment(self):
+        """关闭当前分段并打开新分段"""
+        if self._file is not None:
+            self._file.close()
+        self._seq += 1
+        path = os.path.join(self.directory, f"{self.prefix}-{self._seq:08d}.jsonl")
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = 0
+        if self.max_segments:
+            for old_path in self.segment_paths()[:-self.max_segments]:
+                os.remove(old_path)
+
+    def write(self, record):
+        """
+        追加写入一条记录
+        :param record: 可JSON序列化的记录或Record
+        """
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=json_default) + "\n"
+        if self._file is None or self._size >= self.max_segment_bytes:
+            self._open_next_segment()
+        self._file.write(line)
+        self._size += len(line.encode("utf-8"))
+
+    def flush(self):
+        """刷新当前分段的写缓冲"""
+        if self._file is not None:
+            self._file.flush()
+
+    def iter_records(self):
+        """
+        按写入顺序流式读取所有分段中的记录
+        :return: 记录生成器
+        """
+        for path in self.segment_paths():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def close(self):
+        """关闭当前分段"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LogStore:
+    """
+    有界日志存储
+    内存中以环形缓冲保留最近的记录，配置spill_dir后所有记录同时追加写入磁盘分段
+    """
+
+    def __init__(self, name="log", capacity=DEFAULT_CAPACITY, spill_dir=None,
+                 max_segment_bytes=DEFAULT_SEGMENT_MAX_BYTES, max_segments=None):
+        """
+        初始化日志存储
+        :param name: 日志名称，用作分段文件名前缀
+        :param capacity: 内存中保留的最近记录数
+        :param spill_dir: 磁盘分段目录，为None时只保留内存中的最近记录
+        :param max_segment_bytes: 单个分段最大字节数
+        :param max_segments: 最多保留的分段数
+        """
+        self.name = name
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self.total_appended = 0
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=capacity)
+        self._writer = None
+        if spill_dir:
+            self._writer = JsonlSegmentWriter(spill_dir, name, max_segment_bytes, max_segments)
+
+    def append(self, record):
+        """
+        追加一条记录
+        :param record: 日志记录
+        """
+        with self._lock:
+            self._recent.append(record)
+            self.total_appended += 1
+            if self._writer is not None:
+                self._writer.write(record)
+
+    def __len__(self):
+        """内存中保留的记录数"""
+        return len(self._recent)
+
+    def __iter__(self):
+        """按时间顺序遍历内存中保留的最近记录"""
+        with self._lock:
+            return iter(list(self._recent))
+
+    def recent(self, n=None):
+        """
+        获取最近的记录
+        :param n: 记录数，None表示内存中保留的全部记录
+        :return: 记录列表，按时间顺序排列
+        """
+        with self._lock:
+            records = list(self._recent)
+        return records if n is None else records[-n:]
+
+    def iter_history(self):
+        """
+        流式遍历历史记录
+        启用磁盘分段时从磁盘逐条读取（包括之前运行写入的分段），否则遍历内存中的记录
+        :return: 记录生成器
+        """
+        if self._writer is None:
+            yield from self
+            return
+        with self._lock:
+            self._writer.flush()
+        yield from self._writer.iter_records()
+
+    def flush(self):
+        """刷新磁盘写缓冲"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+
+    def close(self):
+        """关闭磁盘分段"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+
+    def __getstate__(self):
+        """
+        序列化到子进程时只保留配置，子进程使用仅内存的空存储，
+        避免多个进程同时写入同一组分段文件
+        """
+        return {"name": self.name, "capacity": self.capacity}
+
+    def __setstate__(self, state):
+        """反序列化为仅内存的空存储"""
+        self.__init__(**state)
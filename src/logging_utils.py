@@ -0,0 +1,148 @@
+"""
+结构化日志模块
+各模块通过get_logger获取日志器，消息使用%s参数延迟格式化；
+configure_logging把日志写入后台线程，处理流程中只做入队，
+安静模式下INFO/DEBUG日志在级别判断后直接返回，不做任何字符串格式化
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# 系统日志器的根名称
+LOGGER_NAME = "fraud_detection"
+
+# 作为库使用时默认不输出，由调用方决定日志配置
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+
+# 日志记录中的标准属性，其余属性视为结构化字段
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def get_logger(name):
+    """
+    获取模块日志器
+    :param name: 模块名称
+    :return: logging.Logger
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def _structured_fields(record):
+    """提取通过extra传入的结构化字段"""
+    return {key: value for key, value in record.__dict__.items() if key not in _STANDARD_ATTRS}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    结构化格式化器
+    文本模式在消息后追加key=value字段，JSON模式每条日志输出一行JSON
+    """
+
+    def __init__(self, json_format=False):
+        """
+        初始化格式化器
+        :param json_format: 是否输出JSON行
+        """
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+        self.json_format = json_format
+
+    def format(self, record):
+        fields = _structured_fields(record)
+        if self.json_format:
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage()
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc_info"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        text = super().format(record)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    只入队不格式化的队列处理器，消息格式化在后台线程中完成
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # 日志积压时丢弃，不阻塞处理流程
+            pass
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """
+    队列满时停止信号阻塞入队，确保停止前写出已入队的日志
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def configure_logging(level="INFO", json_format=False, stream=None, quiet=False, queue_size=10000):
+    """
+    配置系统日志：处理流程中的日志调用只入队，由后台线程格式化并写出
+    :param level: 日志级别
+    :param json_format: 是否输出JSON行
+    :param stream: 输出流，默认为标准输出
+    :param quiet: 安静模式，只输出WARNING及以上级别
+    :param queue_size: 日志队列容量，队列满时丢弃新日志而不阻塞处理流程
+    """
+    global _listener
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(StructuredFormatter(json_format))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = _DeferredQueueHandler(log_queue)
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [handler]
+    logger.setLevel(logging.WARNING if quiet else level)
+    logger.propagate = False
+
+    _listener = _QueueListener(log_queue, output)
+    _listener.start()
+
+
+def shutdown_logging():
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener_in_child():
+    """fork出的子进程中没有日志后台线程，使用新队列按父进程的配置重新启动"""
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.Queue(maxsize=_listener.queue.maxsize)
+    for handler in logging.getLogger(LOGGER_NAME).handlers:
+        if isinstance(handler, _DeferredQueueHandler):
+            handler.queue = log_queue
+    _listener = _QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
@@ -0,0 +1,259 @@
+"""
+系统指标模块
+在每个申请处理完成时增量更新计数器、时间窗口速率和延迟直方图，
+获取指标快照的开销与已处理记录数无关
+"""
+
+import bisect
+import threading
+import time
+
+# 统计速率的时间窗口（秒）
+RATE_WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+# 时间窗口计数的桶宽（秒）
+WINDOW_RESOLUTION = 5
+# 延迟直方图的桶上界（毫秒），最后一个桶收纳所有更大的值
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class SlidingWindowCounter:
+    """
+    按时间分桶的滑动窗口计数器
+    固定数量的桶循环使用，查询时只汇总窗口内的桶
+    """
+
+    def __init__(self, horizon=max(RATE_WINDOWS.values()), resolution=WINDOW_RESOLUTION):
+        """
+        初始化计数器
+        :param horizon: 可查询的最长窗口（秒）
+        :param resolution: 桶宽（秒）
+        """
+        self.resolution = resolution
+        self.slots = horizon // resolution
+        self._counts = [0] * self.slots
+        self._epochs = [-1] * self.slots
+
+    def add(self, n=1, now=None):
+        """
+        计数
+        :param n: 增量
+        :param now: 当前时间戳，默认取系统时间
+        """
+        epoch = int((time.time() if now is None else now) // self.resolution)
+        index = epoch % self.slots
+        if self._epochs[index] != epoch:
+            self._epochs[index] = epoch
+            self._counts[index] = 0
+        self._counts[index] += n
+
+    def total(self, window, now=None):
+        """
+        统计最近一段时间内的计数
+        :param window: 窗口长度（秒）
+        :param now: 当前时间戳，默认取系统时间
+        :return: 窗口内计数
+        """
+        epoch = int((time.time() if now is None else now) // self.resolution)
+        oldest = epoch - min(window // self.resolution, self.slots) + 1
+        return sum(count for count, bucket_epoch in zip(self._counts, self._epochs)
+                   if oldest <= bucket_epoch <= epoch)
+
+    def merge(self, other):
+        """
+        合并另一个同样分桶的计数器（如其他工作进程的计数器）
+        :param other: SlidingWindowCounter
+        """
+        for index, (count, epoch) in enumerate(zip(other._counts, other._epochs)):
+            if epoch > self._epochs[index]:
+                self._epochs[index] = epoch
+                self._counts[index] = count
+            elif epoch == self._epochs[index]:
+                self._counts[index] += count
+
+
+class LatencyHistogram:
+    """
+    固定分桶的延迟直方图
+    """
+
+    def __init__(self, bounds_ms=LATENCY_BUCKETS_MS):
+        """
+        初始化直方图
+        :param bounds_ms: 桶上界（毫秒）
+        """
+        self.bounds_ms = bounds_ms
+        self.buckets = [0] * (len(bounds_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds):
+        """
+        记录一次耗时
+        :param seconds: 耗时（秒）
+        """
+        ms = seconds * 1000.0
+        self.buckets[bisect.bisect_left(self.bounds_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other):
+        """
+        合并另一个同样分桶的直方图
+        :param other: LatencyHistogram
+        """
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def quantile(self, q):
+        """
+        按桶估算分位数，返回所在桶的上界
+        :param q: 分位点，0-1之间
+        :return: 估算值（毫秒）
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds_ms, self.buckets):
+            seen += count
+            if seen >= rank:
+                return float(bound)
+        return self.max_ms
+
+    def snapshot(self):
+        """
+        获取直方图快照
+        :return: 次数、平均值、分位数和各桶计数
+        """
+        labels = [f"<={bound}ms" for bound in self.bounds_ms] + [f">{self.bounds_ms[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max_ms,
+            "buckets": dict(zip(labels, self.buckets))
+        }
+
+
+class MetricsCollector:
+    """
+    系统指标收集器
+    线程安全，每次记录和快照的开销均为常数
+    """
+
+    def __init__(self):
+        """初始化指标收集器"""
+        self._lock = threading.Lock()
+        self.decision_counts = {}
+        self.tier_counts = {}
+        self.total_processed = 0
+        self._window_total = SlidingWindowCounter()
+        self._window_by_decision = {}
+        self._latency_by_decision = {}
+        self._stage_latency = {}
+
+    def record_application(self, decision, processing_time=None, stage_timings=None, now=None, tier=None):
+        """
+        记录一个处理完成的申请
+        :param decision: 决策结果（APPROVE/REVIEW/REJECT/ERROR）
+        :param processing_time: 全流程耗时（秒）
+        :param stage_timings: 各阶段耗时（秒）
+        :param now: 完成时间戳，默认取系统时间
+        :param tier: 做出决策的处理层级（prescreen/model），处理失败时为None
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.total_processed += 1
+            self.decision_counts[decision] = self.decision_counts.get(decision, 0) + 1
+            if tier is not None:
+                self.tier_counts[tier] = self.tier_counts.get(tier, 0) + 1
+            self._window_total.add(1, now)
+            window = self._window_by_decision.get(decision)
+            if window is None:
+                window = self._window_by_decision[decision] = SlidingWindowCounter()
+            window.add(1, now)
+            if processing_time is not None:
+                histogram = self._latency_by_decision.get(decision)
+                if histogram is None:
+                    histogram = self._latency_by_decision[decision] = LatencyHistogram()
+                histogram.observe(processing_time)
+            for stage, seconds in (stage_timings or {}).items():
+                self._observe_stage(stage, seconds)
+
+    def record_stage(self, stage, seconds):
+        """
+        记录单个阶段的耗时
+        :param stage: 阶段名称
+        :param seconds: 耗时（秒）
+        """
+        with self._lock:
+            self._observe_stage(stage, seconds)
+
+    def _observe_stage(self, stage, seconds):
+        """在持有锁的情况下记录阶段耗时"""
+        histogram = self._stage_latency.get(stage)
+        if histogram is None:
+            histogram = self._stage_latency[stage] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def merge(self, other):
+        """
+        合并另一个收集器的指标，用于汇总多个工作进程
+        :param other: MetricsCollector
+        """
+        with self._lock:
+            self.total_processed += other.total_processed
+            for decision, count in other.decision_counts.items():
+                self.decision_counts[decision] = self.decision_counts.get(decision, 0) + count
+            for tier, count in other.tier_counts.items():
+                self.tier_counts[tier] = self.tier_counts.get(tier, 0) + count
+            self._window_total.merge(other._window_total)
+            for decision, window in other._window_by_decision.items():
+                self._window_by_decision.setdefault(decision, SlidingWindowCounter()).merge(window)
+            for decision, histogram in other._latency_by_decision.items():
+                self._latency_by_decision.setdefault(decision, LatencyHistogram()).merge(histogram)
+            for stage, histogram in other._stage_latency.items():
+                self._stage_latency.setdefault(stage, LatencyHistogram()).merge(histogram)
+
+    def snapshot(self, now=None):
+        """
+        获取指标快照
+        :param now: 当前时间戳，默认取系统时间
+        :return: 累计计数、各处理层级计数、窗口速率、各决策延迟和各阶段耗时
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rates = {}
+            for label, seconds in RATE_WINDOWS.items():
+                window_rates = {"total": self._window_total.total(seconds, now)}
+                for decision, window in self._window_by_decision.items():
+                    window_rates[decision] = window.total(seconds, now)
+                window_rates["per_second"] = window_rates["total"] / seconds
+                rates[label] = window_rates
+            return {
+                "total_processed": self.total_processed,
+                "decision_counts": dict(self.decision_counts),
+                "tier_counts": dict(self.tier_counts),
+                "rates": rates,
+                "latency": {decision: histogram.snapshot()
+                            for decision, histogram in self._latency_by_decision.items()},
+                "stages": {stage: histogram.snapshot()
+                           for stage, histogram in self._stage_latency.items()}
+            }
+
+    def __getstate__(self):
+        """序列化到子进程时不携带锁"""
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建锁"""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -0,0 +1,178 @@
+"""
+本地模拟模型服务
+提供与批量模型接口相同协议的HTTP服务，用于在本地验证批处理、限流、重试、对冲和熔断等功能；
+可按概率或按顺序注入错误、429限流和长尾延迟
+"""
+
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .llm_analyzer import LLMAnalyzer
+
+
+class MockModelServer:
+    """
+    模拟模型服务
+    POST /v1/batch 请求体: {"model": ..., "requests": [{"task": ..., "data": ..., "content": 可选的多模态消息内容}]}
+    响应体: {"responses": [{"output": ...}]}
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, responder=None, error_rate=0.0, error_status=503,
+                 throttle_rate=0.0, retry_after=1, slow_rate=0.0, slow_latency=1.0, seed=None):
+        """
+        初始化模拟服务
+        :param host: 监听地址
+        :param port: 监听端口，0表示随机端口
+        :param latency: 每个HTTP请求附加的模拟延迟（秒）
+        :param responder: 单个请求的应答函数，接收(task, data)，默认使用本地模拟分析逻辑
+        :param error_rate: 返回error_status错误的概率
+        :param error_status: 注入错误的HTTP状态码
+        :param throttle_rate: 返回429限流的概率
+        :param retry_after: 429响应携带的Retry-After（秒）
+        :param slow_rate: 附加长尾延迟的概率
+        :param slow_latency: 长尾请求额外的延迟（秒）
+        :param seed: 故障注入的随机种子
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.responder = responder or LLMAnalyzer({})._run_task
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        # 模拟服务宕机：所有请求返回503
+        self.down = False
+        self.stats = {"http_requests": 0, "model_requests": 0, "errors": 0, "throttled": 0, "slow": 0}
+        self._stats_lock = threading.Lock()
+        self._random = random.Random(seed)
+        # 按顺序注入的错误状态码，优先于按概率注入
+        self._scheduled_errors = deque()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """服务根地址"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        在后台线程中启动服务
+        :return: 服务根地址
+        """
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-model-server", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """停止服务"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def inject_errors(self, count, status=503):
+        """
+        让接下来的若干个请求返回指定错误
+        :param count: 请求数
+        :param status: HTTP状态码
+        """
+        with self._stats_lock:
+            self._scheduled_errors.extend([status] * count)
+
+    def set_down(self, down=True):
+        """
+        模拟服务宕机或恢复
+        :param down: 是否宕机
+        """
+        self.down = down
+
+    def _next_fault(self):
+        """
+        决定当前请求注入的故障
+        :return: (错误状态码，不注入错误时为None, 额外延迟秒数)
+        """
+        with self._stats_lock:
+            self.stats["http_requests"] += 1
+            status = None
+            if self.down:
+                status = 503
+            elif self._scheduled_errors:
+                status = self._scheduled_errors.popleft()
+            elif self._random.random() < self.error_rate:
+                status = self.error_status
+            elif self._random.random() < self.throttle_rate:
+                status = 429
+            if status == 429:
+                self.stats["throttled"] += 1
+            elif status is not None:
+                self.stats["errors"] += 1
+            delay = 0.0
+            if status is None and self._random.random() < self.slow_rate:
+                self.stats["slow"] += 1
+                delay = self.slow_latency
+        return status, delay
+
+    def _make_handler(self):
+        """构造绑定到当前服务实例的请求处理类"""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if self.path == "/v1/batch":
+                    status, delay = server._next_fault()
+                    if delay:
+                        time.sleep(delay)
+                    if status == 429:
+                        self._send(429, {"error": "请求过多"}, {"Retry-After": str(server.retry_after)})
+                        return
+                    if status is not None:
+                        self._send(status, {"error": "模拟服务错误"})
+                        return
+                    requests = body.get("requests", [])
+                    with server._stats_lock:
+                        server.stats["model_requests"] += len(requests)
+                    payload = {"responses": [{"output": server.responder(req["task"], req["data"])}
+                                             for req in requests]}
+                    self._send(200, payload)
+                else:
+                    self._send(404, {"error": f"未知接口: {self.path}"})
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # 不向stderr输出访问日志
+                pass
+
+        return Handler
@@ -0,0 +1,296 @@
+"""
+通知分发模块
+复核、拒绝和欺诈预警通知不在处理流程中直接发送：同一渠道、同一类型的通知在摘要窗口内合并为一条摘要，
+由后台线程按窗口到期发送，并按通知类型限流；欺诈高发期间通知量与申请量解耦
+"""
+
+import threading
+import time
+from collections import deque
+
+from .rate_limit import TokenBucket
+from .logging_utils import get_logger
+
+logger = get_logger("notifications")
+
+# 默认摘要窗口（秒）：同类型通知在窗口内合并为一条摘要
+DEFAULT_DIGEST_INTERVAL = 60.0
+# 各通知类型的默认摘要窗口，欺诈预警需要更快送达
+DEFAULT_DIGEST_INTERVALS = {"fraud_alert": 5.0}
+# 每条摘要最多携带的通知明细数，超出部分只计数
+DEFAULT_MAX_DIGEST_ITEMS = 50
+# 内存渠道默认保留的摘要数
+DEFAULT_MEMORY_DIGESTS = 1000
+
+
+class NotificationChannel:
+    """
+    通知渠道接口，后台线程以摘要为单位调用send
+    """
+
+    def send(self, digest):
+        """
+        发送一条通知摘要，失败时抛出异常
+        :param digest: 通知摘要（字典），包含type、count、items、truncated、first_at和last_at
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """释放渠道资源"""
+
+
+class LogNotificationChannel(NotificationChannel):
+    """
+    日志渠道，每条摘要输出一行日志
+    """
+
+    def send(self, digest):
+        customer_ids = [item["customer_id"] for item in digest["items"]]
+        logger.info("发送通知摘要: 类型=%s, 通知数=%d, 客户=%s%s", digest["type"], digest["count"],
+                    ",".join(str(customer_id) for customer_id in customer_ids),
+                    f" 等{digest['count']}位" if digest["truncated"] else "")
+
+
+class InMemoryNotificationChannel(NotificationChannel):
+    """
+    本地桩渠道，保留最近发送的摘要，便于调试和测试
+    """
+
+    def __init__(self, max_digests=DEFAULT_MEMORY_DIGESTS):
+        """
+        初始化内存渠道
+        :param max_digests: 最多保留的摘要数
+        """
+        self.max_digests = max_digests
+        self._digests = deque(maxlen=max_digests)
+        self._lock = threading.Lock()
+
+    def send(self, digest):
+        with self._lock:
+            self._digests.append(digest)
+
+    def get_digests(self, notification_type=None):
+        """
+        获取已发送的摘要
+        :param notification_type: 只返回该类型的摘要，None表示全部
+        :return: 摘要列表
+        """
+        with self._lock:
+            digests = list(self._digests)
+        if notification_type is None:
+            return digests
+        return [digest for digest in digests if digest["type"] == notification_type]
+
+    def clear(self):
+        """清空已发送的摘要"""
+        with self._lock:
+            self._digests.clear()
+
+    def __getstate__(self):
+        return {"max_digests": self.max_digests}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class _Digest:
+    """待发送的通知摘要"""
+
+    __slots__ = ("notification_type", "count", "items", "first_at", "last_at", "opened", "rate_limited")
+
+    def __init__(self, notification_type, opened):
+        self.notification_type = notification_type
+        self.count = 0
+        self.items = []
+        self.first_at = None
+        self.last_at = None
+        self.opened = opened
+        # 是否已因限流推迟过，被限流的摘要只计一次
+        self.rate_limited = False
+
+    def add(self, item, max_items):
+        self.count += 1
+        if len(self.items) < max_items:
+            self.items.append(item)
+        if self.first_at is None:
+            self.first_at = item["timestamp"]
+        self.last_at = item["timestamp"]
+
+    def to_dict(self):
+        return {
+            "type": self.notification_type,
+            "count": self.count,
+            "items": self.items,
+            "truncated": self.count - len(self.items),
+            "first_at": self.first_at,
+            "last_at": self.last_at
+        }
+
+
+class NotificationDispatcher:
+    """
+    通知分发器
+    notify只在内存中合并通知并立即返回，后台线程在摘要窗口到期且该类型未超出限流时发送摘要；
+    被限流的摘要继续合并后续通知，等令牌补充后再发送
+    """
+
+    def __init__(self, channels=None, routes=None, digest_interval=DEFAULT_DIGEST_INTERVAL,
+                 digest_intervals=None, rate_limits=None, max_digest_items=DEFAULT_MAX_DIGEST_ITEMS):
+        """
+        初始化通知分发器
+        :param channels: 通知渠道字典 {渠道名: NotificationChannel}，默认为日志渠道
+        :param routes: 各通知类型发送到的渠道名列表 {通知类型: [渠道名]}，未配置的类型发送到所有渠道
+        :param digest_interval: 默认摘要窗口（秒），为0时每个检查周期都发送
+        :param digest_intervals: 各通知类型的摘要窗口（秒），覆盖默认值
+        :param rate_limits: 各通知类型每个渠道每分钟最多发送的摘要数 {通知类型: 次数}，未配置的类型不限流
+        :param max_digest_items: 每条摘要最多携带的通知明细数
+        """
+        self.channels = channels if channels is not None else {"log": LogNotificationChannel()}
+        self.routes = routes or {}
+        self.digest_interval = digest_interval
+        self.digest_intervals = {**DEFAULT_DIGEST_INTERVALS, **(digest_intervals or {})}
+        self.rate_limits = rate_limits or {}
+        self.max_digest_items = max_digest_items
+        self.stats = {"notifications": 0, "digests": 0, "rate_limited": 0, "failed": 0}
+        self._init_worker_state()
+
+    def _init_worker_state(self):
+        """初始化待发送摘要、限流器和后台线程状态"""
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._buckets = {}
+        self._worker = None
+        self._stop = threading.Event()
+        # 检查周期不超过最短摘要窗口（窗口为0时按最短周期检查），最长1秒
+        self._tick = max(0.01, min(1.0, self.digest_interval, *self.digest_intervals.values()))
+
+    def notify(self, customer_id, message, notification_type):
+        """
+        提交一条通知，合并到对应渠道和类型的待发送摘要
+        :param customer_id: 客户ID
+        :param message: 通知内容
+        :param notification_type: 通知类型
+        :return: 提交状态
+        """
+        item = {
+            "customer_id": customer_id,
+            "message": message,
+            "timestamp": __import__('datetime').datetime.now().isoformat()
+        }
+        now = time.monotonic()
+        channel_names = self.routes.get(notification_type, self.channels.keys())
+        with self._lock:
+            for channel_name in channel_names:
+                key = (channel_name, notification_type)
+                digest = self._pending.get(key)
+                if digest is None:
+                    digest = self._pending[key] = _Digest(notification_type, now)
+                digest.add(item, self.max_digest_items)
+            self.stats["notifications"] += 1
+        self._ensure_worker()
+        return {"sent": False, "queued": True, "type": notification_type}
+
+    def _ensure_worker(self):
+        """按需启动后台线程"""
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        """后台发送循环"""
+        while not self._stop.wait(self._tick):
+            self._dispatch_due()
+
+    def _bucket(self, key):
+        """获取渠道和通知类型对应的限流器，未配置限流的类型返回None"""
+        limit = self.rate_limits.get(key[1])
+        if limit is None:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limit / 60.0, capacity=max(1.0, limit / 60.0))
+        return bucket
+
+    def _dispatch_due(self, force=False):
+        """
+        发送到期的摘要
+        :param force: 是否忽略摘要窗口和限流，发送全部待发送摘要
+        """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for key, digest in list(self._pending.items()):
+                interval = self.digest_intervals.get(key[1], self.digest_interval)
+                if not force and now - digest.opened < interval:
+                    continue
+                bucket = self._bucket(key)
+                if not force and bucket is not None and not bucket.try_acquire():
+                    if not digest.rate_limited:
+                        digest.rate_limited = True
+                        self.stats["rate_limited"] += 1
+                    continue
+                due.append((key, self._pending.pop(key)))
+        for (channel_name, notification_type), digest in due:
+            try:
+                self.channels[channel_name].send(digest.to_dict())
+            except Exception as exc:
+                logger.warning("通知渠道 %s 发送 %s 摘要失败: %s", channel_name, notification_type, exc)
+                self._requeue((channel_name, notification_type), digest)
+                continue
+            with self._lock:
+                self.stats["digests"] += 1
+
+    def _requeue(self, key, digest):
+        """发送失败的摘要与期间新到的通知合并，等下一个窗口重发"""
+        with self._lock:
+            self.stats["failed"] += 1
+            newer = self._pending.get(key)
+            if newer is not None:
+                for item in newer.items:
+                    digest.add(item, self.max_digest_items)
+                digest.count += newer.count - len(newer.items)
+            digest.opened = time.monotonic()
+            self._pending[key] = digest
+
+    def flush(self):
+        """立即发送全部待发送摘要，忽略摘要窗口和限流"""
+        self._dispatch_due(force=True)
+
+    def get_stats(self):
+        """
+        获取分发统计
+        :return: 通知数、已发送摘要数、合并率、被限流的摘要数、发送失败次数和待发送摘要数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending_digests"] = len(self._pending)
+            stats["pending_notifications"] = sum(digest.count for digest in self._pending.values())
+        routed = stats["digests"] + stats["pending_digests"]
+        stats["coalescing_ratio"] = stats["notifications"] / routed if routed else 0.0
+        return stats
+
+    def close(self):
+        """停止后台线程，发送剩余摘要并关闭渠道；之后再提交通知时重新启动后台线程"""
+        if self._worker is not None:
+            self._stop.set()
+            self._worker.join()
+            self._worker = None
+            self._stop.clear()
+        self.flush()
+        for channel in self.channels.values():
+            channel.close()
+
+    def __getstate__(self):
+        """序列化时不携带待发送摘要、限流器和线程"""
+        state = self.__dict__.copy()
+        for key in ("_lock", "_pending", "_buckets", "_worker", "_stop", "_tick"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建状态"""
+        self.__dict__.update(state)
+        self._init_worker_state()
@@ -0,0 +1,208 @@
+"""
+OCR引擎模块
+基于pytesseract/Pillow的批量OCR：多页文档（PDF、多帧TIFF）拆分为单页，
+各页经图像预处理后在进程池中并行识别，并统计每秒处理页数
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .logging_utils import get_logger
+from .image_preprocess import ImagePreprocessor, page_count, _require
+
+logger = get_logger("ocr_engine")
+
+# 默认识别语言（简体中文 + 英文）
+DEFAULT_LANG = "chi_sim+eng"
+
+
+def ocr_page(path, page, lang, preprocessor):
+    """
+    识别文档的单页，作为进程池任务运行
+    :param path: 文件路径
+    :param page: 页码，从0开始
+    :param lang: tesseract识别语言
+    :param preprocessor: 图像预处理器（ImagePreprocessor）
+    :return: 识别文本
+    """
+    pytesseract = _require("pytesseract", "pytesseract")
+    return pytesseract.image_to_string(preprocessor.for_ocr(path, page), lang=lang)
+
+
+def _init_worker():
+    """进程池初始化：各进程内tesseract只用单线程，避免多进程并行时线程超额"""
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def parse_id_card(text):
+    """
+    从身份证OCR文本中提取字段
+    :param text: 识别文本
+    :return: 姓名、身份证号、住址、签发日期和有效期
+    """
+    compact = re.sub(r"[ \t]+", "", text)
+    fields = {"name": None, "id_number": None, "address": None, "issue_date": None, "expiry_date": None}
+    match = re.search(r"\d{17}[\dXx]", compact)
+    if match:
+        fields["id_number"] = match.group(0).upper()
+    match = re.search(r"姓名(.+?)(?=性别|公民身份号码|\n|$)", compact)
+    if match:
+        fields["name"] = match.group(1)
+    match = re.search(r"住址(.+?)(?=公民身份号码|\n|$)", compact)
+    if match:
+        fields["address"] = match.group(1)
+    match = re.search(r"(\d{4}\.\d{2}\.\d{2})-(\d{4}\.\d{2}\.\d{2}|长期)", compact)
+    if match:
+        fields["issue_date"], fields["expiry_date"] = match.groups()
+    return fields
+
+
+class OCREngine:
+    """
+    批量OCR引擎
+    """
+
+    def __init__(self, max_workers=None, lang=DEFAULT_LANG, preprocessor=None):
+        """
+        初始化OCR引擎
+        :param max_workers: 识别进程数，默认为CPU核数；为0或1时在当前进程中识别
+        :param lang: tesseract识别语言
+        :param preprocessor: 图像预处理器（ImagePreprocessor），与多模态模型共用解码和裁剪结果
+        """
+        self.max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        self.lang = lang
+        self.preprocessor = preprocessor if preprocessor is not None else ImagePreprocessor()
+        self._pool = None
+        self._lock = threading.Lock()
+        self.stats = {"documents": 0, "pages": 0, "failed": 0, "seconds": 0.0}
+
+    def recognize(self, path):
+        """
+        识别单个文档
+        :param path: 文件路径
+        :return: 识别结果，包含全文text、各页文本pages和页数page_count
+        """
+        return self.recognize_batch([path])[0]
+
+    def recognize_batch(self, paths):
+        """
+        批量识别文档，所有文档的所有页面一起并行识别
+        单个文档无法读取或某页识别失败时只影响该文档：结果中error为失败原因，失败页的文本为空；
+        缺少OCR依赖时直接抛出
+        :param paths: 文件路径列表
+        :return: 与输入顺序一致的识别结果列表
+        """
+        started = time.perf_counter()
+        errors = [None] * len(paths)
+        counts = []
+        for index, path in enumerate(paths):
+            try:
+                counts.append(page_count(path))
+            except ImportError:
+                raise
+            except Exception as exc:
+                errors[index] = f"{type(exc).__name__}: {exc}"
+                counts.append(0)
+        tasks = [(index, path, page) for index, (path, count) in enumerate(zip(paths, counts))
+                 for page in range(count)]
+
+        if self.max_workers <= 1 or len(tasks) <= 1:
+            outcomes = [self._run_page(lambda: ocr_page(path, page, self.lang, self.preprocessor))
+                        for _, path, page in tasks]
+        else:
+            pool = self._get_pool()
+            futures = [pool.submit(ocr_page, path, page, self.lang, self.preprocessor) for _, path, page in tasks]
+            outcomes = [self._run_page(future.result) for future in futures]
+            if any(isinstance(error, BrokenProcessPool) for _, error in outcomes):
+                # 识别进程异常退出后进程池不可用，下一批重新创建
+                self._discard_pool(pool)
+
+        pages = [[] for _ in paths]
+        for (index, path, page), (text, error) in zip(tasks, outcomes):
+            pages[index].append(text)
+            if error is not None and errors[index] is None:
+                errors[index] = f"第{page + 1}页识别失败: {type(error).__name__}: {error}"
+
+        results = []
+        for path, count, document_pages, error in zip(paths, counts, pages, errors):
+            result = {"text": "\n".join(document_pages), "pages": document_pages, "page_count": count}
+            if error is not None:
+                logger.warning("OCR识别 %s 失败: %s", path, error)
+                result["error"] = error
+            results.append(result)
+
+        elapsed = time.perf_counter() - started
+        failed = sum(error is not None for error in errors)
+        with self._lock:
+            self.stats["documents"] += len(paths)
+            self.stats["pages"] += len(tasks)
+            self.stats["failed"] += failed
+            self.stats["seconds"] += elapsed
+        logger.info("OCR完成: %d 个文档（失败 %d 个）, %d 页, %.1f 页/秒", len(paths), failed, len(tasks),
+                    len(tasks) / elapsed if elapsed > 0 else 0.0)
+        return results
+
+    @staticmethod
+    def _run_page(recognize):
+        """
+        执行单页识别，缺少OCR依赖以外的异常作为该页的失败返回
+        :param recognize: 返回识别文本的函数
+        :return: (识别文本, 异常)，失败时文本为空
+        """
+        try:
+            return recognize(), None
+        except ImportError:
+            raise
+        except Exception as exc:
+            return "", exc
+
+    def _get_pool(self):
+        """首次并行识别时创建进程池"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+            return self._pool
+
+    def get_stats(self):
+        """
+        获取识别统计
+        :return: 文档数、页数、识别失败的文档数、累计耗时和每秒处理页数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        stats["pages_per_sec"] = stats["pages"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        return stats
+
+    def _discard_pool(self, pool):
+        """
+        丢弃不可用的进程池
+        :param pool: 不可用的进程池
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def close(self):
+        """关闭进程池"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def __getstate__(self):
+        """序列化到子进程时不携带进程池和锁"""
+        state = self.__dict__.copy()
+        del state["_pool"]
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建锁，进程池按需创建"""
+        self.__dict__.update(state)
+        self._pool = None
+        self._lock = threading.Lock()
@@ -0,0 +1,118 @@
+"""
+规则预筛模块
+在调用大模型之前用确定性规则处理结论明确的申请：
+命中欺诈规则且决策规则给出拒绝的直接拒绝，满足预筛批准条件的干净老客户直接批准，
+其余申请升级到大模型分析
+"""
+
+from .identity_index import KIND_ID_NUMBER
+from .logging_utils import get_logger
+from .records import FraudResult, DecisionResult
+
+logger = get_logger("prescreen")
+
+# 预筛结论所在的处理层级
+TIER_PRESCREEN = "prescreen"
+TIER_MODEL = "model"
+
+
+class PreScreener:
+    """
+    确定性规则预筛
+    """
+
+    def __init__(self, rule_engine, config=None):
+        """
+        初始化预筛
+        :param rule_engine: 规则引擎（RuleEngine），欺诈规则、决策规则和预筛批准条件均从中读取
+        :param config: 升级配置：
+                       reject - 是否直接拒绝命中欺诈规则的申请，默认True
+                       approve - 是否直接批准满足预筛批准条件的申请，默认True
+                       reject_min_confidence - 直接拒绝要求的最低欺诈置信度，低于该值时升级到大模型，默认0
+        """
+        config = config or {}
+        self.rule_engine = rule_engine
+        self.reject = config.get("reject", True)
+        self.approve = config.get("approve", True)
+        self.reject_min_confidence = config.get("reject_min_confidence", 0)
+
+    def screen(self, customer_data):
+        """
+        预筛单个申请
+        :param customer_data: 客户数据
+        :return: 结论明确时返回包含fraud_result、decision_result、approval_advice的预筛结果，需要升级时返回None
+        """
+        fraud_result = FraudResult.from_dict(self.rule_engine.evaluate_fraud(customer_data))
+        degraded_sources = customer_data.get("degraded_sources") or []
+
+        if fraud_result.is_fraud:
+            if not self.reject or fraud_result.confidence < self.reject_min_confidence:
+                return None
+            # 按决策规则判断欺诈结果，评分未知的情况下仍给出拒绝的才直接拒绝
+            decision, reason = self.rule_engine.decision_ladder.decide({
+                "risk_score": None,
+                "is_fraud": True,
+                "indicators": ', '.join(fraud_result.indicators),
+                "confidence": fraud_result.confidence
+            })
+            if decision != "REJECT":
+                return None
+            advice = "预筛规则命中欺诈指标，建议拒绝申请。"
+        elif self.approve and not degraded_sources and self._identity_checked(customer_data) and \
+                self._is_clean(customer_data) and self._velocity_allows(customer_data):
+            decision = "APPROVE"
+            reason = "老客户且各项预筛规则检查通过，免模型分析直接批准"
+            advice = "该客户为干净的老客户，建议批准申请。"
+        else:
+            return None
+
+        logger.debug("客户 %s 预筛结论: %s", customer_data.get("customer_id"), decision)
+        return {
+            "fraud_result": fraud_result,
+            "decision_result": DecisionResult(
+                decision=decision,
+                reason=reason,
+                risk_score=None,
+                fraud_detected=fraud_result.is_fraud,
+                fraud_indicators=fraud_result.indicators,
+                confidence=fraud_result.confidence,
+                degraded_sources=degraded_sources
+            ),
+            "approval_advice": advice
+        }
+
+    @staticmethod
+    def _identity_checked(customer_data):
+        """
+        判断是否已按身份证号查询过黑名单，手机号脱敏等情况下没有强标识时不能直接批准
+        :param customer_data: 客户数据
+        :return: 身份标识中是否包含身份证号
+        """
+        identity_graph = customer_data.get("identity_graph") or {}
+        return any(kind == KIND_ID_NUMBER for kind, _ in identity_graph.get("identifiers") or [])
+
+    def _velocity_allows(self, customer_data):
+        """
+        按决策规则检查速率特征（同一手机号或地区申请量激增等转人工复核的规则），评分未知时不命中评分规则
+        :param customer_data: 客户数据
+        :return: 决策规则是否仍给出批准
+        """
+        velocity = customer_data.get("velocity") or {}
+        decision, _ = self.rule_engine.decision_ladder.decide({
+            **(velocity.get("features") or {}),
+            "risk_score": None,
+            "is_fraud": False,
+            "indicators": "",
+            "confidence": 0
+        })
+        return decision == "APPROVE"
+
+    def _is_clean(self, customer_data):
+        """
+        判断是否满足全部预筛批准条件
+        :param customer_data: 客户数据
+        :return: 是否满足
+        """
+        approve_rules = self.rule_engine.prescreen_approve_rules
+        matched, _ = approve_rules.evaluate(customer_data)
+        return len(matched) == approve_rules.rule_count
@@ -3,19 +3,45 @@
 负责执行后续流程（标记、预警、通知、阻断等）
 """
 
+from .async_utils import run_sync
+from .log_store import LogStore
+from .identity_index import extract_identifiers
+from .logging_utils import get_logger
+
+logger = get_logger("process_executor")
+
 class ProcessExecutor:
     """
     流程执行器
     根据风控决策执行相应的后续流程
     """
     
-    def __init__(self):
-        """初始化流程执行器"""
-        self.execution_log = []
+    def __init__(self, log_store=None, feedback_queue=None, notifier=None, identity_index=None):
+        """
+        初始化流程执行器
+        :param log_store: 执行记录存储（LogStore），默认为有界的内存存储
+        :param feedback_queue: 模型反馈队列（FeedbackQueue），为None时在处理流程中直接反馈
+        :param notifier: 通知分发器（NotificationDispatcher），为None时在处理流程中直接发送通知
+        :param identity_index: 身份标识索引（IdentityIndex），拒绝欺诈申请时将其身份标识加入黑名单
+        """
+        self.execution_log = log_store if log_store is not None else LogStore("execution_log")
+        self.feedback_queue = feedback_queue
+        self.notifier = notifier
+        self.identity_index = identity_index
     
     def execute_process(self, decision_result, customer_data, approval_advice):
         """
-        执行相应的流程
+        执行相应的流程（同步接口，内部运行异步实现）
+        :param decision_result: 决策结果
+        :param customer_data: 客户数据
+        :param approval_advice: 审批建议
+        :return: 执行结果
+        """
+        return run_sync(self.aexecute_process(decision_result, customer_data, approval_advice))
+    
+    async def aexecute_process(self, decision_result, customer_data, approval_advice):
+        """
+        异步执行相应的流程
         :param decision_result: 决策结果
         :param customer_data: 客户数据
         :param approval_advice: 审批建议
@@ -24,7 +50,7 @@ class ProcessExecutor:
         decision = decision_result["decision"]
         customer_id = customer_data.get("customer_id")
         
-        print(f"根据决策 {decision} 执行相应流程...")
+        logger.debug("根据决策 %s 执行相应流程", decision)
         
         if decision == "APPROVE":
             result = self._approve_process(customer_id, approval_advice, customer_data)
@@ -48,7 +74,7 @@ class ProcessExecutor:
     
     def _approve_process(self, customer_id, approval_advice, customer_data):
         """批准流程"""
-        print(f"  - 执行批准流程：为客户 {customer_id} 创建保单")
+        logger.info("执行批准流程：为客户 %s 创建保单", customer_id)
         # 这里可以集成实际的业务系统调用
         actions = [
             f"创建保单客户 {customer_id}",
@@ -57,7 +83,7 @@ class ProcessExecutor:
         ]
         
         for action in actions:
-            print(f"    - {action}")
+            logger.debug("%s", action)
         
         return {
             "status": "SUCCESS",
@@ -67,7 +93,7 @@ class ProcessExecutor:
     
     def _review_process(self, customer_id, approval_advice, customer_data):
         """复核流程"""
-        print(f"  - 执行复核流程：将客户 {customer_id} 标记为待复核")
+        logger.info("执行复核流程：将客户 %s 标记为待复核", customer_id)
         actions = [
             f"标记客户 {customer_id} 为待复核状态",
             "发送复核通知给风控专员",
@@ -75,7 +101,7 @@ class ProcessExecutor:
         ]
         
         for action in actions:
-            print(f"    - {action}")
+            logger.debug("%s", action)
         
         # 通知相关方
         self._send_notification(customer_id, "需要人工复核", "risk_review")
@@ -88,7 +114,7 @@ class ProcessExecutor:
     
     def _reject_process(self, customer_id, decision_result, approval_advice, customer_data):
         """拒绝流程"""
-        print(f"  - 执行拒绝流程：拒绝客户 {customer_id} 的申请")
+        logger.info("执行拒绝流程：拒绝客户 %s 的申请", customer_id)
         
         actions = [
             f"拒绝客户 {customer_id} 的申请",
@@ -97,9 +123,9 @@ class ProcessExecutor:
         ]
         
         for action in actions:
-            print(f"    - {action}")
+            logger.debug("%s", action)
         
-        # 如果检测到欺诈，执行额外的安全措施
+        # 如果检测到欺诈，执行额外的安全措施：身份标识写入黑名单索引，证据链记录由安全团队按通知摘要处理
         if decision_result.get("fraud_detected"):
             fraud_actions = [
                 f"将客户 {customer_id} 加入黑名单",
@@ -107,7 +133,15 @@ class ProcessExecutor:
                 "发送安全警报"
             ]
             for action in fraud_actions:
-                print(f"    - 欺诈相关操作: {action}")
+                logger.debug("欺诈相关操作: %s", action)
+            if self.identity_index is not None:
+                identity_graph = customer_data.get("identity_graph") or {}
+                identifiers = identity_graph.get("identifiers")
+                if identifiers is None:
+                    identifiers = extract_identifiers(customer_data)
+                self.identity_index.blacklist(identifiers)
+            self._send_notification(customer_id, "；".join(decision_result.get("fraud_indicators") or []),
+                                    "blacklist")
         
         # 通知相关方
         notification_type = "fraud_alert" if decision_result.get("fraud_detected") else "rejection"
@@ -122,26 +156,49 @@ class ProcessExecutor:
         }
     
     def _send_notification(self, customer_id, message, notification_type):
-        """发送通知"""
-        print(f"  - 发送通知: 类型={notification_type}, 客户={customer_id}, 消息={message}")
+        """发送通知，配置了通知分发器时合并为摘要异步发送"""
+        if self.notifier is not None:
+            return self.notifier.notify(customer_id, message, notification_type)
+        logger.info("发送通知: 类型=%s, 客户=%s, 消息=%s", notification_type, customer_id, message)
         # 这里可以集成邮件、短信、企业微信等通知方式
         return {"sent": True, "type": notification_type}
     
     def feedback_to_model(self, execution_result, customer_data):
         """
-        将执行结果反馈给模型，用于持续优化
+        将执行结果反馈给模型，用于持续优化（同步接口，内部运行异步实现）
+        :param execution_result: 执行结果
+        :param customer_data: 客户数据
+        :return: 反馈状态
+        """
+        return run_sync(self.afeedback_to_model(execution_result, customer_data))
+    
+    async def afeedback_to_model(self, execution_result, customer_data):
+        """
+        异步将执行结果反馈给模型，用于持续优化
+        配置了反馈队列时只将反馈事件入队，由后台线程批量发送到数据湖或机器学习平台
         :param execution_result: 执行结果
         :param customer_data: 客户数据
         :return: 反馈状态
         """
-        print("正在将执行结果反馈至风控平台，用于模型优化...")
-        # 这里可以将结果发送到数据湖或机器学习平台进行模型训练
         feedback_data = {
             "customer_id": customer_data.get("customer_id"),
             "execution_result": execution_result,
             "timestamp": __import__('datetime').datetime.now().isoformat()
         }
         
+        if self.feedback_queue is not None:
+            queued = await self.feedback_queue.aput(feedback_data)
+            logger.debug("客户 %s 的反馈事件已入队", feedback_data["customer_id"])
+            return {"status": "FEEDBACK_QUEUED" if queued else "FEEDBACK_DEFERRED", "data": feedback_data}
+        
         # 模拟反馈过程
-        print(f"  - 反馈数据: {feedback_data}")
-        return {"status": "FEEDBACK_SENT", "data": feedback_data}
\ No newline at end of file
+        logger.debug("正在将客户 %s 的执行结果反馈至风控平台，用于模型优化", feedback_data["customer_id"])
+        return {"status": "FEEDBACK_SENT", "data": feedback_data}
+    
+    def close(self):
+        """发送完队列中的反馈事件和待发送的通知摘要，并关闭执行记录存储"""
+        if self.feedback_queue is not None:
+            self.feedback_queue.close()
+        if self.notifier is not None:
+            self.notifier.close()
+        self.execution_log.close()
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""
+限流模块
+令牌桶限流器：按固定速率补充令牌，允许不超过桶容量的突发
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        """
+        初始化令牌桶
+        :param rate: 每秒补充的令牌数
+        :param capacity: 桶容量（允许的最大突发），默认为1秒的补充量且不小于1
+        :param clock: 单调时钟函数，便于测试时替换
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """按经过的时间补充令牌"""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount=1):
+        """
+        尝试取出令牌，不等待
+        :param amount: 令牌数
+        :return: 是否取到
+        """
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return True
+            return False
+
+    def wait_time(self, amount=1):
+        """
+        计算令牌足够还需等待的时间
+        :param amount: 令牌数
+        :return: 等待秒数，令牌已足够时为0
+        """
+        with self._lock:
+            self._refill(self._clock())
+            missing = amount - self._tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+    @property
+    def available(self):
+        """当前可用的令牌数"""
+        with self._lock:
+            self._refill(self._clock())
+            return self._tokens
+
+    def __getstate__(self):
+        """序列化时不携带锁，子进程中的令牌桶从满桶开始"""
+        return {"rate": self.rate, "capacity": self.capacity}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -0,0 +1,149 @@
+"""
+处理记录类型模块
+分析结果、欺诈检测结果、决策结果和处理记录使用__slots__数据类表示，
+比嵌套字典占用更少内存；记录之间共享引用而不复制，
+同时保留字典式访问（record["decision"]、record.get(...)），兼容原有调用方
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+class Record:
+    """
+    支持字典式访问的记录基类
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key in self.__dataclass_fields__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        """按字段名取值，字段不存在时返回默认值"""
+        if key in self.__dataclass_fields__:
+            return getattr(self, key)
+        return default
+
+    def __contains__(self, key):
+        return key in self.__dataclass_fields__
+
+    def __iter__(self):
+        return iter(self.__dataclass_fields__)
+
+    def __len__(self):
+        return len(self.__dataclass_fields__)
+
+    def keys(self):
+        """字段名"""
+        return self.__dataclass_fields__.keys()
+
+    def values(self):
+        """字段值列表"""
+        return [getattr(self, name) for name in self.__dataclass_fields__]
+
+    def items(self):
+        """(字段名, 字段值) 列表"""
+        return [(name, getattr(self, name)) for name in self.__dataclass_fields__]
+
+    def to_dict(self):
+        """
+        转换为普通字典，嵌套的记录一并转换，其余值共享引用
+        :return: 字典
+        """
+        return {name: _plain(getattr(self, name)) for name in self.__dataclass_fields__}
+
+    def to_json(self):
+        """
+        序列化为紧凑的JSON文本
+        :return: JSON文本
+        """
+        return json.dumps(self, ensure_ascii=False, separators=(",", ":"), default=json_default)
+
+    def __reduce__(self):
+        """按字段顺序序列化为位置参数，比字典形式更紧凑"""
+        return self.__class__, tuple([getattr(self, name) for name in self.__dataclass_fields__])
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        从字典构造记录，忽略未知字段；传入的已是本类型记录时直接返回
+        :param data: 字典
+        :return: 记录
+        """
+        if isinstance(data, cls):
+            return data
+        fields = cls.__dataclass_fields__
+        return cls(**{key: value for key, value in data.items() if key in fields})
+
+
+def _plain(value):
+    """将记录转换为字典，其他值原样返回"""
+    return value.to_dict() if isinstance(value, Record) else value
+
+
+def json_default(value):
+    """
+    JSON序列化的兜底转换：记录转换为字典，其余对象转换为字符串
+    :param value: 无法直接序列化的对象
+    :return: 可序列化的值
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    return str(value)
+
+
+@dataclass(slots=True)
+class AnalysisResult(Record):
+    """多模态分析结果"""
+    id_analysis: dict
+    income_analysis: dict
+    form_analysis: dict
+    overall_risk_score: Any
+
+
+@dataclass(slots=True)
+class FraudResult(Record):
+    """欺诈检测结果"""
+    is_fraud: bool
+    indicators: list
+    confidence: float = 0
+
+
+@dataclass(slots=True)
+class DecisionResult(Record):
+    """风控决策结果"""
+    decision: str
+    reason: Optional[str] = None
+    risk_score: Any = None
+    fraud_detected: bool = False
+    fraud_indicators: Optional[list] = None
+    confidence: float = 0
+    degraded_sources: Optional[list] = None
+
+
+@dataclass(slots=True)
+class ProcessRecord(Record):
+    """单个申请的处理记录，各阶段结果以引用方式保存"""
+    customer_id: str
+    decision_result: DecisionResult
+    customer_data: Optional[dict] = None
+    analysis_result: Optional[AnalysisResult] = None
+    fraud_result: Optional[FraudResult] = None
+    approval_advice: Optional[str] = None
+    execution_result: Optional[dict] = None
+    feedback_result: Optional[dict] = None
+    tier: Optional[str] = None
+    processing_time: Optional[float] = None
+    stage_timings: Optional[dict] = None
+    completed_at: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
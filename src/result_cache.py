@@ -0,0 +1,221 @@
+"""
+结果缓存模块
+以内容哈希为键缓存OCR和LLM分析结果，支持内存LRU/TTL层和可选的SQLite磁盘层
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# 默认内存层最大条目数
+DEFAULT_MAX_ENTRIES = 10000
+# 进程内记忆的文件内容哈希数，按LRU淘汰
+FILE_DIGEST_CACHE_SIZE = 10000
+
+# 缓存未命中标记
+MISSING = object()
+
+
+class ResultCache:
+    """
+    两级结果缓存
+    内存层按LRU淘汰并支持TTL过期，磁盘层（可选）使用SQLite持久化，进程重启后仍可命中；
+    缓存的值应视为只读
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=None, sqlite_path=None):
+        """
+        初始化结果缓存
+        :param max_entries: 内存层最大条目数
+        :param ttl: 条目有效期（秒），None表示永不过期
+        :param sqlite_path: SQLite数据库路径，为None时不启用磁盘层
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0}
+        self._init_storage()
+
+    def _init_storage(self):
+        """初始化内存层和磁盘层"""
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._db = None
+        if self.sqlite_path:
+            self._db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        """
+        读取缓存
+        :param key: 缓存键
+        :return: 缓存值，未命中时返回MISSING
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM result_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and (row[1] is None or row[1] > now):
+                    value = json.loads(row[0])
+                    self._put_memory(key, value, row[1])
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+            return MISSING
+
+    def set(self, key, value):
+        """
+        写入缓存
+        :param key: 缓存键
+        :param value: 可JSON序列化的缓存值
+        """
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO result_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False, default=str), expires_at)
+                )
+                self._db.commit()
+
+    def get_or_compute(self, key, compute):
+        """
+        读取缓存，未命中时计算并写入
+        :param key: 缓存键
+        :param compute: 无参计算函数
+        :return: 缓存值或计算结果
+        """
+        value = self.get(key)
+        if value is MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def _put_memory(self, key, value, expires_at):
+        """在持有锁的情况下写入内存层并按LRU淘汰"""
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def purge_expired(self):
+        """清理两级缓存中的过期条目"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._memory.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM result_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+                self._db.commit()
+
+    def get_stats(self):
+        """
+        获取缓存统计信息
+        :return: 命中/未命中次数、命中率和内存层条目数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups > 0 else 0
+        return stats
+
+    def close(self):
+        """关闭磁盘层连接"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __getstate__(self):
+        """序列化时只保留配置和统计，内存层和连接在子进程中重建"""
+        state = self.__dict__.copy()
+        for key in ("_lock", "_memory", "_db"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重新打开存储"""
+        self.__dict__.update(state)
+        self._init_storage()
+
+
+_file_digests = OrderedDict()
+_file_digests_lock = threading.Lock()
+
+
+def _file_digest(path):
+    """
+    计算文件内容的哈希，按(路径, 修改时间, 大小)记忆，文件未变时不重复读取；
+    记忆条目数有上限，按LRU淘汰
+    :param path: 文件路径
+    :return: 内容哈希
+    """
+    stat = os.stat(path)
+    memo_key = (path, stat.st_mtime_ns, stat.st_size)
+    with _file_digests_lock:
+        digest = _file_digests.get(memo_key)
+        if digest is not None:
+            _file_digests.move_to_end(memo_key)
+            return digest
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    with _file_digests_lock:
+        _file_digests[memo_key] = digest
+        while len(_file_digests) > FILE_DIGEST_CACHE_SIZE:
+            _file_digests.popitem(last=False)
+    return digest
+
+
+def _fingerprint(value):
+    """将输入中存在的文件路径替换为文件内容哈希，使相同内容的文件得到相同的键"""
+    if isinstance(value, str):
+        if os.path.isfile(value):
+            return {"file_sha256": _file_digest(value)}
+        return value
+    if isinstance(value, dict):
+        return {str(key): _fingerprint(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_fingerprint(item) for item in value]
+    return value
+
+
+def content_key(namespace, payload, **params):
+    """
+    生成内容寻址的缓存键
+    :param namespace: 命名空间，如"ocr"、"llm:id_card"
+    :param payload: 输入内容，其中的文件路径按文件内容计算
+    :param params: 影响结果的其他参数，如模型名称和温度
+    :return: 缓存键
+    """
+    material = json.dumps([namespace, _fingerprint(payload), params],
+                          ensure_ascii=False, sort_keys=True, default=str)
+    return f"{namespace}:{hashlib.sha256(material.encode('utf-8')).hexdigest()}"
@@ -3,23 +3,27 @@
 负责基于分析结果做出风控决策
 """
 
+from .logging_utils import get_logger
+from .rule_engine import RuleEngine, DEFAULT_RISK_THRESHOLDS
+from .records import DecisionResult
+
+logger = get_logger("risk_decision_engine")
+
+
 class RiskDecisionEngine:
     """
     风控决策引擎
     根据LLM分析结果和预设规则做出风控决策
     """
     
-    def __init__(self, risk_thresholds=None):
+    def __init__(self, risk_thresholds=None, rule_engine=None):
         """
         初始化风控决策引擎
         :param risk_thresholds: 风险阈值配置
+        :param rule_engine: 规则引擎（RuleEngine），为None时按风险阈值使用默认决策规则
         """
-        # 默认风险阈值
-        self.risk_thresholds = risk_thresholds or {
-            "low_risk": 20,
-            "medium_risk": 50,
-            "high_risk": 80
-        }
+        self.risk_thresholds = risk_thresholds or dict(DEFAULT_RISK_THRESHOLDS)
+        self.rule_engine = rule_engine if rule_engine is not None else RuleEngine(thresholds=self.risk_thresholds)
     
     def make_decision(self, analysis_result, fraud_detection_result, customer_data):
         """
@@ -29,37 +33,50 @@ class RiskDecisionEngine:
         :param customer_data: 客户数据
         :return: 决策结果
         """
-        print("风控决策引擎正在处理分析结果...")
+        logger.debug("风控决策引擎正在处理分析结果")
         
         risk_score = analysis_result["overall_risk_score"]
         is_fraud = fraud_detection_result["is_fraud"]
         
-        # 根据风险评分和欺诈检测结果做出决策
-        if is_fraud:
-            decision = "REJECT"
-            reason = f"检测到欺诈行为: {', '.join(fraud_detection_result['indicators'])}"
-        elif risk_score >= self.risk_thresholds["high_risk"]:
-            decision = "REJECT"
-            reason = f"风险评分过高({risk_score})，超过高风险阈值({self.risk_thresholds['high_risk']})"
-        elif risk_score >= self.risk_thresholds["medium_risk"]:
-            decision = "REVIEW"
-            reason = f"中等风险({risk_score})，需要人工复核"
-        else:
-            decision = "APPROVE"
-            reason = f"风险评分较低({risk_score})，符合准入标准"
-        
-        decision_result = {
-            "decision": decision,
-            "reason": reason,
+        # 根据风险评分、欺诈检测结果和速率特征按决策规则做出决策
+        velocity = (customer_data or {}).get("velocity") or {}
+        decision, reason = self.rule_engine.decision_ladder.decide({
+            **(velocity.get("features") or {}),
             "risk_score": risk_score,
-            "fraud_detected": is_fraud,
-            "fraud_indicators": fraud_detection_result.get("indicators", []),
+            "is_fraud": is_fraud,
+            "indicators": ', '.join(fraud_detection_result.get("indicators", [])),
             "confidence": fraud_detection_result.get("confidence", 0)
-        }
+        })
         
-        print(f"  - 决策: {decision}, 原因: {reason}")
+        # 数据源降级时信息不完整，不自动批准
+        degraded_sources = (customer_data or {}).get("degraded_sources") or []
+        if degraded_sources and decision == "APPROVE":
+            decision = "REVIEW"
+            reason = f"数据源降级({', '.join(degraded_sources)})，{reason}，需要人工复核"
+        
+        decision_result = DecisionResult(
+            decision=decision,
+            reason=reason,
+            risk_score=risk_score,
+            fraud_detected=is_fraud,
+            fraud_indicators=fraud_detection_result.get("indicators", []),
+            confidence=fraud_detection_result.get("confidence", 0),
+            degraded_sources=degraded_sources
+        )
+        
+        logger.info("决策: %s, 原因: %s", decision, reason)
         return decision_result
     
+    def make_decisions_batch(self, frame):
+        """
+        批量做出风控决策，结果与逐条调用make_decision一致
+        :param frame: 列式输入（pandas.DataFrame或列名到NumPy数组的字典），
+                      字段见batch_scoring.make_decisions，可用batch_scoring.results_to_frame构造
+        :return: 包含decision、reason、risk_score等列的DataFrame
+        """
+        from .batch_scoring import make_decisions
+        return make_decisions(frame, self.rule_engine.decision_ladder)
+    
     def generate_risk_report(self, analysis_result, decision_result, customer_data):
         """
         生成风险评估报告
@@ -68,7 +85,7 @@ class RiskDecisionEngine:
         :param customer_data: 客户数据
         :return: 风险报告
         """
-        print("生成风险评估报告...")
+        logger.debug("生成风险评估报告")
 
         report = {
             "customer_id": customer_data.get("customer_id"),
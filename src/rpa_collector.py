@@ -3,19 +3,78 @@ RPA数据采集模块
 负责自动登录系统、抓取数据、OCR识别等功能
 """
 
+import asyncio
+import os
+import re
+import threading
+
+from .async_utils import run_sync
+from .documents import DocumentRef, spill_documents, remove_documents
+from .ocr_engine import OCREngine, parse_id_card
+from .session_pool import SessionPool
+from .result_cache import content_key, MISSING
+from .log_store import LogStore
+from .tracing import span
+from .logging_utils import get_logger
+
+logger = get_logger("rpa_collector")
+
+# 各数据源所在的后端系统
+SOURCE_SYSTEMS = {
+    "id_card": "crm_system",
+    "income_proof": "bank_system",
+    "phone_info": "crm_system",
+    "history_records": "credit_system",
+    "application_form": "crm_system"
+}
+
+# 结构化数据源，体积小，预筛和欺诈规则都会用到
+STRUCTURED_SOURCES = ("phone_info", "history_records", "application_form")
+# 文档类数据源（证件照片、收入证明），只在大模型分析时才需要
+DOCUMENT_SOURCES = ("id_card", "income_proof")
+# 预筛前需要采集的数据源：结构化数据源加身份证，身份证号是查询黑名单的强标识
+PRESCREEN_SOURCES = STRUCTURED_SOURCES + ("id_card",)
+
+# 单个数据源的默认采集超时时间（秒）
+DEFAULT_SOURCE_TIMEOUT = 10.0
+
+
 class RPADataCollector:
     """
     RPA数据采集器
     模拟RPA机器人的数据抓取功能
     """
     
-    def __init__(self, system_configs):
+    def __init__(self, system_configs, source_timeout=DEFAULT_SOURCE_TIMEOUT, cache=None, log_store=None,
+                 ocr_engine=None, image_preprocessor=None):
         """
         初始化RPA数据采集器
-        :param system_configs: 系统配置信息
+        :param system_configs: 系统配置信息，每个系统可通过"timeout"单独配置采集超时
+        :param source_timeout: 未单独配置时的数据源采集超时（秒）
+        :param cache: OCR结果缓存（ResultCache），为None时不缓存
+        :param log_store: 采集记录存储（LogStore），默认为有界的内存存储
+        :param ocr_engine: OCR引擎（OCREngine），默认在首次识别真实文件时创建
+        :param image_preprocessor: 图像预处理器（ImagePreprocessor），用于默认创建的OCR引擎
         """
         self.system_configs = system_configs
-        self.collected_data = []
+        self.source_timeout = source_timeout
+        self.cache = cache
+        self.collected_data = log_store if log_store is not None else LogStore("collected_data")
+        self.ocr_engine = ocr_engine
+        self.image_preprocessor = image_preprocessor
+        # 客户ID -> 采集时落盘的文档，客户处理结束后删除
+        self._documents = {}
+        # 按系统复用已登录的会话，避免每个客户重复登录；后台定期检查空闲会话，在close时停止
+        self.session_pool = SessionPool(system_configs, self.login_system, self.check_session)
+        self.session_pool.start_keepalive()
+        # 模拟抓取不同类型的客户数据
+        self.collectors = {
+            "id_card": self._collect_id_card,
+            "income_proof": self._collect_income_proof,
+            "phone_info": self._collect_phone_info,
+            "history_records": self._collect_history_records,
+            "application_form": self._collect_application_form
+        }
         
     def login_system(self, system_name):
         """
@@ -23,47 +82,149 @@ class RPADataCollector:
         :param system_name: 系统名称
         :return: 登录状态
         """
-        print(f"RPA机器人正在登录{system_name}系统...")
+        logger.info("RPA机器人正在登录%s系统", system_name)
         # 模拟登录过程
         return True
     
-    def collect_customer_data(self, customer_id):
+    def check_session(self, session):
+        """
+        模拟检查会话是否仍然有效
+        :param session: 会话对象
+        :return: 会话是否可用
+        """
+        # 实际对接时可调用系统的心跳接口
+        return not session.is_expired()
+    
+    def collect_customer_data(self, customer_id, prefetch=None):
+        """
+        收集客户数据（同步接口，内部运行异步实现）
+        :param customer_id: 客户ID
+        :param prefetch: 立即采集的数据源，None表示全部数据源
+        :return: 收集的客户数据（LazyCustomerData）
+        """
+        return run_sync(self.acollect_customer_data(customer_id, prefetch))
+    
+    async def acollect_customer_data(self, customer_id, prefetch=None):
         """
-        收集客户数据
+        异步收集客户数据
+        prefetch中的数据源立即并发采集，采集延迟取决于最慢的数据源；其余数据源在首次访问时才采集，
+        提前结束的申请不会采集没有用到的文档。
+        超时或失败的数据源置为None，并记录在degraded_sources中供风控决策使用
         :param customer_id: 客户ID
-        :return: 收集的客户数据
+        :param prefetch: 立即采集的数据源，None表示全部数据源
+        :return: 收集的客户数据（LazyCustomerData）
         """
-        print(f"RPA机器人正在抓取客户 {customer_id} 的数据...")
+        logger.debug("RPA机器人正在抓取客户 %s 的数据", customer_id)
         
-        # 模拟抓取不同类型的客户数据
-        customer_data = {
-            "customer_id": customer_id,
-            "id_card": self._collect_id_card(customer_id),
-            "income_proof": self._collect_income_proof(customer_id),
-            "phone_info": self._collect_phone_info(customer_id),
-            "history_records": self._collect_history_records(customer_id),
-            "application_form": self._collect_application_form(customer_id)
-        }
+        customer_data = LazyCustomerData(customer_id, self)
+        await customer_data.aload(*(prefetch if prefetch is not None else self.collectors))
         
         self.collected_data.append(customer_data)
         return customer_data
     
+    def fetch_source(self, source, customer_id):
+        """
+        同步采集单个数据源，供懒加载记录在首次访问字段时调用
+        不在事件循环中时运行带超时的异步实现；在事件循环中同步访问会阻塞事件循环，直接报错
+        :param source: 数据源名称
+        :param customer_id: 客户ID
+        :return: (是否成功, 采集结果)
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return run_sync(self._afetch_source(source, self.collectors[source], customer_id))
+        raise RuntimeError(f"数据源 {source} 尚未采集，在事件循环中请先 await customer_data.aload()")
+    
+    async def _afetch_source(self, source, collector, customer_id):
+        """
+        带超时地采集单个数据源
+        :param source: 数据源名称
+        :param collector: 采集函数
+        :param customer_id: 客户ID
+        :return: (是否成功, 采集结果)
+        """
+        system_name = SOURCE_SYSTEMS.get(source)
+        timeout = self.get_source_timeout(system_name)
+        with span(f"rpa.{source}", system=system_name) as source_span:
+            try:
+                value = await asyncio.wait_for(self._afetch_with_session(system_name, collector, customer_id),
+                                               timeout)
+            except asyncio.TimeoutError:
+                logger.warning("数据源 %s(%s) 采集超时（%s秒），标记为降级", source, system_name, timeout)
+                _mark_degraded(source_span, "timeout")
+                return False, None
+            except Exception as exc:
+                logger.warning("数据源 %s(%s) 采集失败: %s，标记为降级", source, system_name, exc)
+                _mark_degraded(source_span, repr(exc))
+                return False, None
+        # 采集器返回的二进制文档内容落盘，记录中只保留文档引用
+        stored = []
+        value = spill_documents(value, f"{source}_{customer_id}", stored=stored)
+        if stored:
+            self._documents.setdefault(customer_id, []).extend(stored)
+        return True, value
+
+    def release_documents(self, customer_id):
+        """
+        删除客户采集时落盘的文档及由其生成的送模型图像，客户处理结束后调用
+        :param customer_id: 客户ID
+        """
+        documents = self._documents.pop(customer_id, ())
+        if self.image_preprocessor is not None:
+            for document in documents:
+                self.image_preprocessor.discard(document)
+        remove_documents(documents)
+    
+    def get_source_timeout(self, system_name):
+        """
+        获取指定系统的采集超时时间
+        :param system_name: 系统名称
+        :return: 超时时间（秒）
+        """
+        config = self.system_configs.get(system_name) or {}
+        return config.get("timeout", self.source_timeout)
+    
+    async def _afetch_with_session(self, system_name, collector, customer_id):
+        """
+        从会话池取得系统会话后采集数据源
+        :param system_name: 系统名称
+        :param collector: 采集函数
+        :param customer_id: 客户ID
+        :return: 采集结果
+        """
+        async with self.session_pool.asession(system_name):
+            return await self._afetch(collector, customer_id)
+    
+    async def _afetch(self, collector, customer_id):
+        """
+        调用单个数据源采集器
+        协程采集器（真实的异步系统对接）直接等待；同步采集器在线程中运行，
+        多个数据源并发采集，且阻塞的采集器同样受超时控制（超时后线程中的调用结束前结果被丢弃）
+        :param collector: 采集函数
+        :param customer_id: 客户ID
+        :return: 采集结果
+        """
+        if asyncio.iscoroutinefunction(collector):
+            return await collector(customer_id)
+        return await asyncio.to_thread(collector, customer_id)
+    
     def _collect_id_card(self, customer_id):
         """收集身份证信息"""
-        print("  - 收集身份证照片（正反面）")
+        logger.debug("收集身份证照片（正反面）")
         return {
-            "front": f"id_card_front_{customer_id}.jpg",
-            "back": f"id_card_back_{customer_id}.jpg"
+            "front": DocumentRef(f"id_card_front_{customer_id}.jpg"),
+            "back": DocumentRef(f"id_card_back_{customer_id}.jpg")
         }
     
     def _collect_income_proof(self, customer_id):
         """收集收入证明"""
-        print("  - 收集收入证明（PDF/图片）")
-        return [f"income_proof_{customer_id}_1.pdf", f"income_proof_{customer_id}_2.jpg"]
+        logger.debug("收集收入证明（PDF/图片）")
+        return [DocumentRef(f"income_proof_{customer_id}_1.pdf"), DocumentRef(f"income_proof_{customer_id}_2.jpg")]
     
     def _collect_phone_info(self, customer_id):
         """收集手机号实名信息"""
-        print("  - 收集手机号实名信息")
+        logger.debug("收集手机号实名信息")
         return {
             "phone_number": f"138****{customer_id[-4:]}",
             "real_name": f"客户{customer_id}",
@@ -73,7 +234,7 @@ class RPADataCollector:
     
     def _collect_history_records(self, customer_id):
         """收集历史保单记录"""
-        print("  - 收集历史保单记录")
+        logger.debug("收集历史保单记录")
         return [
             {"policy_id": f"POL{customer_id}001", "status": "正常", "claim_history": []},
             {"policy_id": f"POL{customer_id}002", "status": "已结案", "claim_history": [{"date": "2024-01-15", "amount": 5000}]}
@@ -81,7 +242,7 @@ class RPADataCollector:
     
     def _collect_application_form(self, customer_id):
         """收集申请表单内容"""
-        print("  - 收集申请表单内容")
+        logger.debug("收集申请表单内容")
         return {
             "product_type": "健康保险",
             "insurance_amount": 100000,
@@ -95,15 +256,151 @@ class RPADataCollector:
         :param image_path: 图片路径
         :return: 识别结果
         """
-        print(f"正在对 {image_path} 进行OCR识别...")
-        # 模拟OCR识别结果
+        return self.ocr_recognize_batch([image_path])[0]
+    
+    def ocr_recognize_batch(self, image_paths):
+        """
+        批量OCR识别，未命中缓存的文件一起交给OCR引擎并行识别
+        :param image_paths: 图片/PDF路径列表
+        :return: 与输入顺序一致的识别结果列表
+        """
+        results = [None] * len(image_paths)
+        pending = {}
+        for index, path in enumerate(image_paths):
+            key = content_key("ocr", path) if self.cache is not None else None
+            cached = self.cache.get(key) if key is not None else MISSING
+            if cached is not MISSING:
+                results[index] = cached
+            else:
+                pending.setdefault(path, []).append((index, key))
+        
+        files = [path for path in pending if os.path.isfile(path)]
+        recognized = dict(zip(files, self._run_ocr_batch(files))) if files else {}
+        for path, slots in pending.items():
+            result = recognized[path] if path in recognized else self._mock_ocr(path)
+            for index, key in slots:
+                results[index] = result
+                # 识别失败的结果不缓存，下次重新识别
+                if key is not None and "error" not in result:
+                    self.cache.set(key, result)
+        return results
+    
+    def _run_ocr_batch(self, paths):
+        """
+        使用OCR引擎识别真实文件，身份证图片额外提取结构化字段
+        :param paths: 文件路径列表
+        :return: 识别结果列表
+        """
+        if self.ocr_engine is None:
+            self.ocr_engine = OCREngine(preprocessor=self.image_preprocessor)
+        results = self.ocr_engine.recognize_batch(paths)
+        for path, result in zip(paths, results):
+            if "id_card" in os.path.basename(path):
+                result.update(parse_id_card(result["text"]))
+        return results
+    
+    def _mock_ocr(self, image_path):
+        """
+        模拟OCR识别，用于模拟采集器返回的不存在的文件路径
+        :param image_path: 图片路径
+        :return: 识别结果
+        """
+        logger.debug("正在对 %s 进行OCR识别", image_path)
+        # 模拟OCR识别结果，身份证号和住址按文件名中的客户编号区分，避免所有模拟客户共用同一身份标识
         if "id_card" in image_path:
+            match = re.search(r"id_card_(?:front|back)_(.+?)\.\w+$", os.path.basename(image_path))
+            customer_id = match.group(1) if match else ""
+            serial = (re.sub(r"\D", "", customer_id) or "0")[-4:].zfill(4)
             return {
-                "name": "张三",
-                "id_number": "110101199001011234",
-                "address": "北京市朝阳区xxx街道xxx号",
+                "name": f"客户{customer_id}" if customer_id else "张三",
+                "id_number": f"11010119900101{serial}",
+                "address": f"北京市朝阳区xxx街道{serial}号",
                 "issue_date": "2020.01.01",
                 "expiry_date": "2030.01.01"
             }
         else:
-            return {"text": f"OCR识别结果来自{image_path}"}
\ No newline at end of file
+            return {"text": f"OCR识别结果来自{image_path}"}
+
+
+class LazyCustomerData(dict):
+    """
+    懒加载的客户数据
+    各数据源在首次访问时采集并缓存，可通过aload()提前并发采集；
+    字典中只保存已采集的字段，序列化（JSON、日志、进程间传递）时只包含已采集的字段
+    """
+    
+    __slots__ = ("_collector", "_unloaded", "_lock")
+    
+    def __init__(self, customer_id, collector):
+        """
+        初始化客户数据
+        :param customer_id: 客户ID
+        :param collector: 数据采集器（RPADataCollector）
+        """
+        super().__init__(customer_id=customer_id, degraded_sources=[])
+        self._collector = collector
+        self._unloaded = dict.fromkeys(collector.collectors)
+        self._lock = threading.Lock()
+    
+    @property
+    def unloaded_sources(self):
+        """尚未采集的数据源"""
+        return list(self._unloaded)
+    
+    async def aload(self, *sources):
+        """
+        并发采集尚未采集的数据源
+        :param sources: 数据源名称，为空时采集全部剩余数据源
+        :return: 客户数据本身
+        """
+        sources = [source for source in (sources or list(self._unloaded)) if source in self._unloaded]
+        if sources:
+            collectors = self._collector.collectors
+            results = await asyncio.gather(*(
+                self._collector._afetch_source(source, collectors[source], self["customer_id"])
+                for source in sources
+            ))
+            for source, result in zip(sources, results):
+                self._store(source, result)
+        return self
+    
+    def _store(self, source, result):
+        """
+        保存采集结果，失败的数据源记入degraded_sources
+        :param source: 数据源名称
+        :param result: (是否成功, 采集结果)
+        """
+        if source not in self._unloaded:
+            return
+        del self._unloaded[source]
+        ok, value = result
+        dict.__setitem__(self, source, value)
+        if not ok:
+            self["degraded_sources"].append(source)
+    
+    def __missing__(self, key):
+        if key not in self._unloaded:
+            raise KeyError(key)
+        with self._lock:
+            if key in self._unloaded:
+                self._store(key, self._collector.fetch_source(key, self["customer_id"]))
+        return dict.__getitem__(self, key)
+    
+    def get(self, key, default=None):
+        if key in self._unloaded:
+            return self[key]
+        return super().get(key, default)
+    
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self._unloaded
+    
+    def __reduce__(self):
+        """序列化为只包含已采集字段的普通字典"""
+        return dict, (dict(self),)
+
+
+def _mark_degraded(source_span, reason):
+    """在链路中标记降级的数据源"""
+    if source_span is not None:
+        source_span.status = "DEGRADED"
+        source_span.set_attribute("reason", reason)
@@ -0,0 +1,426 @@
+"""
+规则引擎模块
+欺诈指标规则和决策阶梯规则在配置中声明，启动时编译为扁平的执行计划：
+同一字段的规则共用一次取值，欺诈指标规则按代价从低到高执行；
+规则可从JSON文件加载并在文件变更后热更新，执行中的请求不受影响
+"""
+
+import json
+import operator
+import os
+import re
+import string
+import threading
+import time
+
+from .logging_utils import get_logger
+
+logger = get_logger("rule_engine")
+
+# 字段不存在时的取值标记
+MISSING = object()
+
+# 默认欺诈指标规则，与原有的硬编码检查一致；
+# 地区维度的速率特征是聚合量，命中欺诈会拉黑申请人的身份标识，因此不作为欺诈指标，只在决策阶梯中转人工复核
+DEFAULT_FRAUD_RULES = [
+    {
+        "id": "insurance_amount_too_high",
+        "field": "application_form.insurance_amount",
+        "op": ">",
+        "value": 1000000,
+        "default": 0,
+        "weight": 1,
+        "indicator": "保险金额异常高"
+    },
+    {
+        # 历史记录字段缺失视为无记录；征信系统降级时为None，不视为无记录
+        "id": "no_history_records",
+        "field": "history_records",
+        "op": "empty",
+        "default": [],
+        "weight": 1,
+        "indicator": "无历史保单记录"
+    },
+    {
+        # 身份标识索引的查询结果（见identity_index），未接入索引时字段缺失不命中
+        "id": "blacklisted_identity",
+        "field": "identity_graph.blacklist_hits",
+        "op": "not_empty",
+        "default": [],
+        "weight": 5,
+        "indicator": "手机号或身份证号命中黑名单"
+    },
+    {
+        "id": "fraud_ring",
+        "field": "identity_graph.ring_customers",
+        "op": ">=",
+        "value": 3,
+        "default": 0,
+        "weight": 3,
+        "indicator": "多个申请共用身份标识，疑似团伙欺诈"
+    },
+    {
+        "id": "linked_to_blacklist",
+        "field": "identity_graph.ring_blacklisted",
+        "op": "==",
+        "value": True,
+        "default": False,
+        "weight": 2,
+        "indicator": "与黑名单客户共用身份标识"
+    },
+    {
+        # 速率特征（见feature_store），未接入特征存储时字段缺失不命中
+        "id": "phone_velocity",
+        "field": "velocity.features.phone_applications_1h",
+        "op": ">=",
+        "value": 5,
+        "default": 0,
+        "weight": 3,
+        "indicator": "同一手机号1小时内申请过于频繁"
+    },
+    {
+        "id": "id_number_velocity",
+        "field": "velocity.features.id_number_applications_24h",
+        "op": ">=",
+        "value": 3,
+        "default": 0,
+        "weight": 3,
+        "indicator": "同一身份证号24小时内多次申请"
+    }
+]
+
+# 默认的预筛直接批准条件，全部满足时视为干净的老客户
+DEFAULT_PRESCREEN_APPROVE_RULES = [
+    {"id": "repeat_customer", "field": "history_records", "op": "not_empty"},
+    {"id": "all_sources_collected", "field": "degraded_sources", "op": "empty", "default": []},
+    {"id": "small_insurance_amount", "field": "application_form.insurance_amount", "op": "<=", "value": 200000},
+    {"id": "no_chronic_disease", "field": "application_form.health_questionnaire.has_chronic_disease",
+     "op": "==", "value": False},
+    {"id": "no_surgery_history", "field": "application_form.health_questionnaire.has_surgery_history",
+     "op": "==", "value": False}
+]
+
+# 默认风险阈值
+DEFAULT_RISK_THRESHOLDS = {
+    "low_risk": 20,
+    "medium_risk": 50,
+    "high_risk": 80
+}
+
+# 默认决策阶梯，按顺序匹配，"$名称"引用风险阈值配置
+DEFAULT_DECISION_RULES = [
+    {"id": "fraud", "field": "is_fraud", "op": "==", "value": True,
+     "decision": "REJECT", "reason": "检测到欺诈行为: {indicators}"},
+    {"id": "high_risk", "field": "risk_score", "op": ">=", "value": "$high_risk",
+     "decision": "REJECT", "reason": "风险评分过高({risk_score})，超过高风险阈值({high_risk})"},
+    # 速率特征由RiskDecisionEngine.make_decision并入决策上下文
+    {"id": "phone_velocity", "field": "phone_applications_1h", "op": ">=", "value": 3,
+     "decision": "REVIEW", "reason": "同一手机号1小时内申请{phone_applications_1h}次，需要人工复核"},
+    {"id": "region_application_spike", "field": "region_applications_1h", "op": ">=", "value": 200,
+     "decision": "REVIEW", "reason": "同一地区1小时内申请量激增({region_applications_1h})，需要人工复核"},
+    {"id": "region_claim_spike", "field": "region_claims_24h", "op": ">=", "value": 50,
+     "decision": "REVIEW", "reason": "同一地区24小时内申请人的理赔记录激增({region_claims_24h})，需要人工复核"},
+    {"id": "medium_risk", "field": "risk_score", "op": ">=", "value": "$medium_risk",
+     "decision": "REVIEW", "reason": "中等风险({risk_score})，需要人工复核"}
+]
+
+# 没有决策规则匹配时的默认决策
+DEFAULT_DECISION = {"decision": "APPROVE", "reason": "风险评分较低({risk_score})，符合准入标准"}
+
+# 欺诈置信度 = 命中规则权重之和 / CONFIDENCE_SCALE（最高为1）
+CONFIDENCE_SCALE = 10.0
+
+# 操作符: (判断函数, 执行代价)
+OPERATORS = {
+    ">": (operator.gt, 1),
+    ">=": (operator.ge, 1),
+    "<": (operator.lt, 1),
+    "<=": (operator.le, 1),
+    "==": (operator.eq, 1),
+    "!=": (operator.ne, 1),
+    "empty": (lambda value, _: len(value) == 0, 1),
+    "not_empty": (lambda value, _: len(value) > 0, 1),
+    "len_gt": (lambda value, expected: len(value) > expected, 1),
+    "len_lt": (lambda value, expected: len(value) < expected, 1),
+    "in": (lambda value, expected: value in expected, 2),
+    "not_in": (lambda value, expected: value not in expected, 2),
+    "contains": (lambda value, expected: expected in value, 2),
+    "regex": (lambda value, expected: expected.search(str(value)) is not None, 10)
+}
+
+
+def _compile_value(op, value, thresholds):
+    """编译规则比较值：解析阈值引用，集合转换为frozenset，正则预编译"""
+    if isinstance(value, str) and value.startswith("$"):
+        name = value[1:]
+        if name not in thresholds:
+            raise ValueError(f"未知的阈值引用: {value}")
+        value = thresholds[name]
+    if op in ("in", "not_in") and isinstance(value, (list, tuple, set)):
+        try:
+            value = frozenset(value)
+        except TypeError:
+            value = tuple(value)
+    elif op == "regex":
+        value = re.compile(value)
+    return value
+
+
+def _compile_rule(rule, thresholds):
+    """
+    校验并编译单条规则
+    :return: (判断函数, 比较值, 缺失默认值, 执行代价, 原始规则)
+    """
+    rule_id = rule.get("id", rule.get("field"))
+    if "field" not in rule or "op" not in rule:
+        raise ValueError(f"规则 {rule_id} 缺少field或op")
+    if rule["op"] not in OPERATORS:
+        raise ValueError(f"规则 {rule_id} 使用了未知操作符: {rule['op']}")
+    predicate, cost = OPERATORS[rule["op"]]
+    value = _compile_value(rule["op"], rule.get("value"), thresholds)
+    return predicate, value, rule.get("default", MISSING), rule.get("cost", cost), rule
+
+
+def _lookup(data, path):
+    """
+    按字段路径取值，路径中间为None或不存在时返回MISSING
+    :param data: 字典数据
+    :param path: 字段名元组
+    :return: 字段值
+    """
+    value = data
+    for key in path:
+        if value is None:
+            return MISSING
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return MISSING
+    return value
+
+
+def matches(predicate, value, expected):
+    """执行判断，值为None或类型不匹配时视为不命中"""
+    if value is None:
+        return False
+    try:
+        return bool(predicate(value, expected))
+    except (TypeError, ValueError):
+        return False
+
+
+class FraudRuleSet:
+    """
+    编译后的欺诈指标规则集
+    """
+
+    def __init__(self, rules, thresholds=None, stop_at_weight=None):
+        """
+        编译规则集
+        :param rules: 规则配置列表，每条包含field、op、value、weight、indicator，可选default、cost、id
+        :param thresholds: 供"$名称"引用的阈值
+        :param stop_at_weight: 命中权重累计达到该值后不再执行剩余规则，None表示执行全部规则
+        """
+        self.stop_at_weight = stop_at_weight
+        groups = {}
+        for order, rule in enumerate(rules):
+            predicate, value, default, cost, raw = _compile_rule(rule, thresholds or {})
+            entry = (cost, order, predicate, value, default, raw.get("weight", 1), raw.get("indicator", raw.get("id")))
+            groups.setdefault(tuple(raw["field"].split(".")), []).append(entry)
+
+        # 同字段规则共用一次取值；字段组按组内最低代价排序，组内规则按代价排序
+        plan = []
+        for path, entries in groups.items():
+            entries.sort(key=lambda entry: entry[:2])
+            checks = tuple(entry[2:] for entry in entries)
+            plan.append((entries[0][:2], path, checks))
+        plan.sort(key=lambda group: group[0])
+        self.plan = tuple((path, checks) for _, path, checks in plan)
+        self.rule_count = len(rules)
+
+    def evaluate(self, data):
+        """
+        执行规则集
+        :param data: 客户数据
+        :return: (命中的指标列表, 命中权重之和)
+        """
+        indicators = []
+        total_weight = 0
+        stop_at_weight = self.stop_at_weight
+        for path, checks in self.plan:
+            field_value = _lookup(data, path)
+            for predicate, expected, default, weight, indicator in checks:
+                value = default if field_value is MISSING else field_value
+                if value is MISSING or not matches(predicate, value, expected):
+                    continue
+                indicators.append(indicator)
+                total_weight += weight
+                if stop_at_weight is not None and total_weight >= stop_at_weight:
+                    return indicators, total_weight
+        return indicators, total_weight
+
+
+class DecisionLadder:
+    """
+    编译后的决策阶梯，按配置顺序匹配第一条命中的规则
+    """
+
+    def __init__(self, rules, thresholds, default=None):
+        """
+        编译决策阶梯
+        :param rules: 规则配置列表，每条包含field、op、value、decision、reason
+        :param thresholds: 风险阈值，供"$名称"引用和原因模板使用
+        :param default: 没有规则命中时的决策和原因模板
+        """
+        default = default or DEFAULT_DECISION
+        self.thresholds = dict(thresholds)
+        self.steps = tuple(
+            (raw["field"], predicate, value, raw["decision"], raw["reason"])
+            for predicate, value, _, _, raw in (_compile_rule(rule, thresholds) for rule in rules)
+        )
+        self.default = (default["decision"], default["reason"])
+
+    def decide(self, context):
+        """
+        匹配决策
+        :param context: 决策上下文，包含risk_score、is_fraud、indicators等字段
+        :return: (决策, 原因)
+        """
+        for field, predicate, expected, decision, reason in self.steps:
+            if matches(predicate, context.get(field), expected):
+                return decision, reason.format_map({**self.thresholds, **context})
+        decision, reason = self.default
+        return decision, reason.format_map({**self.thresholds, **context})
+
+    @staticmethod
+    def template_fields(template):
+        """
+        列出原因模板引用的字段
+        :param template: 原因模板
+        :return: 字段名集合
+        """
+        return {name for _, name, _, _ in string.Formatter().parse(template) if name}
+
+
+class RuleEngine:
+    """
+    规则引擎
+    持有当前生效的欺诈规则集和决策阶梯，支持整体替换和基于文件修改时间的热更新
+    """
+
+    def __init__(self, config=None, thresholds=None, path=None, check_interval=5.0):
+        """
+        初始化规则引擎
+        :param config: 规则配置，包含fraud_rules、decision_rules、default_decision、stop_at_weight、
+                       prescreen_approve_rules，缺省项使用默认规则
+        :param thresholds: 风险阈值配置，为None时使用默认风险阈值
+        :param path: 规则JSON文件路径，指定后从文件加载并在文件变更时热更新
+        :param check_interval: 检查规则文件变更的最小间隔（秒）
+        """
+        self.thresholds = thresholds or DEFAULT_RISK_THRESHOLDS
+        self.path = path
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        if path is not None:
+            config = self._read_file()
+        self.reload(config)
+
+    @classmethod
+    def load(cls, rules=None, thresholds=None):
+        """
+        按规则配置或规则文件路径创建规则引擎
+        :param rules: 规则配置字典或规则JSON文件路径，为None时使用默认规则
+        :param thresholds: 风险阈值配置
+        :return: RuleEngine
+        """
+        if isinstance(rules, (str, os.PathLike)):
+            return cls(thresholds=thresholds, path=rules)
+        return cls(rules, thresholds=thresholds)
+
+    def _read_file(self):
+        """读取规则文件并记录修改时间"""
+        self._mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def reload(self, config=None):
+        """
+        编译新规则并整体替换，编译失败时保留原有规则并抛出异常
+        :param config: 规则配置
+        """
+        config = config or {}
+        fraud_rules = FraudRuleSet(config.get("fraud_rules", DEFAULT_FRAUD_RULES), self.thresholds,
+                                   config.get("stop_at_weight"))
+        ladder = DecisionLadder(config.get("decision_rules", DEFAULT_DECISION_RULES), self.thresholds,
+                                config.get("default_decision"))
+        approve_rules = FraudRuleSet(config.get("prescreen_approve_rules", DEFAULT_PRESCREEN_APPROVE_RULES),
+                                     self.thresholds)
+        # 一次赋值替换，正在执行的评估继续使用旧规则
+        self._compiled = (fraud_rules, ladder, approve_rules)
+        self.config = config
+        logger.info("规则已加载: 欺诈规则 %d 条, 决策规则 %d 条", fraud_rules.rule_count, len(ladder.steps))
+
+    def maybe_reload(self):
+        """
+        规则文件有变更时重新加载，检查间隔内直接返回
+        :return: 是否重新加载
+        """
+        if self.path is None or time.monotonic() < self._next_check:
+            return False
+        with self._reload_lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                if os.stat(self.path).st_mtime_ns == self._mtime:
+                    return False
+                self.reload(self._read_file())
+            except Exception as exc:
+                # 规则配置结构错误（缺少字段、类型不符等）同样不能影响正在使用的规则
+                logger.error("规则文件 %s 热更新失败，继续使用原有规则: %s: %s", self.path, type(exc).__name__, exc)
+                return False
+        return True
+
+    @property
+    def fraud_rules(self):
+        """当前生效的欺诈规则集"""
+        self.maybe_reload()
+        return self._compiled[0]
+
+    @property
+    def decision_ladder(self):
+        """当前生效的决策阶梯"""
+        self.maybe_reload()
+        return self._compiled[1]
+
+    @property
+    def prescreen_approve_rules(self):
+        """当前生效的预筛直接批准条件"""
+        self.maybe_reload()
+        return self._compiled[2]
+
+    def evaluate_fraud(self, data):
+        """
+        执行欺诈指标规则
+        :param data: 客户数据
+        :return: 欺诈检测结果
+        """
+        indicators, total_weight = self.fraud_rules.evaluate(data)
+        return {
+            "is_fraud": len(indicators) > 0,
+            "indicators": indicators,
+            "confidence": min(1.0, total_weight / CONFIDENCE_SCALE) if indicators else 0
+        }
+
+    def __getstate__(self):
+        """序列化到子进程时不携带锁和编译结果，只携带规则配置"""
+        state = self.__dict__.copy()
+        del state["_reload_lock"]
+        del state["_compiled"]
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建锁并重新编译规则"""
+        self.__dict__.update(state)
+        self._reload_lock = threading.Lock()
+        self.reload(self.config)
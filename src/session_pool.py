@@ -0,0 +1,374 @@
+"""
+RPA登录会话池
+为每个业务系统维护可复用的已认证会话，支持保活、过期自动重登录、
+单系统会话数上限和健康检查
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager, asynccontextmanager
+
+from .logging_utils import get_logger
+
+logger = get_logger("session_pool")
+
+# 每个系统默认的最大会话数
+DEFAULT_MAX_SESSIONS = 4
+# 会话默认有效期（秒），超过后自动重新登录
+DEFAULT_SESSION_TTL = 1800
+# 空闲会话默认保活间隔（秒）
+DEFAULT_KEEPALIVE_INTERVAL = 300
+# 单个会话健康检查的默认超时时间（秒）
+DEFAULT_CHECK_TIMEOUT = 10.0
+
+
+class SystemSession:
+    """
+    单个业务系统的登录会话
+    """
+
+    def __init__(self, system_name, ttl):
+        """
+        初始化会话
+        :param system_name: 系统名称
+        :param ttl: 会话有效期（秒）
+        """
+        self.system_name = system_name
+        self.session_id = uuid.uuid4().hex
+        self.ttl = ttl
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.use_count = 0
+
+    def is_expired(self, now=None):
+        """判断会话是否已过期"""
+        now = time.monotonic() if now is None else now
+        return now - self.created_at >= self.ttl
+
+    def touch(self):
+        """更新最近使用时间"""
+        self.last_used = time.monotonic()
+        self.use_count += 1
+
+
+class SessionPool:
+    """
+    按系统划分的登录会话池
+    线程安全，同时支持同步和异步获取会话
+    """
+
+    def __init__(self, system_configs, login_func, health_check_func=None,
+                 max_sessions=DEFAULT_MAX_SESSIONS, session_ttl=DEFAULT_SESSION_TTL,
+                 keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL, check_timeout=DEFAULT_CHECK_TIMEOUT):
+        """
+        初始化会话池
+        :param system_configs: 系统配置，可按系统配置"max_sessions"和"session_ttl"
+        :param login_func: 登录函数，接收系统名称，登录失败时返回False
+        :param health_check_func: 健康检查函数，接收会话对象，不可用时返回False
+        :param max_sessions: 每个系统默认的最大会话数
+        :param session_ttl: 会话默认有效期（秒）
+        :param keepalive_interval: 空闲会话保活间隔（秒）
+        :param check_timeout: 单个会话健康检查的超时时间（秒），超时的会话被丢弃
+        """
+        self.system_configs = system_configs
+        self.login_func = login_func
+        self.health_check_func = health_check_func
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.keepalive_interval = keepalive_interval
+        self.check_timeout = check_timeout
+
+        self._cond = threading.Condition()
+        self._idle = {}
+        self._open_count = {}
+        self._async_waiters = {}
+        self._keepalive_thread = None
+        self._stop_event = threading.Event()
+        self.stats = {"logins": 0, "relogins": 0, "reuses": 0, "evicted": 0}
+
+    def _system_config(self, system_name, key, default):
+        """读取单个系统的会话配置"""
+        return (self.system_configs.get(system_name) or {}).get(key, default)
+
+    def _reserve(self, system_name):
+        """
+        在持有锁的情况下尝试取得会话
+        :return: 空闲会话；需要新登录时返回None并占用一个名额；达到上限时返回False
+        """
+        idle = self._idle.setdefault(system_name, deque())
+        while idle:
+            session = idle.pop()
+            if not session.is_expired():
+                self.stats["reuses"] += 1
+                return session
+            # 过期会话释放名额后重新登录
+            self._open_count[system_name] -= 1
+            self.stats["relogins"] += 1
+
+        limit = self._system_config(system_name, "max_sessions", self.max_sessions)
+        if self._open_count.get(system_name, 0) < limit:
+            self._open_count[system_name] = self._open_count.get(system_name, 0) + 1
+            return None
+        return False
+
+    def _login(self, system_name):
+        """
+        登录系统并创建会话，失败时归还占用的名额
+        :param system_name: 系统名称
+        :return: 新会话
+        """
+        try:
+            if not self.login_func(system_name):
+                raise ConnectionError(f"登录{system_name}系统失败")
+        except Exception:
+            self._release_slot(system_name)
+            raise
+        with self._cond:
+            self.stats["logins"] += 1
+        return SystemSession(system_name, self._system_config(system_name, "session_ttl", self.session_ttl))
+
+    def acquire(self, system_name, timeout=None):
+        """
+        同步获取会话，达到上限时阻塞等待
+        :param system_name: 系统名称
+        :param timeout: 最长等待时间（秒），None表示一直等待
+        :return: 会话对象
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                session = self._reserve(system_name)
+                if session is not False:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"等待{system_name}系统会话超时")
+                self._cond.wait(remaining)
+        if session is None:
+            session = self._login(system_name)
+        session.touch()
+        return session
+
+    async def aacquire(self, system_name):
+        """
+        异步获取会话，达到上限时挂起等待而不阻塞事件循环
+        :param system_name: 系统名称
+        :return: 会话对象
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                session = self._reserve(system_name)
+                if session is False:
+                    waiter = loop.create_future()
+                    self._async_waiters.setdefault(system_name, []).append((loop, waiter))
+            if session is not False:
+                break
+            await waiter
+        if session is None:
+            # 登录是阻塞调用，放到线程中执行，不阻塞事件循环
+            login = asyncio.ensure_future(asyncio.to_thread(self._login, system_name))
+            try:
+                session = await asyncio.shield(login)
+            except asyncio.CancelledError:
+                # 等待被取消（如数据源超时）时登录仍在线程中进行，完成后丢弃会话并释放名额
+                login.add_done_callback(self._release_login)
+                raise
+        session.touch()
+        return session
+
+    def _release_login(self, login):
+        """
+        丢弃调用方已不再等待的登录结果，超时的登录得到的会话状态不确定，不放回池中复用
+        :param login: 登录任务
+        """
+        if not login.cancelled() and login.exception() is None:
+            self.release(login.result(), healthy=False)
+
+    def release(self, session, healthy=True):
+        """
+        归还会话
+        :param session: 会话对象
+        :param healthy: 会话是否仍可用，不可用的会话将被丢弃
+        """
+        system_name = session.system_name
+        if not healthy or session.is_expired():
+            self._release_slot(system_name)
+            return
+        with self._cond:
+            self._idle.setdefault(system_name, deque()).append(session)
+            self._notify(system_name)
+
+    def _release_slot(self, system_name):
+        """丢弃会话并释放名额"""
+        with self._cond:
+            self._open_count[system_name] -= 1
+            self._notify(system_name)
+
+    def _notify(self, system_name):
+        """在持有锁的情况下唤醒一个同步等待者和所有异步等待者"""
+        self._cond.notify()
+        for loop, waiter in self._async_waiters.pop(system_name, []):
+            loop.call_soon_threadsafe(_resolve_waiter, waiter)
+
+    @contextmanager
+    def session(self, system_name, timeout=None):
+        """
+        以上下文管理器方式使用会话
+        :param system_name: 系统名称
+        :param timeout: 最长等待时间（秒）
+        """
+        session = self.acquire(system_name, timeout)
+        healthy = True
+        try:
+            yield session
+        except ConnectionError:
+            healthy = False
+            raise
+        finally:
+            self.release(session, healthy)
+
+    @asynccontextmanager
+    async def asession(self, system_name):
+        """
+        以异步上下文管理器方式使用会话
+        :param system_name: 系统名称
+        """
+        session = await self.aacquire(system_name)
+        healthy = True
+        try:
+            yield session
+        except (ConnectionError, asyncio.CancelledError):
+            # 被取消（如数据源超时）时线程中的采集可能仍在使用该会话，丢弃而不是放回池中
+            healthy = False
+            raise
+        finally:
+            self.release(session, healthy)
+
+    def health_check(self):
+        """
+        检查所有空闲会话，丢弃过期或不可用的会话
+        :return: 各系统保留的空闲会话数
+        """
+        with self._cond:
+            candidates = {name: list(idle) for name, idle in self._idle.items()}
+            for idle in self._idle.values():
+                idle.clear()
+
+        report = {}
+        for system_name, sessions in candidates.items():
+            for session in sessions:
+                alive = not session.is_expired()
+                if alive and self.health_check_func is not None:
+                    alive = self._check(session)
+                if alive:
+                    self.release(session)
+                else:
+                    with self._cond:
+                        self.stats["evicted"] += 1
+                    self._release_slot(system_name)
+            report[system_name] = len(self._idle.get(system_name, ()))
+        return report
+
+    def _check(self, session):
+        """
+        在线程中限时执行单个会话的健康检查
+        超时后检查线程可能仍在使用该会话，视为不可用，由调用方丢弃
+        :param session: 会话对象
+        :return: 会话是否可用
+        """
+        checker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rpa-session-check")
+        try:
+            return bool(checker.submit(self.health_check_func, session).result(self.check_timeout))
+        except FutureTimeoutError:
+            logger.warning("%s系统会话健康检查超时（%s秒），丢弃该会话", session.system_name, self.check_timeout)
+            return False
+        except Exception:
+            return False
+        finally:
+            checker.shutdown(wait=False)
+
+    def keepalive(self):
+        """
+        对超过保活间隔的空闲会话执行健康检查，保持会话活跃
+        :return: 各系统保留的空闲会话数
+        """
+        now = time.monotonic()
+        with self._cond:
+            stale = any(now - session.last_used >= self.keepalive_interval
+                        for idle in self._idle.values() for session in idle)
+        if not stale:
+            return {name: len(idle) for name, idle in self._idle.items()}
+        report = self.health_check()
+        with self._cond:
+            for idle in self._idle.values():
+                for session in idle:
+                    session.last_used = now
+        return report
+
+    def start_keepalive(self):
+        """启动后台保活线程"""
+        if self._keepalive_thread is not None:
+            return
+        self._stop_event.clear()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop,
+                                                  name="rpa-session-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        """后台保活循环"""
+        while not self._stop_event.wait(self.keepalive_interval):
+            self.keepalive()
+
+    def close(self):
+        """停止保活线程并清空空闲会话"""
+        self._stop_event.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join()
+            self._keepalive_thread = None
+        with self._cond:
+            for system_name, idle in self._idle.items():
+                self._open_count[system_name] -= len(idle)
+                idle.clear()
+
+    def get_stats(self):
+        """
+        获取会话池统计信息
+        :return: 登录/复用次数及各系统打开的会话数
+        """
+        with self._cond:
+            stats = dict(self.stats)
+            stats["open_sessions"] = dict(self._open_count)
+            stats["idle_sessions"] = {name: len(idle) for name, idle in self._idle.items()}
+        return stats
+
+    def __getstate__(self):
+        """序列化时只保留配置和保活线程是否已启动，会话和锁在子进程中重建"""
+        state = self.__dict__.copy()
+        for key in ("_cond", "_idle", "_open_count", "_async_waiters", "_keepalive_thread", "_stop_event"):
+            del state[key]
+        state["_keepalive_started"] = self._keepalive_thread is not None
+        return state
+
+    def __setstate__(self, state):
+        """反序列化时重建空的会话池，原会话池已启动保活时在子进程中同样启动"""
+        keepalive_started = state.pop("_keepalive_started")
+        self.__dict__.update(state)
+        self._cond = threading.Condition()
+        self._idle = {}
+        self._open_count = {}
+        self._async_waiters = {}
+        self._keepalive_thread = None
+        self._stop_event = threading.Event()
+        if keepalive_started:
+            self.start_keepalive()
+
+
+def _resolve_waiter(waiter):
+    """唤醒等待会话的协程"""
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,345 @@
+"""
+共享状态模块
+多个工作进程通过本地SQLite事件表共享黑名单、团伙关联和速率特征：
+各进程在本地内存中维护索引和计数，变更同时追加到事件表，查询前增量拉取其他进程的事件，
+各进程的状态最终一致；身份标识操作定期压缩为共享快照，事件表不随运行时间无限增长；
+结果缓存直接使用ResultCache的SQLite磁盘层共享
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from .identity_index import (IdentityIndex, DEFAULT_LINK_KINDS, DEFAULT_STRONG_KINDS, DEFAULT_INITIAL_CAPACITY,
+                             DEFAULT_SNAPSHOT_EVERY)
+from .feature_store import FeatureStore, DEFAULT_RESOLUTION
+from .logging_utils import get_logger
+
+logger = get_logger("shared_state")
+
+# 事件通道
+CHANNEL_IDENTITY = "identity"
+CHANNEL_VELOCITY = "velocity"
+
+# 共享身份标识索引的快照文件，位于事件表所在目录
+IDENTITY_SNAPSHOT_FILE = "identity_snapshot.npz"
+# 共享速率特征存储默认每写入多少条事件清理一次已超出所有速率窗口的事件
+DEFAULT_PURGE_EVERY = 1000
+
+
+class SharedStateStore:
+    """
+    基于SQLite（WAL模式）的共享事件表，同一台机器上的多个进程可同时读写
+    """
+
+    def __init__(self, path, timeout=30.0):
+        """
+        初始化共享事件表
+        :param path: SQLite数据库路径
+        :param timeout: 等待其他进程写锁的最长时间（秒）
+        """
+        self.path = path
+        self.timeout = timeout
+        self._init_connection()
+
+    def _init_connection(self):
+        """打开连接并建表；每个实例有独立的来源标识，拉取时跳过自己写入的事件"""
+        self._lock = threading.RLock()
+        self.origin = int.from_bytes(os.urandom(7), "big")
+        self._db = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS shared_events "
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, origin INTEGER NOT NULL, "
+            "payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS shared_events_channel ON shared_events (channel, seq)")
+        # 各通道已压缩到快照中的最大序号，不大于该序号的事件已删除
+        self._db.execute("CREATE TABLE IF NOT EXISTS shared_snapshots (channel TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+
+    def append(self, channel, payload):
+        """
+        追加一条事件
+        :param channel: 事件通道
+        :param payload: 可JSON序列化的事件内容
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO shared_events (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)",
+                (channel, self.origin, json.dumps(payload, separators=(",", ":")), time.time())
+            )
+
+    def read(self, channel, after=0, include_own=False):
+        """
+        读取指定序号之后其他来源写入的事件
+        :param channel: 事件通道
+        :param after: 已读取到的序号
+        :param include_own: 是否包含本实例写入的事件
+        :return: (事件内容列表, 新的已读序号)
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, origin, payload FROM shared_events WHERE channel = ? AND seq > ? ORDER BY seq",
+                (channel, after)
+            ).fetchall()
+        if not rows:
+            return [], after
+        return [json.loads(payload) for _, origin, payload in rows if include_own or origin != self.origin], rows[-1][0]
+
+    def snapshot_seq(self, channel):
+        """
+        获取通道已压缩到快照中的最大序号
+        :param channel: 事件通道
+        :return: 序号，没有快照时为0
+        """
+        with self._lock:
+            row = self._db.execute("SELECT seq FROM shared_snapshots WHERE channel = ?", (channel,)).fetchone()
+        return row[0] if row else 0
+
+    def compact(self, channel, seq):
+        """
+        记录通道的快照序号并删除快照已包含的事件，需在exclusive()中调用
+        :param channel: 事件通道
+        :param seq: 快照包含的最大序号
+        :return: 删除的事件数
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO shared_snapshots (channel, seq) VALUES (?, ?)", (channel, seq))
+            return self._db.execute("DELETE FROM shared_events WHERE channel = ? AND seq <= ?",
+                                    (channel, seq)).rowcount
+
+    @contextmanager
+    def exclusive(self):
+        """持有事件表写锁，期间其他进程不能写入事件"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def purge(self, channel, older_than):
+        """
+        删除过期事件
+        :param channel: 事件通道
+        :param older_than: 删除此时间戳之前写入的事件
+        :return: 删除的事件数
+        """
+        with self._lock:
+            return self._db.execute("DELETE FROM shared_events WHERE channel = ? AND created_at < ?",
+                                    (channel, older_than)).rowcount
+
+    def get_stats(self):
+        """
+        获取事件表统计
+        :return: 各通道的事件数和快照序号
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT channel, COUNT(*) FROM shared_events GROUP BY channel").fetchall()
+            snapshots = self._db.execute("SELECT channel, seq FROM shared_snapshots").fetchall()
+        return {"events": dict(rows), "snapshots": dict(snapshots)}
+
+    def close(self):
+        """关闭连接"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __getstate__(self):
+        """序列化时只携带路径，子进程重新连接并使用新的来源标识"""
+        return {"path": self.path, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_connection()
+
+
+class SharedIdentityIndex(IdentityIndex):
+    """
+    多进程共享的身份标识索引
+    关联和黑名单操作写入共享事件表，查询前重放其他进程的操作（操作均为幂等且可交换），
+    任一进程拉黑的标识和建立的关联对所有进程可见；
+    事件表中的操作累计到阈值时写入共享快照并删除已包含的操作，新进程从快照加载后只重放之后的操作
+    """
+
+    def __init__(self, store, link_kinds=DEFAULT_LINK_KINDS, strong_kinds=DEFAULT_STRONG_KINDS,
+                 initial_capacity=DEFAULT_INITIAL_CAPACITY, snapshot_every=DEFAULT_SNAPSHOT_EVERY):
+        """
+        初始化共享索引，从共享快照加载并重放快照之后的全部操作
+        :param store: 共享事件表（SharedStateStore）
+        :param link_kinds: 参与团伙关联的标识类型
+        :param strong_kinds: 命中即计为黑名单命中的标识类型
+        :param initial_capacity: 初始节点容量
+        :param snapshot_every: 快照之后的操作累计多少条后写入新快照
+        """
+        self.store = store
+        self.snapshot_path = os.path.join(os.path.dirname(os.path.abspath(store.path)), IDENTITY_SNAPSHOT_FILE)
+        self._seq = 0
+        super().__init__(link_kinds=link_kinds, strong_kinds=strong_kinds, initial_capacity=initial_capacity,
+                         snapshot_every=snapshot_every)
+        self._restore()
+
+    def _restore(self):
+        """从共享快照重建索引，并重放快照之后的全部操作（包括本进程写入的）"""
+        with self._lock:
+            while True:
+                self._reset(self.initial_capacity)
+                self._seq = 0
+                if os.path.exists(self.snapshot_path):
+                    with np.load(self.snapshot_path) as snapshot:
+                        self._restore_arrays(snapshot)
+                        self._seq = int(snapshot["seq"])
+                entries, seq = self.store.read(CHANNEL_IDENTITY, self._seq, include_own=True)
+                compacted = self.store.snapshot_seq(CHANNEL_IDENTITY)
+                if compacted <= self._seq:
+                    break
+                if not os.path.exists(self.snapshot_path):
+                    raise RuntimeError(f"共享身份标识索引快照缺失: {self.snapshot_path}")
+                # 加载快照后又有进程写入了新快照，读取的操作可能已被删除，重新加载
+            for entry in entries:
+                self._apply(entry)
+            self._seq = seq
+            self._compacted = compacted
+
+    def _pull(self):
+        """重放其他进程新写入的操作，拉取前已有操作被压缩时从快照重建"""
+        entries, seq = self.store.read(CHANNEL_IDENTITY, self._seq)
+        self._compacted = self.store.snapshot_seq(CHANNEL_IDENTITY)
+        if self._compacted > self._seq:
+            self._restore()
+            return
+        for entry in entries:
+            self._apply(entry)
+        self._seq = seq
+
+    def _sync(self):
+        """重放其他进程新写入的操作，快照之后的操作累计到阈值时写入新快照"""
+        with self._lock:
+            self._pull()
+            if self._seq - self._compacted >= self.snapshot_every:
+                self.snapshot()
+
+    def snapshot(self):
+        """
+        写入共享快照并删除快照已包含的操作；写快照期间持有事件表写锁，快照与序号一致
+        """
+        with self._lock, self.store.exclusive():
+            self._pull()
+            if self._seq <= self._compacted:
+                return
+            count = self._write_arrays(self.snapshot_path, seq=np.int64(self._seq))
+            purged = self.store.compact(CHANNEL_IDENTITY, self._seq)
+            self._compacted = self._seq
+        logger.info("共享身份标识索引快照已写入: %d 个节点，序号 %d，删除操作 %d 条", count, self._seq, purged)
+
+    def _log(self, entry):
+        super()._log(entry)
+        self.store.append(CHANNEL_IDENTITY, entry)
+
+    def check(self, identifiers, customer_id=None):
+        with self._lock:
+            self._sync()
+            return super().check(identifiers, customer_id)
+
+    def is_blacklisted(self, kind, value):
+        self._sync()
+        return super().is_blacklisted(kind, value)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats["shared_seq"] = self._seq
+        stats["snapshot_seq"] = self._compacted
+        return stats
+
+    def __getstate__(self):
+        return {"store": self.store, "link_kinds": self.link_kinds, "strong_kinds": self.strong_kinds,
+                "initial_capacity": self.initial_capacity, "snapshot_every": self.snapshot_every}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class SharedFeatureStore(FeatureStore):
+    """
+    多进程共享的速率特征存储
+    本地计数的事件同时写入共享事件表，计数和查询前先计入其他进程的事件，
+    同一手机号的申请落在不同进程时速率特征仍按全部申请统计；
+    每写入一定数量的事件清理一次已超出所有速率窗口的事件，事件表不随运行时间无限增长
+    """
+
+    def __init__(self, store, features=None, resolution=DEFAULT_RESOLUTION, max_entities=None,
+                 purge_every=DEFAULT_PURGE_EVERY):
+        """
+        初始化共享特征存储，启动时计入事件表中尚未过期的事件
+        :param store: 共享事件表（SharedStateStore）
+        :param features: 速率特征配置列表，为None时使用DEFAULT_VELOCITY_FEATURES
+        :param resolution: 桶宽（秒）
+        :param max_entities: 每个特征最多保留的实体数
+        :param purge_every: 本进程每写入多少条事件清理一次过期事件
+        """
+        self.store = store
+        self.purge_every = purge_every
+        super().__init__(features, resolution, max_entities)
+
+    def _init_state(self):
+        super()._init_state()
+        # 拉取和计入远端事件需要原子完成，避免并发拉取时重复计数
+        self._sync_lock = threading.Lock()
+        self._max_window = max(feature["window"] for feature in self.features)
+        self._seq = 0
+        self._appended = 0
+        self._sync()
+
+    def _sync(self):
+        """计入其他进程新写入的事件，已超出所有速率窗口的事件直接跳过"""
+        with self._sync_lock:
+            events, self._seq = self.store.read(CHANNEL_VELOCITY, self._seq)
+            oldest = time.time() - self._max_window
+            for event in events:
+                if event["now"] >= oldest:
+                    FeatureStore.observe(self, event["entities"], event["amounts"], now=event["now"])
+
+    def observe(self, entities, amounts=None, previous=None, now=None):
+        now = time.time() if now is None else now
+        self._sync()
+        recorded = (previous or {}).get("entities") or {}
+        counted = {dimension: entity for dimension, entity in entities.items() if recorded.get(dimension) != entity}
+        result = super().observe(entities, amounts, previous, now)
+        if counted:
+            self.store.append(CHANNEL_VELOCITY, {"entities": counted, "amounts": amounts or {"applications": 1},
+                                                 "now": now})
+            with self._sync_lock:
+                self._appended += 1
+                purge = self._appended % self.purge_every == 0
+            if purge:
+                self.purge_expired()
+        return result
+
+    def purge_expired(self):
+        """
+        删除事件表中已超出所有速率窗口的事件，各进程拉取时同样跳过这些事件
+        :return: 删除的事件数
+        """
+        purged = self.store.purge(CHANNEL_VELOCITY, time.time() - self._max_window)
+        if purged:
+            logger.info("清理过期速率事件 %d 条", purged)
+        return purged
+
+    def query(self, entities, now=None):
+        self._sync()
+        return super().query(entities, now)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["store"] = self.store
+        state["purge_every"] = self.purge_every
+        return state
@@ -0,0 +1,216 @@
+"""
+流式处理模块
+申请ID从迭代器、JSONL文件或本地队列中逐条读取，处理结果逐条产出或写入输出端；
+在途申请数有上限（背压），已提交的输入位置定期写入检查点，中断后从检查点继续，
+内存占用与输入规模无关
+"""
+
+import itertools
+import json
+import os
+import queue
+
+from .records import json_default
+from .logging_utils import get_logger
+
+logger = get_logger("streaming")
+
+# 默认每处理多少条申请写一次检查点
+DEFAULT_CHECKPOINT_EVERY = 100
+
+# 队列输入的结束标记
+STOP = None
+
+
+class ApplicationSource:
+    """
+    申请ID输入源接口
+    """
+
+    def iter_from(self, offset=0):
+        """
+        从指定位置开始读取申请ID
+        :param offset: 起始位置（检查点中保存的位置）
+        :return: (读完该条后的位置, 客户ID) 的生成器
+        """
+        raise NotImplementedError
+
+
+class IteratorSource(ApplicationSource):
+    """
+    迭代器输入，位置为已读取的条数，从检查点继续时跳过已处理的条目
+    """
+
+    def __init__(self, iterable):
+        """
+        初始化迭代器输入
+        :param iterable: 客户ID可迭代对象
+        """
+        self.iterable = iterable
+
+    def iter_from(self, offset=0):
+        for position, customer_id in enumerate(itertools.islice(self.iterable, offset, None), offset + 1):
+            yield position, customer_id
+
+
+class JsonlSource(ApplicationSource):
+    """
+    JSONL文件输入，每行为客户ID字符串或包含客户ID字段的对象；
+    位置为文件字节偏移，从检查点继续时直接定位，不重新读取已处理的部分
+    """
+
+    def __init__(self, path, field="customer_id"):
+        """
+        初始化文件输入
+        :param path: JSONL文件路径
+        :param field: 对象行中客户ID的字段名
+        """
+        self.path = path
+        self.field = field
+
+    def iter_from(self, offset=0):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in iter(f.readline, b""):
+                offset += len(line)
+                if not line.strip():
+                    continue
+                if not line.endswith(b"\n"):
+                    # 末行尚未写完（文件仍在追加），等下次从该行开头继续
+                    return
+                value = json.loads(line)
+                yield offset, value[self.field] if isinstance(value, dict) else value
+
+
+class QueueSource(ApplicationSource):
+    """
+    本地队列输入，读到STOP标记时结束；生产方使用有界队列时，处理跟不上会阻塞生产方；
+    队列内容不持久化，位置为已读取的条数，只用于监控
+    """
+
+    def __init__(self, source_queue, timeout=None):
+        """
+        初始化队列输入
+        :param source_queue: queue.Queue，元素为客户ID
+        :param timeout: 等待新元素的最长时间（秒），超时视为输入结束；None表示一直等待
+        """
+        self.queue = source_queue
+        self.timeout = timeout
+
+    def iter_from(self, offset=0):
+        while True:
+            try:
+                customer_id = self.queue.get(timeout=self.timeout)
+            except queue.Empty:
+                return
+            if customer_id is STOP:
+                return
+            offset += 1
+            yield offset, customer_id
+
+
+def as_source(source):
+    """
+    将输入转换为ApplicationSource：字符串或路径视为JSONL文件，queue.Queue视为队列，其余视为可迭代对象
+    :param source: 输入
+    :return: ApplicationSource
+    """
+    if isinstance(source, ApplicationSource):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        return JsonlSource(source)
+    if isinstance(source, queue.Queue):
+        return QueueSource(source)
+    return IteratorSource(source)
+
+
+class JsonlSink:
+    """
+    JSONL输出端，每条处理记录一行，写检查点前刷新到磁盘
+    """
+
+    def __init__(self, path, fields=None):
+        """
+        初始化文件输出
+        :param path: 输出文件路径，追加写入
+        :param fields: 只输出的记录字段，None表示完整记录
+        """
+        self.path = path
+        self.fields = fields
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        """
+        写入一条处理记录
+        :param record: 处理记录
+        """
+        if self.fields is not None:
+            record = {field: record.get(field) for field in self.fields}
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=json_default) + "\n")
+
+    def flush(self):
+        """刷新到磁盘"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """关闭文件"""
+        self._file.close()
+
+
+class FileCheckpoint:
+    """
+    文件检查点，保存最后提交的输入位置；先写临时文件再改名，中断时不会留下不完整的检查点
+    """
+
+    def __init__(self, path):
+        """
+        初始化检查点
+        :param path: 检查点文件路径
+        """
+        self.path = path
+
+    def load(self):
+        """
+        读取最后提交的位置
+        :return: 位置，没有检查点时为0
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)["offset"]
+        except FileNotFoundError:
+            return 0
+
+    def save(self, offset, processed=None):
+        """
+        保存提交位置
+        :param offset: 输入位置
+        :param processed: 本次运行已处理的条数
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "offset": offset,
+                "processed": processed,
+                "updated_at": __import__('datetime').datetime.now().isoformat()
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+
+def as_checkpoint(checkpoint):
+    """
+    将检查点参数转换为FileCheckpoint：字符串或路径视为检查点文件
+    :param checkpoint: 检查点或检查点文件路径，None表示不使用检查点
+    :return: 检查点对象或None
+    """
+    if checkpoint is None or hasattr(checkpoint, "save"):
+        return checkpoint
+    return FileCheckpoint(checkpoint)
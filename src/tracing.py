@@ -0,0 +1,243 @@
+"""
+链路追踪模块
+每个客户申请对应一条链路（根span），各处理阶段、数据源采集和模型调用记录为子span；
+当前span通过contextvars传递，线程池和asyncio任务中都能正确关联父子关系，
+未开启追踪时子span不会创建任何对象
+"""
+
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# 内存导出器默认保留的span数
+DEFAULT_MEMORY_SPANS = 10000
+
+
+class Span:
+    """
+    单个追踪片段
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_time", "duration",
+                 "attributes", "status", "_started", "_root", "_finished")
+
+    def __init__(self, name, parent=None, attributes=None):
+        """
+        初始化span
+        :param name: span名称
+        :param parent: 父span，为None时作为链路的根
+        :param attributes: 附加属性
+        """
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+        self.start_time = time.time()
+        self.duration = None
+        self.attributes = attributes or {}
+        self.status = "OK"
+        self._started = time.perf_counter()
+        self._root = parent._root if parent is not None else self
+        # 根span收集整条链路中已结束的span，链路结束时一次性导出
+        self._finished = [] if parent is None else None
+
+    def set_attribute(self, key, value):
+        """设置属性"""
+        self.attributes[key] = value
+
+    def end(self, status=None):
+        """
+        结束span
+        :param status: 结束状态，为None时保留当前状态
+        """
+        self.duration = time.perf_counter() - self._started
+        if status is not None:
+            self.status = status
+        self._root._finished.append(self)
+
+    def to_dict(self):
+        """
+        转换为可序列化的字典
+        :return: span字典
+        """
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": self.duration * 1000.0 if self.duration is not None else None,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class SpanExporter:
+    """
+    span导出器接口，链路结束时以整条链路为单位调用export
+    """
+
+    def export(self, spans):
+        """
+        导出一条链路的所有span
+        :param spans: Span列表
+        """
+        raise NotImplementedError
+
+    def shutdown(self):
+        """释放导出器资源"""
+
+
+class InMemorySpanExporter(SpanExporter):
+    """
+    内存导出器，保留最近的span，便于调试和测试
+    """
+
+    def __init__(self, max_spans=DEFAULT_MEMORY_SPANS):
+        """
+        初始化内存导出器
+        :param max_spans: 最多保留的span数
+        """
+        self.max_spans = max_spans
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def get_finished_spans(self):
+        """
+        获取已导出的span
+        :return: Span列表
+        """
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        """清空已导出的span"""
+        with self._lock:
+            self._spans.clear()
+
+    def __getstate__(self):
+        return {"max_spans": self.max_spans}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class JsonlSpanExporter(SpanExporter):
+    """
+    JSONL文件导出器，每个span一行，一条链路一次写入
+    """
+
+    def __init__(self, path):
+        """
+        初始化文件导出器
+        :param path: 输出文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans):
+        data = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class Tracer:
+    """
+    链路追踪器
+    """
+
+    def __init__(self, exporter=None, sample_rate=1.0):
+        """
+        初始化追踪器
+        :param exporter: span导出器，默认为内存导出器
+        :param sample_rate: 链路采样率，0-1之间
+        """
+        self.exporter = exporter if exporter is not None else InMemorySpanExporter()
+        self.sample_rate = sample_rate
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """
+        开始一条新链路
+        :param name: 根span名称
+        :param attributes: 附加属性
+        :return: 根span，未被采样时为None
+        """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            yield None
+            return
+        root = Span(name, attributes=attributes)
+        token = _current_span.set(root)
+        status = None
+        try:
+            yield root
+        except BaseException:
+            status = "ERROR"
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end(status)
+            self.exporter.export(root._finished)
+
+    def shutdown(self):
+        """关闭导出器"""
+        self.exporter.shutdown()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    在当前链路下创建子span，不在链路中时不做任何记录
+    :param name: span名称
+    :param attributes: 附加属性
+    :return: 子span，不在链路中时为None
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent, attributes)
+    token = _current_span.set(child)
+    status = None
+    try:
+        yield child
+    except BaseException:
+        status = "ERROR"
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end(status)
+
+
+def current_span():
+    """
+    获取当前span
+    :return: 当前span，不在链路中时为None
+    """
+    return _current_span.get()
@@ -0,0 +1,77 @@
+"""
+批量评分测试：列式决策与逐条决策的结果一致
+"""
+
+import pytest
+
+from src.batch_scoring import results_to_frame, make_decisions, calculate_risk_scores
+from src.llm_analyzer import LLMAnalyzer
+from src.risk_decision_engine import RiskDecisionEngine
+
+
+def _analysis(score, valid=True, reliability="高"):
+    return {
+        "id_analysis": {"valid": valid, "name_match": True},
+        "income_analysis": {"source_reliability": reliability, "verification_status": "已验证"},
+        "form_analysis": {"coverage_reasonable": True},
+        "overall_risk_score": score
+    }
+
+
+def _fraud(is_fraud=False, indicators=(), confidence=0):
+    return {"is_fraud": is_fraud, "indicators": list(indicators), "confidence": confidence}
+
+
+def _customer(degraded=(), phone_applications=None):
+    features = {"phone_applications_1h": phone_applications} if phone_applications is not None else {}
+    return {"degraded_sources": list(degraded), "velocity": {"features": features}}
+
+
+CASES = [
+    (_analysis(30), _fraud(), _customer()),
+    (_analysis(30.0), _fraud(), _customer()),
+    (_analysis(10), _fraud(), _customer(degraded=["income_proof"])),
+    (_analysis(10.0), _fraud(), _customer(degraded=["income_proof"])),
+    (_analysis(90), _fraud(), _customer()),
+    (_analysis(90.0), _fraud(), _customer()),
+    (_analysis(0), _fraud(True, ["金额超限", "名单命中"], 0.5), _customer()),
+    (_analysis(0), _fraud(), _customer(phone_applications=3)),
+    (_analysis(0), _fraud(), _customer(phone_applications=3.0)),
+    (_analysis(0), _fraud(), _customer(phone_applications=1)),
+]
+
+
+def _scalar_decisions(engine, cases):
+    return [dict(engine.make_decision(analysis, fraud, customer)) for analysis, fraud, customer in cases]
+
+
+@pytest.mark.parametrize("order", [1, -1])
+def test_batch_decisions_match_scalar(order):
+    cases = CASES[::order]
+    engine = RiskDecisionEngine()
+    frame = results_to_frame(*zip(*cases))
+    batch = make_decisions(frame, engine.rule_engine.decision_ladder)
+
+    expected = _scalar_decisions(engine, cases)
+    assert batch["decision"].tolist() == [result["decision"] for result in expected]
+    assert batch["reason"].tolist() == [result["reason"] for result in expected]
+
+
+def test_mixed_int_and_float_scores_keep_their_formatting():
+    engine = RiskDecisionEngine()
+    cases = [CASES[0], CASES[1]]
+    batch = engine.make_decisions_batch(results_to_frame(*zip(*cases)))
+
+    assert batch["reason"].tolist() == ["风险评分较低(30)，符合准入标准", "风险评分较低(30.0)，符合准入标准"]
+
+
+def test_risk_scores_match_scalar():
+    analyzer = LLMAnalyzer({})
+    analyses = [_analysis(None, valid=valid, reliability=reliability)
+                for valid in (True, False) for reliability in ("高", "低")]
+    scores = calculate_risk_scores(results_to_frame(analyses))
+
+    assert scores.tolist() == [
+        analyzer._calculate_overall_risk_score(a["id_analysis"], a["income_analysis"], a["form_analysis"])
+        for a in analyses
+    ]
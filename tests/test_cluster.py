@@ -0,0 +1,39 @@
+"""
+分片集群测试：按客户ID稳定分片，黑名单和速率特征在工作进程间共享
+"""
+
+import os
+
+from src.cluster import WorkerCluster, shard_for, SHARED_STATE_FILE
+from src.shared_state import SharedStateStore, SharedIdentityIndex
+
+
+def test_shard_for_is_stable_and_spreads_customers():
+    customer_ids = [f"CUST{i:04d}" for i in range(200)]
+    shards = [shard_for(customer_id, 4) for customer_id in customer_ids]
+
+    assert shards == [shard_for(customer_id, 4) for customer_id in customer_ids]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_workers_share_blacklist_and_velocity(tmp_path):
+    state_dir = str(tmp_path)
+    store = SharedStateStore(os.path.join(state_dir, SHARED_STATE_FILE))
+    SharedIdentityIndex(store).blacklist([["id_number", "110101199001010001"]])
+    store.close()
+
+    customer_ids = [f"D{i:04d}" for i in range(1, 13)]
+    with WorkerCluster({"system_configs": {}, "model_configs": {}}, num_workers=2, state_dir=state_dir,
+                       threads_per_worker=2) as cluster:
+        records = cluster.batch_process_applications(customer_ids)
+        metrics = cluster.get_system_metrics()
+
+    assert {shard_for(customer_id, 2) for customer_id in customer_ids} == {0, 1}
+    assert [record["customer_id"] for record in records] == customer_ids
+    # 父进程写入的黑名单对处理D0001的工作进程可见
+    assert records[0]["customer_data"]["identity_graph"]["blacklist_hits"] == ["id_number"]
+    assert records[0]["decision_result"]["decision"] == "REJECT"
+    # 同一地区的申请落在两个进程中，速率特征按全部申请统计
+    counts = [record["customer_data"]["velocity"]["features"]["region_applications_1h"] for record in records]
+    assert max(counts) == len(customer_ids)
+    assert metrics["total_processed"] == len(customer_ids)
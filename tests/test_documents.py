@@ -0,0 +1,45 @@
+"""
+文档落盘测试：客户处理结束后删除落盘的文档和送模型图像，系统关闭时删除落盘目录
+"""
+
+import os
+
+from src import documents
+from src.documents import document_dir
+from src.fraud_detection_system import IntelligentFraudDetectionSystem
+from src.image_preprocess import ImagePreprocessor, _source_prefix
+
+
+def _with_attachments(collector):
+    def _collect(customer_id):
+        return {**collector(customer_id), "attachments": [b"scan-1", b"scan-2"]}
+    return _collect
+
+
+def test_documents_are_removed_after_processing_and_on_close():
+    system = IntelligentFraudDetectionSystem({}, {})
+    collectors = system.rpa_collector.collectors
+    collectors["application_form"] = _with_attachments(collectors["application_form"])
+    try:
+        record = system.process_customer_application("CUST001")
+        directory = document_dir()
+        attachments = record["customer_data"]["application_form"]["attachments"]
+        assert [os.path.dirname(path) for path in attachments] == [directory, directory]
+        assert not any(os.path.exists(path) for path in attachments)
+    finally:
+        system.close()
+
+    assert not os.path.exists(directory)
+    assert documents._document_dir is None
+
+
+def test_discard_removes_prepared_images_of_one_source(tmp_path):
+    preprocessor = ImagePreprocessor(output_dir=str(tmp_path))
+    source, other = str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")
+    for name in (f"{_source_prefix(source)}-1.jpg", f"{_source_prefix(source)}-2.jpg",
+                 f"{_source_prefix(other)}-1.jpg"):
+        (tmp_path / name).write_bytes(b"jpeg")
+
+    preprocessor.discard(source)
+
+    assert os.listdir(tmp_path) == [f"{_source_prefix(other)}-1.jpg"]
@@ -0,0 +1,48 @@
+"""
+速率特征测试：理赔计数只计窗口内的理赔，地区聚合特征只转人工复核、不判定欺诈
+"""
+
+from datetime import datetime
+
+from src.feature_store import velocity_amounts
+from src.fraud_detection_system import IntelligentFraudDetectionSystem
+from src.rule_engine import RuleEngine
+
+
+def _customer(*dates):
+    return {"history_records": [{"claim_history": [{"date": date, "amount": 5000} for date in dates]}]}
+
+
+def test_velocity_amounts_counts_only_claims_inside_window():
+    now = datetime(2024, 1, 16, 12).timestamp()
+    customer_data = _customer("2024-01-16T08:00:00", "2024-01-15", "2023-06-01", "不是日期")
+
+    assert velocity_amounts(customer_data, 24 * 3600, now) == {"applications": 1, "claims": 1}
+    assert velocity_amounts(customer_data, 7 * 24 * 3600, now) == {"applications": 1, "claims": 2}
+    assert velocity_amounts(customer_data, None, now) == {"applications": 1, "claims": 0}
+
+
+def test_region_spike_is_review_not_fraud():
+    engine = RuleEngine()
+    features = {"region_applications_1h": 500, "region_claims_24h": 500}
+
+    fraud_result = engine.evaluate_fraud({"velocity": {"features": features}})
+    decision, reason = engine.decision_ladder.decide({
+        **features, "risk_score": 0, "is_fraud": False, "indicators": "", "confidence": 0})
+
+    assert not any("地区" in indicator for indicator in fraud_result["indicators"])
+    assert decision == "REVIEW"
+    assert "地区" in reason
+
+
+def test_customers_in_one_district_are_not_rejected():
+    system = IntelligentFraudDetectionSystem({}, {})
+    try:
+        results = system.batch_process_applications([f"CUST{i:03d}" for i in range(60)])
+    finally:
+        system.close()
+
+    assert len(results) == 60
+    assert {result["customer_data"]["velocity"]["entities"]["region"] for result in results} == {"110101"}
+    assert all(result["decision_result"]["decision"] != "REJECT" for result in results)
+    assert system.identity_index.get_stats()["blacklisted"] == 0
@@ -0,0 +1,78 @@
+"""
+反馈队列测试：批量发送、接收端不可用时落盘、恢复后按顺序补发、回收崩溃进程认领的落盘文件
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from src.feedback_queue import FeedbackQueue, FeedbackSink, InMemoryFeedbackSink, JsonlFeedbackSink, SPILL_PREFIX
+
+
+class FlakySink(FeedbackSink):
+    """可切换是否可用的接收端"""
+
+    def __init__(self):
+        self.available = False
+        self.events = []
+
+    def send(self, events):
+        if not self.available:
+            raise ConnectionError("接收端不可用")
+        self.events.extend(events)
+
+
+def test_events_are_sent_in_batches(tmp_path):
+    queue = FeedbackQueue(JsonlFeedbackSink(str(tmp_path)), max_batch_size=10, flush_interval=0.05)
+    for i in range(25):
+        queue.put({"i": i})
+    assert queue.flush(5)
+    stats = queue.get_stats()
+    queue.close()
+
+    lines = [json.loads(line) for name in sorted(os.listdir(tmp_path)) for line in open(tmp_path / name)]
+    assert [line["i"] for line in lines] == list(range(25))
+    assert stats["sent"] == 25
+    assert stats["batches"] >= 3
+
+
+def test_spilled_batches_are_replayed_in_order(tmp_path):
+    sink = FlakySink()
+    queue = FeedbackQueue(sink, max_batch_size=5, flush_interval=0.02, max_retries=1, retry_backoff=0.01,
+                          spill_dir=str(tmp_path), recovery_interval=0.2)
+    for i in range(20):
+        queue.put({"i": i})
+    queue.flush(5)
+    assert queue.get_stats()["spilled"] == 20
+    assert os.listdir(tmp_path)
+
+    sink.available = True
+    time.sleep(0.3)
+    queue.put({"i": 20})
+    queue.flush(5)
+    queue.close()
+
+    assert [event["i"] for event in sink.events] == list(range(21))
+    assert queue.get_stats()["replayed"] == 20
+    assert not os.listdir(tmp_path)
+
+
+def test_claims_of_exited_processes_are_recovered(tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    claimed = tmp_path / f"{SPILL_PREFIX}-1-{exited.pid}-0.jsonl.{exited.pid}.replaying"
+    claimed.write_text(json.dumps({"i": 0}) + "\n", encoding="utf-8")
+    running = tmp_path / f"{SPILL_PREFIX}-2-{os.getpid()}-0.jsonl.{os.getpid()}.replaying"
+    running.write_text(json.dumps({"i": 1}) + "\n", encoding="utf-8")
+
+    sink = InMemoryFeedbackSink()
+    queue = FeedbackQueue(sink, flush_interval=0.02, spill_dir=str(tmp_path))
+    queue.put({"i": 2})
+    queue.flush(5)
+    queue.close()
+
+    # 已退出进程认领的文件被回收补发，仍在运行的进程认领的文件保持不动
+    assert sorted(event["i"] for event in sink.get_events()) == [0, 2]
+    assert os.listdir(tmp_path) == [running.name]
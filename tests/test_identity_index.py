@@ -0,0 +1,68 @@
+"""
+身份标识索引测试：黑名单与团伙查询、快照加操作日志重建、写入中断的日志行
+"""
+
+import os
+
+from src.identity_index import IdentityIndex, extract_identifiers, JOURNAL_FILE, SNAPSHOT_FILE
+
+RING = [
+    ("C0001", [["phone", "13800000001"], ["id_number", "110101199001010001"]]),
+    ("C0002", [["phone", "13800000001"], ["id_number", "110101199001010002"]]),
+    ("C0003", [["phone", "13800000003"], ["id_number", "110101199001010002"]]),
+]
+
+
+def _build(index):
+    for customer_id, identifiers in RING:
+        index.observe(customer_id, identifiers)
+    index.blacklist([["id_number", "110101199001010001"]])
+
+
+def test_blacklist_and_ring_lookups():
+    index = IdentityIndex()
+    _build(index)
+
+    # C0003与C0001没有直接共用的标识，通过C0002间接关联到同一团伙
+    result = index.check([["phone", "13800000003"]], "C0003")
+    assert result["ring_customers"] == 3
+    assert result["ring_blacklisted"]
+    assert result["blacklist_hits"] == []
+
+    hit = index.check([["id_number", "110101199001010001"]])
+    assert hit["blacklist_hits"] == ["id_number"]
+    assert index.is_blacklisted("id_number", "110101199001010001")
+    assert not index.check([["phone", "13900000000"]])["ring_blacklisted"]
+    assert index.get_stats()["customers"] == 3
+
+
+def test_rebuild_from_snapshot_and_journal(tmp_path):
+    index = IdentityIndex(str(tmp_path), snapshot_every=3)
+    _build(index)
+    # 第3条操作后写入快照，之后的黑名单操作只在日志中
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+    assert sum(1 for _ in open(tmp_path / JOURNAL_FILE, encoding="utf-8")) == 1
+
+    # 未调用close（进程崩溃）时从快照和日志重建
+    restored = IdentityIndex(str(tmp_path))
+    assert restored.check([["phone", "13800000003"]], "C0003")["ring_customers"] == 3
+    assert restored.is_blacklisted("id_number", "110101199001010001")
+    assert restored.get_stats() == index.get_stats()
+    restored.close()
+
+
+def test_truncated_journal_line_is_ignored(tmp_path):
+    index = IdentityIndex(str(tmp_path))
+    _build(index)
+    with open(tmp_path / JOURNAL_FILE, "a", encoding="utf-8") as journal:
+        journal.write('["blacklist", [')
+
+    restored = IdentityIndex(str(tmp_path))
+    assert restored.is_blacklisted("id_number", "110101199001010001")
+    assert restored.get_stats()["customers"] == 3
+    restored.close()
+
+
+def test_extract_identifiers_normalizes_and_skips_masked_phone():
+    customer_data = {"phone_info": {"phone_number": "138****0001", "real_name": " 张三 "}}
+    assert extract_identifiers(customer_data) == [["name", "张三"]]
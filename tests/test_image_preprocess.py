@@ -0,0 +1,49 @@
+"""
+图像预处理测试：已解码图像的缓存按字节数限制
+"""
+
+from collections import OrderedDict
+
+import pytest
+
+from src import image_preprocess
+
+
+class FakeImage:
+    """只提供尺寸和通道信息的图像"""
+
+    def __init__(self, width, height, bands=("R", "G", "B")):
+        self.width = width
+        self.height = height
+        self.bands = bands
+
+    def getbands(self):
+        return self.bands
+
+
+@pytest.fixture(autouse=True)
+def small_cache(monkeypatch):
+    monkeypatch.setattr(image_preprocess, "DECODED_CACHE_MAX_BYTES", 1000)
+    monkeypatch.setattr(image_preprocess, "_decoded_cache", OrderedDict())
+    monkeypatch.setattr(image_preprocess, "_decoded_bytes", 0)
+
+
+def test_cache_evicts_least_recently_used_by_bytes():
+    images = {key: FakeImage(10, 10) for key in "abcd"}
+    for key in "abc":
+        image_preprocess._cached(key, lambda key=key: images[key])
+    # 再次访问a后缓存d，超出1000字节时淘汰最久未使用的b
+    assert image_preprocess._cached("a", lambda: pytest.fail("不应重新解码")) is images["a"]
+    image_preprocess._cached("d", lambda: images["d"])
+
+    assert list(image_preprocess._decoded_cache) == ["c", "a", "d"]
+    assert image_preprocess._decoded_bytes == 900
+
+
+def test_image_larger_than_cache_is_not_cached():
+    oversized = FakeImage(40, 40)
+    image_preprocess._cached("page", lambda: FakeImage(10, 10))
+
+    assert image_preprocess._cached("oversized", lambda: oversized) is oversized
+    assert list(image_preprocess._decoded_cache) == ["page"]
+    assert image_preprocess._decoded_bytes == 300
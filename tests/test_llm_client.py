@@ -0,0 +1,150 @@
+"""
+模型客户端测试：对模拟模型服务验证重试、熔断和回退本地评分
+"""
+
+import json
+import urllib.error
+
+import pytest
+
+from src.cluster import split_quotas
+from src.llm_analyzer import LLMAnalyzer, DEGRADED_SOURCE_MODEL
+from src.llm_client import ModelClient, CircuitBreaker, estimate_tokens, CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN
+from src.mock_model_server import MockModelServer
+
+REQUEST = ("fraud_detection", {"customer_id": "C1"})
+
+
+@pytest.fixture
+def server():
+    with MockModelServer(seed=1) as srv:
+        yield srv
+
+
+def _client(srv, **kwargs):
+    return ModelClient(srv.url, **{"retry_backoff": 0.01, "max_backoff": 0.05, **kwargs})
+
+
+def test_retries_retryable_status_until_success(server):
+    client = _client(server, max_retries=3)
+    server.inject_errors(2, 503)
+
+    output = client.call_batch([REQUEST])[0]
+
+    assert output == LLMAnalyzer({})._run_task(*REQUEST)
+    stats = client.get_stats()
+    assert stats["retries"] == 2
+    assert stats["requests"] == 3
+    assert stats["circuit_state"] == CIRCUIT_CLOSED
+
+
+def test_gives_up_after_max_retries(server):
+    client = _client(server, max_retries=2)
+    server.inject_errors(5, 503)
+
+    with pytest.raises(urllib.error.HTTPError):
+        client.call_batch([REQUEST])
+    assert client.get_stats()["requests"] == 3
+
+
+def test_client_errors_are_not_retried(server):
+    client = _client(server, max_retries=3)
+    server.inject_errors(1, 400)
+
+    with pytest.raises(urllib.error.HTTPError):
+        client.call_batch([REQUEST])
+    assert client.get_stats()["requests"] == 1
+    assert client.breaker.state == CIRCUIT_CLOSED
+
+
+def test_only_network_errors_are_retryable(server):
+    client = _client(server)
+
+    assert client._retry_after(urllib.error.URLError("connection refused")) == 0.0
+    assert client._retry_after(TimeoutError()) == 0.0
+    assert client._retry_after(ConnectionResetError()) == 0.0
+    assert client._retry_after(json.JSONDecodeError("bad", "", 0)) is None
+    assert client._retry_after(KeyError("responses")) is None
+
+
+def test_malformed_response_is_not_retried(server):
+    client = _client(server, max_retries=3)
+    client._post = lambda body: {"unexpected": True}
+
+    with pytest.raises(KeyError):
+        client.call_batch([REQUEST])
+    assert client.get_stats()["retries"] == 0
+
+
+def test_breaker_opens_and_short_circuits(server):
+    client = _client(server, max_retries=0, failure_threshold=2, recovery_timeout=60)
+    server.set_down(True)
+
+    for _ in range(2):
+        with pytest.raises(urllib.error.HTTPError):
+            client.call_batch([REQUEST])
+    assert client.breaker.state == CIRCUIT_OPEN
+
+    requests = server.stats["http_requests"]
+    with pytest.raises(RuntimeError):
+        client.call_batch([REQUEST])
+    assert server.stats["http_requests"] == requests
+    assert client.get_stats()["short_circuited"] == 1
+
+
+def test_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] = 10
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.opens == 2
+
+
+def test_analyzer_falls_back_to_local_scoring(server):
+    analyzer = LLMAnalyzer({"endpoint": server.url,
+                            "client": {"max_retries": 1, "retry_backoff": 0.01, "failure_threshold": 2}})
+    server.set_down(True)
+    data = {"customer_id": "C1", "degraded_sources": []}
+    try:
+        result = analyzer.detect_fraud_patterns(data)
+    finally:
+        analyzer.close()
+
+    assert dict(result) == analyzer._run_fraud_detection(data)
+    assert data["degraded_sources"] == [DEGRADED_SOURCE_MODEL]
+    assert analyzer.client.get_stats()["fallbacks"] == 1
+
+
+def test_image_tokens_use_configured_vision_budget(server):
+    analyzer = LLMAnalyzer({"endpoint": server.url, "image_preprocessing": {"vision_max_tokens": 255}})
+    analyzer.close()
+    requests = [{"task": "income_verification", "data": {},
+                 "content": [{"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AAAA"}}] * 2}]
+    body = json.dumps({"requests": requests}).encode("utf-8")
+
+    assert analyzer.client.vision_max_tokens == 255
+    assert estimate_tokens(body, requests, 255) - estimate_tokens(body, requests, 0) == 2 * 255
+
+
+def test_cluster_splits_rate_limits_across_workers():
+    system_kwargs = {"model_configs": {"endpoint": "http://model",
+                                       "client": {"requests_per_minute": 600, "tokens_per_minute": 90000,
+                                                  "max_retries": 2}}}
+
+    client = split_quotas(system_kwargs, 4)["model_configs"]["client"]
+
+    assert client == {"requests_per_minute": 150, "tokens_per_minute": 22500, "max_retries": 2}
+    assert system_kwargs["model_configs"]["client"]["requests_per_minute"] == 600
+    assert split_quotas({"model_configs": {}}, 4) == {"model_configs": {}}
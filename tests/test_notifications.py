@@ -0,0 +1,95 @@
+"""
+通知分发测试：同类型通知合并为摘要、按渠道路由、限流推迟只计一次、发送失败后合并重发
+"""
+
+import time
+
+from src.notifications import NotificationDispatcher, NotificationChannel, InMemoryNotificationChannel
+
+
+class FlakyChannel(InMemoryNotificationChannel):
+    """第一次发送失败的渠道"""
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    def send(self, digest):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("渠道不可用")
+        super().send(digest)
+
+
+def test_notifications_are_coalesced_into_digests():
+    channel = InMemoryNotificationChannel()
+    dispatcher = NotificationDispatcher({"memory": channel}, digest_interval=60, max_digest_items=3)
+    for i in range(5):
+        dispatcher.notify(f"C{i}", "需要人工复核", "review")
+    dispatcher.notify("C9", "已拒绝", "reject")
+    dispatcher.close()
+
+    review, = channel.get_digests("review")
+    assert review["count"] == 5
+    assert [item["customer_id"] for item in review["items"]] == ["C0", "C1", "C2"]
+    assert review["truncated"] == 2
+    assert channel.get_digests("reject")[0]["count"] == 1
+    stats = dispatcher.get_stats()
+    assert stats["digests"] == 2
+    assert stats["coalescing_ratio"] == 3.0
+
+
+def test_routes_limit_types_to_channels():
+    ops, risk = InMemoryNotificationChannel(), InMemoryNotificationChannel()
+    dispatcher = NotificationDispatcher({"ops": ops, "risk": risk}, routes={"fraud_alert": ["risk"]},
+                                        digest_interval=60)
+    dispatcher.notify("C1", "欺诈预警", "fraud_alert")
+    dispatcher.notify("C2", "需要人工复核", "review")
+    dispatcher.close()
+
+    assert [digest["type"] for digest in risk.get_digests()] == ["fraud_alert", "review"]
+    assert [digest["type"] for digest in ops.get_digests()] == ["review"]
+
+
+def test_rate_limited_digest_keeps_coalescing_and_is_counted_once():
+    channel = InMemoryNotificationChannel()
+    dispatcher = NotificationDispatcher({"memory": channel}, digest_interval=0, rate_limits={"review": 1})
+    dispatcher.notify("C0", "需要人工复核", "review")
+    time.sleep(0.1)
+    for i in range(1, 4):
+        dispatcher.notify(f"C{i}", "需要人工复核", "review")
+        time.sleep(0.05)
+
+    # 每分钟1条的配额已用完，之后的通知合并在同一条待发送摘要中
+    assert len(channel.get_digests()) == 1
+    stats = dispatcher.get_stats()
+    assert stats["rate_limited"] == 1
+    assert stats["pending_notifications"] == 3
+
+    dispatcher.close()
+    assert [digest["count"] for digest in channel.get_digests()] == [1, 3]
+
+
+def test_failed_digest_is_merged_and_resent():
+    channel = FlakyChannel()
+    dispatcher = NotificationDispatcher({"flaky": channel}, digest_interval=60)
+    dispatcher.notify("C1", "需要人工复核", "review")
+    dispatcher.flush()
+    dispatcher.notify("C2", "需要人工复核", "review")
+    dispatcher.close()
+
+    digest, = channel.get_digests()
+    assert [item["customer_id"] for item in digest["items"]] == ["C1", "C2"]
+    assert dispatcher.get_stats()["failed"] == 1
+
+
+def test_dispatcher_restarts_after_close():
+    channel = InMemoryNotificationChannel()
+    dispatcher = NotificationDispatcher({"memory": channel}, digest_interval=0)
+    dispatcher.notify("C1", "需要人工复核", "review")
+    dispatcher.close()
+    dispatcher.notify("C2", "需要人工复核", "review")
+    time.sleep(0.1)
+
+    assert [digest["items"][0]["customer_id"] for digest in channel.get_digests()] == ["C1", "C2"]
+    dispatcher.close()
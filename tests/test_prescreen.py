@@ -0,0 +1,34 @@
+"""
+规则预筛测试：开启预筛时黑名单仍按身份证号查询，没有查询过强标识时不直接批准
+"""
+
+import pytest
+
+from src.fraud_detection_system import IntelligentFraudDetectionSystem
+
+
+@pytest.fixture
+def system():
+    system = IntelligentFraudDetectionSystem({}, {}, prescreen={})
+    yield system
+    system.close()
+
+
+def test_blacklisted_id_number_is_rejected_with_prescreen(system):
+    system.identity_index.blacklist([["id_number", "110101199001010001"]])
+
+    record = system.process_customer_application("D0001")
+
+    assert record["customer_data"]["identity_graph"]["blacklist_hits"] == ["id_number"]
+    assert record["decision_result"]["decision"] == "REJECT"
+
+
+def test_prescreen_does_not_approve_without_id_number(system):
+    record = system.process_customer_application("D0002")
+    assert record["tier"] == "prescreen"
+    assert record["decision_result"]["decision"] == "APPROVE"
+
+    customer_data = record["customer_data"]
+    customer_data["identity_graph"] = {**customer_data["identity_graph"], "identifiers": [["name", "客户D0002"]]}
+
+    assert system.prescreener.screen(customer_data) is None
@@ -0,0 +1,52 @@
+"""
+进程执行器测试：系统实例在每个子进程中只构建一次，任务只传客户ID
+"""
+
+import asyncio
+import gc
+import os
+import time
+
+import pytest
+
+from src.async_utils import run_sync
+from src.feedback_queue import FeedbackQueue, JsonlFeedbackSink
+from src.fraud_detection_system import IntelligentFraudDetectionSystem
+from src.shared_state import SharedStateStore, SharedIdentityIndex, SharedFeatureStore
+
+
+def test_process_pool_builds_system_once_per_worker(tmp_path):
+    store = SharedStateStore(str(tmp_path / "shared_state.sqlite"))
+    lake = tmp_path / "lake"
+    system = IntelligentFraudDetectionSystem(
+        {}, {}, feedback_queue=FeedbackQueue(JsonlFeedbackSink(str(lake)), flush_interval=0.05),
+        identity_index=SharedIdentityIndex(store), feature_store=SharedFeatureStore(store))
+    try:
+        records = system.batch_process_applications([f"CUST{i:03d}" for i in range(30)],
+                                                    max_workers=3, executor_type="process")
+    finally:
+        system.close()
+        store.close()
+
+    assert [record["customer_id"] for record in records] == [f"CUST{i:03d}" for i in range(30)]
+    assert all(record["decision_result"]["decision"] != "ERROR" for record in records)
+    # 每个子进程各写一个反馈分段，子进程退出前发送完全部事件
+    segments = os.listdir(lake)
+    assert len(segments) <= 3
+    assert sum(1 for name in segments for _ in open(lake / name, encoding="utf-8")) == 30
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="需要fork")
+def test_forked_child_does_not_close_parent_event_loop():
+    run_sync(asyncio.sleep(0))
+    pid = os.fork()
+    if pid == 0:
+        # 子进程回收继承的事件循环时不能注销父进程事件循环在共享epoll中的唤醒管道
+        gc.collect()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    # 唤醒丢失时线程中的调用完成后事件循环仍阻塞，直到wait_for的定时器到期
+    started = time.monotonic()
+    assert run_sync(asyncio.wait_for(asyncio.to_thread(time.sleep, 0.1), 5)) is None
+    assert time.monotonic() - started < 1
@@ -0,0 +1,107 @@
+"""
+RPA会话池测试：会话复用、过期重登录、超时的登录和检查不放回池中
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.rpa_collector import RPADataCollector
+from src.session_pool import SessionPool
+
+
+def _pool(login=None, **kwargs):
+    logins = []
+
+    def _login(system_name):
+        logins.append(system_name)
+        return login(system_name) if login is not None else True
+
+    return SessionPool({}, _login, **kwargs), logins
+
+
+def test_session_is_reused_until_expired():
+    pool, logins = _pool(session_ttl=0.05)
+
+    with pool.session("crm_system") as first:
+        pass
+    with pool.session("crm_system") as second:
+        pass
+    assert second is first
+    assert logins == ["crm_system"]
+
+    time.sleep(0.06)
+    with pool.session("crm_system") as third:
+        pass
+    assert third is not first
+    assert logins == ["crm_system", "crm_system"]
+    assert pool.get_stats()["relogins"] == 1
+    assert pool.get_stats()["open_sessions"] == {"crm_system": 1}
+
+
+def test_acquire_waits_for_released_session_at_limit():
+    pool, _ = _pool(max_sessions=1)
+    session = pool.acquire("crm_system")
+
+    with pytest.raises(TimeoutError):
+        pool.acquire("crm_system", timeout=0.05)
+
+    threading.Timer(0.05, pool.release, (session,)).start()
+    assert pool.acquire("crm_system", timeout=1) is session
+
+
+def test_cancelled_session_is_dropped():
+    pool, _ = _pool()
+
+    async def _use():
+        async with pool.asession("crm_system"):
+            await asyncio.sleep(1)
+
+    async def _main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(_use(), 0.05)
+
+    asyncio.run(_main())
+    stats = pool.get_stats()
+    assert stats["open_sessions"] == {"crm_system": 0}
+    assert stats["idle_sessions"] == {"crm_system": 0}
+
+
+def test_login_finishing_after_timeout_is_dropped():
+    release = threading.Event()
+    pool, _ = _pool(login=lambda system_name: release.wait(1))
+
+    async def _main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.aacquire("crm_system"), 0.05)
+        release.set()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(_main())
+    stats = pool.get_stats()
+    assert stats["logins"] == 1
+    assert stats["open_sessions"] == {"crm_system": 0}
+    assert stats["idle_sessions"] == {"crm_system": 0}
+
+
+def test_health_check_drops_timed_out_sessions():
+    release = threading.Event()
+    pool = SessionPool({}, lambda system_name: True, health_check_func=lambda session: release.wait(1),
+                       check_timeout=0.05)
+    pool.release(pool.acquire("crm_system"))
+
+    assert pool.health_check() == {"crm_system": 0}
+    release.set()
+    assert pool.get_stats()["evicted"] == 1
+    assert pool.get_stats()["open_sessions"] == {"crm_system": 0}
+
+
+def test_collector_runs_keepalive_until_closed():
+    collector = RPADataCollector({})
+    thread = collector.session_pool._keepalive_thread
+    assert thread is not None and thread.is_alive()
+
+    collector.session_pool.close()
+    assert not thread.is_alive()
@@ -0,0 +1,74 @@
+"""
+共享状态测试：身份标识索引的快照与操作重放、速率事件的共享与定期清理
+"""
+
+import time
+
+import pytest
+
+from src.shared_state import (SharedStateStore, SharedIdentityIndex, SharedFeatureStore, CHANNEL_IDENTITY,
+                              CHANNEL_VELOCITY)
+
+PHONE = [["phone", "13800000001"]]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "shared_state.sqlite")
+
+
+def test_blacklist_and_ring_are_visible_to_other_processes(path):
+    writer_store, reader_store = SharedStateStore(path), SharedStateStore(path)
+    writer, reader = SharedIdentityIndex(writer_store), SharedIdentityIndex(reader_store)
+
+    writer.observe("C0001", PHONE + [["id_number", "110101199001010001"]])
+    writer.blacklist([["id_number", "110101199001010001"]])
+    result = reader.observe("C0002", PHONE)
+
+    assert result["ring_customers"] == 2
+    assert result["ring_blacklisted"]
+    assert reader.is_blacklisted("id_number", "110101199001010001")
+    writer_store.close()
+    reader_store.close()
+
+
+def test_snapshot_compacts_events_and_new_process_rebuilds(path):
+    store = SharedStateStore(path)
+    index = SharedIdentityIndex(store, snapshot_every=3)
+    for i in range(5):
+        index.observe(f"C{i:04d}", PHONE)
+    index.blacklist(PHONE)
+
+    # 第3条操作后写入快照，之后的操作仍在事件表中
+    assert store.get_stats()["snapshots"][CHANNEL_IDENTITY] == 3
+    assert store.get_stats()["events"][CHANNEL_IDENTITY] == 3
+
+    restored = SharedIdentityIndex(SharedStateStore(path))
+    result = restored.check(PHONE, "C0004")
+    assert result["ring_customers"] == 5
+    assert result["blacklist_hits"] == ["phone"]
+    store.close()
+
+
+def test_velocity_events_are_shared_between_stores(path):
+    first, second = SharedFeatureStore(SharedStateStore(path)), SharedFeatureStore(SharedStateStore(path))
+
+    first.observe({"phone": "13800000001"})
+    result = second.observe({"phone": "13800000001"})
+
+    assert result["features"]["phone_applications_1h"] == 2
+    assert first.query({"phone": "13800000001"})["phone_applications_1h"] == 2
+
+
+def test_expired_velocity_events_are_purged_every_n_writes(path):
+    store = SharedStateStore(path)
+    features = [{"name": "phone_applications_1s", "entity": "phone", "window": 1}]
+    feature_store = SharedFeatureStore(store, features=features, resolution=1, purge_every=2)
+
+    feature_store.observe({"phone": "13800000001"})
+    time.sleep(1.1)
+    feature_store.observe({"phone": "13800000002"})
+
+    # 第2次写入时清理了超出窗口的第1条事件
+    assert store.get_stats()["events"][CHANNEL_VELOCITY] == 1
+    store.close()
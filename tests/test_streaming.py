@@ -0,0 +1,94 @@
+"""
+流式处理测试：按检查点从中断处继续，已提交的记录不重复处理，未写入的记录不丢失
+"""
+
+import json
+
+import pytest
+
+from src.fraud_detection_system import IntelligentFraudDetectionSystem
+from src.streaming import JsonlSink, JsonlSource, FileCheckpoint
+
+CUSTOMER_IDS = [f"CUST{i:03d}" for i in range(10)]
+
+
+class FailingSink(JsonlSink):
+    """写入指定条数后失败的输出端，模拟处理中途中断"""
+
+    def __init__(self, path, fail_after):
+        super().__init__(path, fields=["customer_id"])
+        self.remaining = fail_after
+
+    def write(self, record):
+        if self.remaining == 0:
+            raise OSError("磁盘已满")
+        self.remaining -= 1
+        super().write(record)
+
+
+@pytest.fixture
+def system():
+    system = IntelligentFraudDetectionSystem({}, {})
+    yield system
+    system.close()
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "applications.jsonl"
+    path.write_text("".join(json.dumps({"customer_id": customer_id}) + "\n" for customer_id in CUSTOMER_IDS),
+                    encoding="utf-8")
+    return JsonlSource(str(path))
+
+
+def _written(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["customer_id"] for line in f]
+
+
+def test_resume_after_consumer_stops(system, source, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    checkpoint = FileCheckpoint(str(tmp_path / "checkpoint.json"))
+
+    sink = JsonlSink(output, fields=["customer_id"])
+    stream = system.stream_process_applications(source, sink, checkpoint, checkpoint_every=3)
+    first = [next(stream)["customer_id"] for _ in range(4)]
+    stream.close()
+    sink.close()
+
+    sink = JsonlSink(output, fields=["customer_id"])
+    assert system.run_stream(source, sink, checkpoint, checkpoint_every=3) == 6
+    sink.close()
+
+    assert first == CUSTOMER_IDS[:4]
+    assert _written(output) == CUSTOMER_IDS
+
+
+def test_resume_after_sink_failure_does_not_lose_records(system, source, tmp_path):
+    output = str(tmp_path / "results.jsonl")
+    checkpoint = FileCheckpoint(str(tmp_path / "checkpoint.json"))
+
+    sink = FailingSink(output, fail_after=4)
+    with pytest.raises(OSError):
+        system.run_stream(source, sink, checkpoint, checkpoint_every=3)
+    sink.close()
+    assert json.load(open(checkpoint.path, encoding="utf-8"))["processed"] == 4
+
+    sink = JsonlSink(output, fields=["customer_id"])
+    system.run_stream(source, sink, checkpoint, checkpoint_every=3)
+    sink.close()
+
+    assert _written(output) == CUSTOMER_IDS
+
+
+def test_truncated_last_line_is_read_after_it_is_completed(tmp_path):
+    path = tmp_path / "applications.jsonl"
+    path.write_text('"CUST001"\n"CUST0', encoding="utf-8")
+    source = JsonlSource(str(path))
+
+    read = list(source.iter_from(0))
+    assert [customer_id for _, customer_id in read] == ["CUST001"]
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('02"\n')
+    assert [customer_id for _, customer_id in source.iter_from(read[-1][0])] == ["CUST002"]